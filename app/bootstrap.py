@@ -0,0 +1,190 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, Iterable
+
+from app.config import READINESS_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_completed: Dict[str, float] = {}   # шаг -> время выполнения (с)
+_errors: Dict[str, str] = {}
+_results: Dict[str, object] = {}
+
+
+# ---------- Шаги инициализации ----------
+def _load_embedding_model():
+    from app.rag.embedding_model import get_embedding_model
+    return get_embedding_model().load()
+
+
+def _load_ner():
+    from app.rag.NER import init_ner
+    return init_ner()
+
+
+def _load_vectorstore():
+    from app.rag.retriever import get_vectorstore
+    return get_vectorstore()
+
+
+def _create_llm_clients():
+    from app.rag.llm import get_llm
+    get_llm("decomposer")
+    get_llm("agent")
+    return get_llm("answer")
+
+
+def _refresh_llm_token():
+    from app.rag.llm_clients import get_client_registry
+    get_client_registry().start_token_refresh()
+
+
+def _connect_neo4j():
+    from app.graph.node import get_driver
+    driver = get_driver()
+    driver.verify_connectivity()
+    return driver
+
+
+def _load_lexical_index():
+    from app.config import LEXICAL_MODE
+    from app.rag.lexical import get_lexical_index
+    if LEXICAL_MODE != "off":
+        return get_lexical_index().load_titles()
+
+
+def _load_title_index():
+    from app.rag.title_index import get_title_index
+    return get_title_index().load()
+
+
+def _warmup_cpu_pool():
+    from app.rag.cpu_pool import cpu_pool
+    cpu_pool.warmup()
+
+
+# Независимые ресурсы — грузятся параллельно
+PARALLEL_STEPS = {
+    "embedding_model": _load_embedding_model,
+    "ner": _load_ner,
+    "vectorstore": _load_vectorstore,
+    "llm": _create_llm_clients,
+    "llm_token": _refresh_llm_token,
+    "neo4j": _connect_neo4j,
+    "lexical": _load_lexical_index,
+    "title_index": _load_title_index,
+    "cpu_pool": _warmup_cpu_pool,
+}
+
+
+def _run_step(name: str, func):
+    started = time.time()
+    try:
+        result = func()
+    except Exception as e:
+        with _lock:
+            _errors[name] = str(e)
+        logger.error(f"[bootstrap] {name} failed after {time.time() - started:.2f}s: {e}")
+        return
+    elapsed = time.time() - started
+    with _lock:
+        _completed[name] = elapsed
+        _results[name] = result
+        _errors.pop(name, None)
+    logger.info(f"[bootstrap] {name} ready in {elapsed:.2f}s")
+
+
+def bootstrap(skip: Iterable[str] = ()) -> Dict[str, float]:
+    """
+    Явная инициализация приложения: независимые ресурсы загружаются параллельно,
+    затем собирается RAG-цепочка. Повторный вызов выполняет только не завершившиеся шаги.
+    Векторный индекс только загружается — построение выполняется офлайн.
+    Возвращает разбивку времени старта по ресурсам.
+    """
+    started = time.time()
+    pending = {
+        name: func for name, func in PARALLEL_STEPS.items()
+        if name not in _completed and name not in skip
+    }
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="bootstrap") as executor:
+            for name, func in pending.items():
+                executor.submit(_run_step, name, func)
+
+    if "rag_chain" not in _completed and "vectorstore" in _completed and "llm" in _completed:
+        from app.rag.rag_service import init_rag
+        _run_step("rag_chain", lambda: init_rag(_results["llm"]))
+
+    timings = dict(_completed)
+    logger.info(
+        f"[bootstrap] finished in {time.time() - started:.2f}s: "
+        + ", ".join(f"{name}={t:.2f}s" for name, t in sorted(timings.items(), key=lambda x: -x[1]))
+    )
+    if _errors:
+        logger.warning(f"[bootstrap] failed steps: {_errors}")
+    return timings
+
+
+def check_ready() -> Tuple[bool, Dict[str, str]]:
+    """Проверка готовности: индекс не пуст, модели загружены, Neo4j доступен, цепочка собрана."""
+    checks = {}
+
+    def check(name: str, func):
+        try:
+            checks[name] = func() or "ok"
+        except Exception as e:
+            checks[name] = f"error: {e}"
+
+    def vectorstore_check():
+        from app.rag.retriever import get_vectorstore, count_vectors
+        count = count_vectors(get_vectorstore())
+        if not count:
+            raise RuntimeError("vector index is empty")
+        return f"ok ({count} vectors)"
+
+    def embedding_check():
+        from app.rag.embedding_model import get_embedding_model
+        if get_embedding_model().model is None:
+            raise RuntimeError("model is not loaded")
+
+    def ner_check():
+        from app.rag.NER import get_gazetteer
+        if not get_gazetteer():
+            raise RuntimeError("gazetteer is empty")
+
+    def neo4j_check():
+        from app.graph.node import get_driver
+        get_driver().verify_connectivity()
+
+    def chain_check():
+        from app.rag import rag_service
+        if rag_service.rag_chain is None:
+            raise RuntimeError("rag chain is not initialized")
+
+    check("vectorstore", vectorstore_check)
+    check("embedding_model", embedding_check)
+    check("ner", ner_check)
+    check("neo4j", neo4j_check)
+    check("rag_chain", chain_check)
+
+    ready = all(not v.startswith("error") for v in checks.values())
+    return ready, checks
+
+
+def wait_until_ready(timeout: float = READINESS_TIMEOUT, interval: float = 5.0, skip: Iterable[str] = ()) -> Dict[str, float]:
+    """Повторяет bootstrap, пока проверка готовности не пройдёт (например, пока поднимается Neo4j)."""
+    deadline = time.time() + timeout
+    while True:
+        timings = bootstrap(skip=skip)
+        ready, checks = check_ready()
+        if ready:
+            logger.info(f"[bootstrap] readiness check passed: {checks}")
+            return timings
+        if time.time() >= deadline:
+            raise RuntimeError(f"Readiness check failed: {checks}")
+        logger.warning(f"[bootstrap] not ready yet, retrying in {interval:.0f}s: {checks}")
+        time.sleep(interval)
@@ -1,20 +1,195 @@
+import os
 import sqlite3
 import logging
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.db import get_connection, transaction, batched, placeholders, bulk_execute, iter_pages
+
 # Настройка логгера для модуля
 logger = logging.getLogger(__name__)
 
+DEFAULT_ARTICLE_URL = 'https://warhammer40k.fandom.com/ru/wiki/Warhammer_40000_Wiki'
+
+
+def compute_content_hash(final_title, content, article_url, entities, sources=None):
+    """Хеш всего, что влияет на чанки статьи и их метаданные (sources — GROUP_CONCAT источников через '|||')"""
+    h = hashlib.sha1()
+    for part in (final_title, content, article_url, entities, sources):
+        h.update((part or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def normalize_entity_name(name):
+    """Ключ точного поиска сущности: регистр и лишние пробелы не важны"""
+    return " ".join(name.lower().split())
+
+
+def split_entities_string(entities_string):
+    return [e.strip() for e in (entities_string or "").split(",") if e.strip()]
+
+
+INSERT_CHUNK_SQL = '''
+    INSERT INTO article_chunks 
+    (article_id, chunk_text, chunk_index, token_count, char_count, 
+     title, article_url, sources, entities)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+MARK_INDEXED_SQL = '''
+    INSERT INTO indexed_articles (article_id, content_hash, chunk_count, indexed_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(article_id) DO UPDATE SET
+        content_hash = excluded.content_hash,
+        chunk_count = excluded.chunk_count,
+        indexed_at = excluded.indexed_at
+'''
+
+
+def chunk_row_to_document(row):
+    """Строка (id, chunk_text, article_id, chunk_index, title, article_url, sources, entities) -> Document"""
+    chunk_id, chunk_text, article_id, chunk_index, title, article_url, sources, entities_string = row
+    metadata = {
+        'chunk_id': chunk_id,
+        'article_id': article_id,
+        'chunk_index': chunk_index,
+        'title': title,
+        'source': article_url,
+        'sources': sources,
+        'entities': entities_string
+    }
+    return Document(page_content=chunk_text, metadata=metadata)
+
+
+def make_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100,
+        separators=["\n\n", "\n"],
+    )
+
+
+def process_entities(entities_json):
+    """Преобразует entities в строку, разделенную запятыми"""
+    if not entities_json or not entities_json.strip():
+        return ""
+
+    try:
+        # Пробуем разные форматы entities
+        if entities_json.startswith('['):
+            # Если это JSON массив, извлекаем только имена
+            entities_list = json.loads(entities_json)
+            if isinstance(entities_list, list):
+                # Извлекаем имена из словарей или берем строки как есть
+                entity_names = []
+                for item in entities_list:
+                    if isinstance(item, dict) and 'name' in item:
+                        entity_names.append(item['name'])
+                    elif isinstance(item, str):
+                        entity_names.append(item)
+                return ", ".join(entity_names)
+            else:
+                return str(entities_list)
+        else:
+            # Если это строка с разделителями, возвращаем как есть
+            return entities_json.strip()
+
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.warning(f"Invalid entities format: {e}")
+        # Возвращаем исходную строку как есть
+        return entities_json.strip() if entities_json else ""
+
+
+def split_article(splitter, article_id, final_title, content, article_url, entities_json, sources):
+    """
+    Режет одну статью на чанки.
+    Возвращает (title_doc, строки для INSERT в article_chunks, чанки-Document).
+    """
+    # Преобразуем entities в строку
+    entities_string = process_entities(entities_json)
+
+    metadata = {
+        'article_id': article_id,
+        'title': final_title, 
+        'source': article_url if article_url else DEFAULT_ARTICLE_URL,
+        'sources': sources.replace('|||', ', ') if sources else None,
+        'entities': entities_string
+    }
+
+    title_doc = Document(page_content=final_title, metadata=metadata.copy())
+
+    # Пропускаем пустой контент
+    if not content or not content.strip():
+        logger.warning(f"Empty content for article {article_id}")
+        return title_doc, [], []
+
+    doc = Document(page_content=content, metadata=metadata)
+
+    try:
+        article_chunks = splitter.split_documents([doc])
+    except Exception as e:
+        logger.error(f"Error splitting article {article_id}: {e}")
+        return title_doc, [], []
+
+    rows = []
+    chunks = []
+
+    for chunk_index, chunk in enumerate(article_chunks):
+        if len(chunk.page_content.strip()) < 100:
+            continue 
+
+        chunk_text = chunk.page_content.strip()
+
+        # Подготавливаем данные для сохранения в БД
+        rows.append((
+            article_id,
+            chunk_text,
+            chunk_index,
+            len(chunk_text.split()),
+            len(chunk_text),
+            final_title,
+            article_url,
+            metadata['sources'],
+            entities_string
+        ))
+
+        # Обновляем метаданные
+        chunk.metadata.update({
+            'title': final_title,
+            'entities': entities_string,
+            'chunk_index': chunk_index
+        })
+        chunk.page_content = chunk_text
+        chunks.append(chunk)
+
+    return title_doc, rows, chunks
+
+
+# ---------- Воркеры пула нарезки ----------
+_worker_splitter = None
+
+
+def _init_split_worker():
+    global _worker_splitter
+    _worker_splitter = make_splitter()
+
+
+def _split_rows_worker(article_row):
+    """Режет статью в процессе-воркере; наружу отдаются только строки для INSERT (дёшево пиклить)."""
+    article_id, final_title, content, article_url, entities_json, sources = article_row
+    _, rows, _ = split_article(_worker_splitter, *article_row)
+    return article_id, compute_content_hash(final_title, content, article_url, entities_json, sources), rows
+
+
 class DatabaseTextLoader:
     def __init__(self, db_path='warhammer_articles.db'):
         self.db_path = db_path
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100,
-            separators=["\n\n", "\n"],
-        )
+        self.splitter = make_splitter()
+        self._entity_ids = None  # кеш словаря сущностей norm -> id
         logger.info(f"Initialized DatabaseTextLoader with database at: {db_path}")
         
         # Инициализируем структуру БД
@@ -23,7 +198,7 @@ class DatabaseTextLoader:
     def _init_database(self):
         """Создает таблицу для чанков если она не существует"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -47,20 +222,122 @@ class DatabaseTextLoader:
                 CREATE INDEX IF NOT EXISTS idx_article_chunks_article_id 
                 ON article_chunks (article_id)
             ''')
-            
+
+            # Что и с каким хешем содержимого уже проиндексировано (для инкрементальной переиндексации)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS indexed_articles (
+                    article_id INTEGER PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    chunk_count INTEGER,
+                    indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Инвертированный индекс «сущность -> чанки» вместо LIKE '%...%' по строке entities
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS entity_dictionary (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    norm TEXT NOT NULL UNIQUE,
+                    lemma TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_entity_dictionary_lemma
+                ON entity_dictionary (lemma)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_entities (
+                    entity_id INTEGER NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    PRIMARY KEY (entity_id, chunk_id)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_chunk_entities_chunk_id
+                ON chunk_entities (chunk_id)
+            ''')
+
+            # Хеш содержимого статьи; парсер сбрасывает его в NULL при перезаписи статьи,
+            # триггеры на sources (ниже) — при любом изменении её источников
+            cursor.execute("PRAGMA table_info(articles)")
+            cols = [c[1] for c in cursor.fetchall()]
+            if cols and "content_hash" not in cols:
+                logger.info("Adding 'content_hash' column to articles table")
+                cursor.execute("ALTER TABLE articles ADD COLUMN content_hash TEXT")
+
+            # Полнотекстовый индекс по чанкам (external content: тексты хранятся только в article_chunks,
+            # FTS5 держит лишь инвертированный индекс и синхронизируется триггерами)
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'article_chunks_fts'")
+            fts_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS article_chunks_fts USING fts5(
+                    title, chunk_text,
+                    content='article_chunks', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS article_chunks_fts_ai AFTER INSERT ON article_chunks BEGIN
+                    INSERT INTO article_chunks_fts (rowid, title, chunk_text)
+                    VALUES (new.id, new.title, new.chunk_text);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS article_chunks_fts_ad AFTER DELETE ON article_chunks BEGIN
+                    INSERT INTO article_chunks_fts (article_chunks_fts, rowid, title, chunk_text)
+                    VALUES ('delete', old.id, old.title, old.chunk_text);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS article_chunks_fts_au AFTER UPDATE ON article_chunks BEGIN
+                    INSERT INTO article_chunks_fts (article_chunks_fts, rowid, title, chunk_text)
+                    VALUES ('delete', old.id, old.title, old.chunk_text);
+                    INSERT INTO article_chunks_fts (rowid, title, chunk_text)
+                    VALUES (new.id, new.title, new.chunk_text);
+                END
+            ''')
+            if not fts_exists:
+                # База нарезана до появления индекса — заполняем его по уже существующим чанкам
+                cursor.execute("INSERT INTO article_chunks_fts (article_chunks_fts) VALUES ('rebuild')")
+                logger.info("Built full-text index for existing chunks")
+
+            # Источники выбираются по статье коррелированным подзапросом — нужен индекс
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sources'")
+            if cursor.fetchone():
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_sources_article_id
+                    ON sources (article_id)
+                ''')
+                # источники входят в content_hash: их изменение делает статью «изменённой» для --incremental
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS sources_reset_hash_ai AFTER INSERT ON sources BEGIN
+                        UPDATE articles SET content_hash = NULL WHERE id = new.article_id;
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS sources_reset_hash_ad AFTER DELETE ON sources BEGIN
+                        UPDATE articles SET content_hash = NULL WHERE id = old.article_id;
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS sources_reset_hash_au AFTER UPDATE ON sources BEGIN
+                        UPDATE articles SET content_hash = NULL WHERE id IN (old.article_id, new.article_id);
+                    END
+                ''')
+
             conn.commit()
-            logger.info("Database structure initialized (article_chunks table)")
+            logger.info("Database structure initialized (article_chunks, indexed_articles tables)")
             
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
-        finally:
             if 'conn' in locals():
-                conn.close()
+                conn.rollback()
 
     def _check_chunks_exist(self):
         """Проверяет, есть ли уже чанки в базе данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path, readonly=True)
             cursor = conn.cursor()
             
             cursor.execute('SELECT COUNT(*) FROM article_chunks')
@@ -72,183 +349,267 @@ class DatabaseTextLoader:
         except sqlite3.Error as e:
             logger.error(f"Error checking chunks existence: {e}")
             return False
-        finally:
-            if 'conn' in locals():
-                conn.close()
 
     def _process_entities(self, entities_json):
-        """Преобразует entities в строку, разделенную запятыми"""
-        if not entities_json or not entities_json.strip():
-            return ""
-        
-        try:
-            # Пробуем разные форматы entities
-            if entities_json.startswith('['):
-                # Если это JSON массив, извлекаем только имена
-                entities_list = json.loads(entities_json)
-                if isinstance(entities_list, list):
-                    # Извлекаем имена из словарей или берем строки как есть
-                    entity_names = []
-                    for item in entities_list:
-                        if isinstance(item, dict) and 'name' in item:
-                            entity_names.append(item['name'])
-                        elif isinstance(item, str):
-                            entity_names.append(item)
-                    return ", ".join(entity_names)
-                else:
-                    return str(entities_list)
-            else:
-                # Если это строка с разделителями, возвращаем как есть
-                return entities_json.strip()
-                
-        except (json.JSONDecodeError, TypeError) as e:
-            logger.warning(f"Invalid entities format: {e}")
-            # Возвращаем исходную строку как есть
-            return entities_json.strip() if entities_json else ""
+        return process_entities(entities_json)
+
+    def _split_article(self, article_id, final_title, content, article_url, entities_json, sources):
+        return split_article(self.splitter, article_id, final_title, content, article_url, entities_json, sources)
+
+    def _mark_indexed(self, cursor, article_id, content_hash, chunk_count):
+        cursor.execute(MARK_INDEXED_SQL, (article_id, content_hash, chunk_count))
 
     def load_and_split_documents(self, limit=50000, overwrite=False):
         """
         Загружает статьи и создает чанки. 
         Если чанки уже существуют и overwrite=False, загружает из БД.
-        Если overwrite=True или чанков нет, создает заново.
+        Если overwrite=True или чанков нет, создает заново (потоково, см. build_chunks).
         """
         
         # Проверяем, есть ли уже чанки
         chunks_exist = self._check_chunks_exist()
         
-        # Если чанки есть и не требуется перезапись - загружаем из БД
-        if chunks_exist and not overwrite:
-            logger.info("Chunks already exist, loading from database...")
-            chunks = self.load_chunks_from_db(limit=limit)
-            titles = self._load_titles_from_db(limit=limit)
-            return chunks, titles
-        
         # Если чанков нет или требуется перезапись - создаем заново
-        logger.info("Creating chunks from articles...")
-        chunks = []
-        titles = []
+        if not chunks_exist or overwrite:
+            self.build_chunks(limit=limit, overwrite=overwrite)
+        else:
+            logger.info("Chunks already exist, loading from database...")
+
+        chunks = self.load_chunks_from_db(limit=limit)
+        titles = self._load_titles_from_db(limit=limit)
+        return chunks, titles
+
+    def iter_articles(self, limit=None, page_size=500, conn=None):
+        """
+        Потоково отдаёт страницы статей (fetchmany) вместе с источниками.
+        Источники берутся коррелированным подзапросом, поэтому SQLite не материализует
+        GROUP BY по всей таблице и память не зависит от размера корпуса.
+        Если передан conn, чтение идёт через него, иначе — через read-only соединение потока.
+        """
+        try:
+            if conn is None:
+                conn = get_connection(self.db_path, readonly=True)
+            query = '''
+                SELECT a.id, a.final_title, a.content, a.article_url, a.entities,
+                    (SELECT GROUP_CONCAT(s.source_text, '|||') FROM sources s WHERE s.article_id = a.id) as sources
+                FROM articles a
+                ORDER BY a.id
+            '''
+            params = ()
+            if limit:
+                query += ' LIMIT ?'
+                params = (limit,)
+            yield from iter_pages(conn, query, params, page_size=page_size)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading articles: {e}")
+
+    def build_chunks(self, limit=None, overwrite=False, workers=None, page_size=500, write_batch=5000):
+        """
+        Нарезает статьи на чанки и пишет их в article_chunks.
+        Статьи читаются страницами, режутся в пуле процессов, строки чанков пишутся
+        большими транзакциями по write_batch строк. Пиковая память ограничена размером страницы
+        и не зависит от размера корпуса. Возвращает статистику.
+        """
+        workers = os.cpu_count() if workers is None else workers
+        stats = {"articles": 0, "chunks": 0}
 
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path)
             cursor = conn.cursor()
-            logger.info("Connected to database, starting data loading")
 
-            if overwrite and chunks_exist:
-                cursor.execute('DELETE FROM article_chunks')
-                conn.commit()
+            if overwrite:
+                with transaction(conn):
+                    cursor.execute('DELETE FROM article_chunks')
+                    cursor.execute('DELETE FROM indexed_articles')
+                    cursor.execute('DELETE FROM chunk_entities')
                 logger.info("Cleared existing chunks from database")
 
-            cursor.execute(f'''
+            pending_rows = []
+            pending_indexed = []
+
+            def flush():
+                if not pending_rows and not pending_indexed:
+                    return
+                try:
+                    with transaction(conn):
+                        first_new_id = self._max_chunk_id(cursor) + 1
+                        bulk_execute(conn, INSERT_CHUNK_SQL, pending_rows)
+                        self._index_chunk_entities(cursor, first_new_id)
+                        bulk_execute(conn, MARK_INDEXED_SQL, pending_indexed)
+                    stats["chunks"] += len(pending_rows)
+                    logger.info(f"Saved {stats['chunks']} chunks ({stats['articles']} articles processed)")
+                except sqlite3.Error as e:
+                    logger.error(f"Error saving chunk batch: {e}")
+                    self._entity_ids = None
+                pending_rows.clear()
+                pending_indexed.clear()
+
+            executor = None
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_split_worker)
+            else:
+                _init_split_worker()
+
+            try:
+                # Читаем и пишем одним соединением: курсор чтения не мешает commit
+                for page in self.iter_articles(limit=limit, page_size=page_size, conn=conn):
+                    if executor is not None:
+                        results = executor.map(_split_rows_worker, page, chunksize=max(1, len(page) // (workers * 4)))
+                    else:
+                        results = map(_split_rows_worker, page)
+
+                    for article_id, content_hash, rows in results:
+                        stats["articles"] += 1
+                        pending_rows.extend(rows)
+                        pending_indexed.append((article_id, content_hash, len(rows)))
+
+                    if len(pending_rows) >= write_batch:
+                        flush()
+                flush()
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+            logger.info(f"Successfully saved {stats['chunks']} chunks from {stats['articles']} articles")
+            return stats
+
+        except sqlite3.Error as e:
+            logger.error(f"Database error: {e}")
+            return stats
+
+    # ---------- Инкрементальная переиндексация ----------
+    def refresh_content_hashes(self, page_size=500):
+        """Досчитывает content_hash для статей, у которых он пуст (новые или перезаписанные парсером)"""
+        try:
+            conn = get_connection(self.db_path)
+            pages = iter_pages(conn, '''
                 SELECT a.id, a.final_title, a.content, a.article_url, a.entities,
-                    GROUP_CONCAT(s.source_text, '|||') as sources
+                    (SELECT GROUP_CONCAT(s.source_text, '|||') FROM sources s WHERE s.article_id = a.id) as sources
                 FROM articles a
-                LEFT JOIN sources s ON a.id = s.article_id
-                GROUP BY a.id
-                LIMIT ?
-            ''', (limit,))
+                WHERE a.content_hash IS NULL
+            ''', page_size=page_size)
+            with transaction(conn):
+                updated = bulk_execute(
+                    conn,
+                    'UPDATE articles SET content_hash = ? WHERE id = ?',
+                    ((compute_content_hash(title, content, url, ents, sources), article_id)
+                     for page in pages for article_id, title, content, url, ents, sources in page),
+                    batch_size=page_size
+                )
+            logger.info(f"Computed content hashes for {updated} articles")
+            return updated
+        except sqlite3.Error as e:
+            logger.error(f"Error computing content hashes: {e}")
+            return 0
 
-            articles = cursor.fetchall()
-            logger.info(f"Found {len(articles)} articles in database (limit={limit})")
+    def diff_articles(self):
+        """
+        Сравнивает текущие хеши статей с проиндексированными.
+        Возвращает словарь со списками id: new, changed, deleted и числом unchanged.
+        """
+        diff = {"new": [], "changed": [], "deleted": [], "unchanged": 0}
+        try:
+            conn = get_connection(self.db_path, readonly=True)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT a.id, a.content_hash, i.content_hash
+                FROM articles a
+                LEFT JOIN indexed_articles i ON i.article_id = a.id
+            ''')
+            for article_id, current_hash, indexed_hash in cursor:
+                if indexed_hash is None:
+                    diff["new"].append(article_id)
+                elif indexed_hash != current_hash:
+                    diff["changed"].append(article_id)
+                else:
+                    diff["unchanged"] += 1
 
-            total_chunks_saved = 0
+            cursor.execute('''
+                SELECT article_id FROM indexed_articles
+                WHERE article_id NOT IN (SELECT id FROM articles)
+                UNION
+                SELECT DISTINCT article_id FROM article_chunks
+                WHERE article_id NOT IN (SELECT id FROM articles)
+            ''')
+            diff["deleted"] = [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error computing article diff: {e}")
+        return diff
 
-            for article_id, final_title, content, article_url, entities_json, sources in articles:
-                # Преобразуем entities в строку
-                entities_string = self._process_entities(entities_json)
-                
-                metadata = {
-                    'article_id': article_id,
-                    'title': final_title, 
-                    'source': article_url if article_url else 'https://warhammer40k.fandom.com/ru/wiki/Warhammer_40000_Wiki',
-                    'sources': sources.replace('|||', ', ') if sources else None,
-                    'entities': entities_string
-                }
+    def mark_all_current(self):
+        """Помечает все статьи с чанками как проиндексированные с текущим хешем (миграция без переиндексации)"""
+        try:
+            conn = get_connection(self.db_path)
+            with transaction(conn):
+                cursor = conn.execute('''
+                    INSERT OR REPLACE INTO indexed_articles (article_id, content_hash, chunk_count)
+                    SELECT a.id, a.content_hash, COUNT(c.id)
+                    FROM articles a
+                    JOIN article_chunks c ON c.article_id = a.id
+                    GROUP BY a.id
+                ''')
+            logger.info(f"Marked {cursor.rowcount} articles as indexed")
+        except sqlite3.Error as e:
+            logger.error(f"Error marking articles as indexed: {e}")
 
-                title_doc = Document(page_content=final_title, metadata=metadata.copy())
-                titles.append(title_doc)
+    def replace_article_chunks(self, conn, article_ids, deleted_ids=()):
+        """
+        В рамках открытой транзакции conn (без commit) удаляет старые чанки статей,
+        заново режет изменённые/новые статьи и обновляет indexed_articles.
+        Возвращает (id удалённых чанков, новые чанки-Document с chunk_id в метаданных).
+        """
+        cursor = conn.cursor()
+        all_ids = list(article_ids) + list(deleted_ids)
+        removed_chunk_ids = []
+        new_chunks = []
 
-                # Пропускаем пустой контент
-                if not content or not content.strip():
-                    logger.warning(f"Empty content for article {article_id}")
-                    continue
+        for part in batched(all_ids):
+            marks = placeholders(len(part))
+            cursor.execute(f'SELECT id FROM article_chunks WHERE article_id IN ({marks})', part)
+            removed_chunk_ids.extend(row[0] for row in cursor.fetchall())
+            cursor.execute(f'''
+                DELETE FROM chunk_entities WHERE chunk_id IN
+                    (SELECT id FROM article_chunks WHERE article_id IN ({marks}))
+            ''', part)
+            cursor.execute(f'DELETE FROM article_chunks WHERE article_id IN ({marks})', part)
 
-                doc = Document(page_content=content, metadata=metadata)
-                
-                try:
-                    article_chunks = self.splitter.split_documents([doc])
-                except Exception as e:
-                    logger.error(f"Error splitting article {article_id}: {e}")
-                    continue
+        for part in batched(list(deleted_ids)):
+            cursor.execute(f'DELETE FROM indexed_articles WHERE article_id IN ({placeholders(len(part))})', part)
 
-                article_chunks_to_save = []
-
-                for chunk_index, chunk in enumerate(article_chunks):
-                    if len(chunk.page_content.strip()) < 100:
-                        continue 
-
-                    chunk_text = chunk.page_content.strip()
-                    
-                    # Подготавливаем данные для сохранения в БД
-                    article_chunks_to_save.append((
-                        article_id,
-                        chunk_text,
-                        chunk_index,
-                        len(chunk_text.split()),
-                        len(chunk_text),
-                        final_title,
-                        article_url,
-                        sources,
-                        entities_string
-                    ))
-                    
-                    # Обновляем метаданные
+        first_new_id = self._max_chunk_id(cursor) + 1
+        for part in batched(list(article_ids)):
+            cursor.execute(f'''
+                SELECT a.id, a.final_title, a.content, a.article_url, a.entities, a.content_hash,
+                    (SELECT GROUP_CONCAT(s.source_text, '|||') FROM sources s WHERE s.article_id = a.id) as sources
+                FROM articles a
+                WHERE a.id IN ({placeholders(len(part))})
+            ''', part)
+
+            for article_id, final_title, content, article_url, entities_json, content_hash, sources in cursor.fetchall():
+                _, rows, chunks = self._split_article(
+                    article_id, final_title, content, article_url, entities_json, sources
+                )
+                for row, chunk in zip(rows, chunks):
+                    cursor.execute(INSERT_CHUNK_SQL, row)
+                    # sources остаются из split_article — то же значение, что записано в строку чанка
                     chunk.metadata.update({
-                        'title': final_title,
-                        'entities': entities_string
+                        'chunk_id': cursor.lastrowid,
+                        'source': article_url,
                     })
-                    chunk.page_content = chunk_text
-                    chunks.append(chunk)
-
-                # Сохраняем чанки
-                if article_chunks_to_save:
-                    try:
-                        cursor.executemany('''
-                            INSERT INTO article_chunks 
-                            (article_id, chunk_text, chunk_index, token_count, char_count, 
-                             title, article_url, sources, entities)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', article_chunks_to_save)
-                        conn.commit()
-                        
-                        total_chunks_saved += len(article_chunks_to_save)
-                        logger.debug(f"Saved {len(article_chunks_to_save)} chunks for article: {final_title}")
-                    
-                    except sqlite3.Error as e:
-                        logger.error(f"Error saving chunks for article {article_id}: {e}")
-                        conn.rollback()
-
-            logger.info(f"Successfully saved {total_chunks_saved} chunks to database")
-            
-            # Фильтруем пустые чанки
-            valid_chunks = [chunk for chunk in chunks if chunk.page_content.strip()]
-            logger.info(f"Returning {len(titles)} titles and {len(valid_chunks)} valid chunks")
-            
-            return valid_chunks, titles
+                    new_chunks.append(chunk)
+                self._mark_indexed(
+                    cursor, article_id,
+                    content_hash or compute_content_hash(final_title, content, article_url, entities_json, sources),
+                    len(rows)
+                )
 
-        except sqlite3.Error as e:
-            logger.error(f"Database error: {e}")
-            if 'conn' in locals():
-                conn.rollback()
-            return [], []
-        finally:
-            if 'conn' in locals():
-                conn.close()
-                logger.info("Database connection closed")
+        self._index_chunk_entities(cursor, first_new_id)
+        return removed_chunk_ids, new_chunks
 
     def _load_titles_from_db(self, limit=1000):
         """Загружает заголовки статей из базы данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path, readonly=True)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -277,14 +638,11 @@ class DatabaseTextLoader:
         except sqlite3.Error as e:
             logger.error(f"Error loading titles from database: {e}")
             return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
 
     def load_chunks_from_db(self, article_id=None, limit=10000):
         """Загружает чанки из базы данных"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path, readonly=True)
             cursor = conn.cursor()
             
             query = '''
@@ -326,31 +684,56 @@ class DatabaseTextLoader:
         except sqlite3.Error as e:
             logger.error(f"Error loading chunks from database: {e}")
             return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
 
-    def get_chunks_with_entity(self, entity_name, entity_type=None, limit=1000):
-        """Возвращает чанки, содержащие указанную entity"""
+    def count_chunks(self, after_id=0):
+        """Количество чанков с id > after_id"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = get_connection(self.db_path, readonly=True)
             cursor = conn.cursor()
-            
-            query = '''
-                SELECT id, chunk_text, article_id, chunk_index, title, 
-                       article_url, sources, entities
-                FROM article_chunks
-                WHERE entities LIKE ? AND LENGTH(chunk_text) > 10
-                LIMIT ?
-            '''
-            
-            search_pattern = f'%{entity_name}%'
-            
-            cursor.execute(query, (search_pattern, limit))
-            chunks_data = cursor.fetchall()
-            
-            chunks = []
-            for chunk_id, chunk_text, article_id, chunk_index, title, article_url, sources, entities_string in chunks_data:
+            cursor.execute('SELECT COUNT(*) FROM article_chunks WHERE id > ?', (after_id,))
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error counting chunks: {e}")
+            return 0
+
+    def max_chunk_id(self):
+        try:
+            conn = get_connection(self.db_path, readonly=True)
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM article_chunks')
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading max chunk id: {e}")
+            return 0
+
+    def iter_chunk_pages(self, after_id=0, page_size=1000):
+        """
+        Постранично отдаёт чанки (keyset-пагинация по id), не держа всю таблицу в памяти.
+        Каждая страница — список Document с chunk_id в метаданных.
+        """
+        last_id = after_id
+        while True:
+            try:
+                conn = get_connection(self.db_path, readonly=True)
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, chunk_text, article_id, chunk_index, title,
+                           article_url, sources, entities
+                    FROM article_chunks
+                    WHERE id > ? AND LENGTH(chunk_text) > 10
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, page_size))
+                rows = cursor.fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error loading chunk page after id {last_id}: {e}")
+                return
+
+            if not rows:
+                return
+
+            page = []
+            for chunk_id, chunk_text, article_id, chunk_index, title, article_url, sources, entities_string in rows:
                 metadata = {
                     'chunk_id': chunk_id,
                     'article_id': article_id,
@@ -360,16 +743,151 @@ class DatabaseTextLoader:
                     'sources': sources,
                     'entities': entities_string
                 }
-                
                 if chunk_text.strip():
-                    chunks.append(Document(page_content=chunk_text, metadata=metadata))
-            
-            logger.info(f"Found {len(chunks)} chunks with entity: {entity_name}")
-            return chunks
-            
+                    page.append(Document(page_content=chunk_text, metadata=metadata))
+
+            last_id = rows[-1][0]
+            yield last_id, page
+
+    # ---------- Индекс сущностей ----------
+    def _max_chunk_id(self, cursor):
+        # AUTOINCREMENT: новые id всегда больше любого когда-либо выданного
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'article_chunks'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _entity_id(self, cursor, name):
+        """id сущности в словаре; новые сущности добавляются вместе с леммой"""
+        if self._entity_ids is None:
+            cursor.execute('SELECT norm, id FROM entity_dictionary')
+            self._entity_ids = dict(cursor.fetchall())
+
+        norm = normalize_entity_name(name)
+        entity_id = self._entity_ids.get(norm)
+        if entity_id is None:
+            from app.rag.NER import _lemmatize
+            cursor.execute(
+                'INSERT INTO entity_dictionary (name, norm, lemma) VALUES (?, ?, ?)',
+                (name, norm, _lemmatize(name) or norm)
+            )
+            entity_id = cursor.lastrowid
+            self._entity_ids[norm] = entity_id
+        return entity_id
+
+    def _index_chunk_entities(self, cursor, from_chunk_id, page_size=5000):
+        """Заполняет chunk_entities для чанков с id >= from_chunk_id (в текущей транзакции)"""
+        read_cursor = cursor.connection.cursor()
+        read_cursor.execute(
+            'SELECT id, entities FROM article_chunks WHERE id >= ? ORDER BY id', (from_chunk_id,)
+        )
+        # все чанки статьи несут одну и ту же строку entities — разбираем её один раз
+        parsed = {}
+        while True:
+            page = read_cursor.fetchmany(page_size)
+            if not page:
+                break
+            links = []
+            for chunk_id, entities_string in page:
+                entity_ids = parsed.get(entities_string)
+                if entity_ids is None:
+                    entity_ids = {self._entity_id(cursor, name) for name in split_entities_string(entities_string)}
+                    parsed[entities_string] = entity_ids
+                links.extend((entity_id, chunk_id) for entity_id in entity_ids)
+            cursor.executemany(
+                'INSERT OR IGNORE INTO chunk_entities (entity_id, chunk_id) VALUES (?, ?)', links
+            )
+
+    def rebuild_fts_index(self):
+        """Перестраивает полнотекстовый индекс article_chunks_fts по article_chunks"""
+        try:
+            conn = get_connection(self.db_path)
+            with transaction(conn):
+                conn.execute("INSERT INTO article_chunks_fts (article_chunks_fts) VALUES ('rebuild')")
+                conn.execute("INSERT INTO article_chunks_fts (article_chunks_fts) VALUES ('optimize')")
+            logger.info("Full-text chunk index rebuilt")
+        except sqlite3.Error as e:
+            logger.error(f"Error rebuilding full-text index: {e}")
+
+    def rebuild_entity_index(self):
+        """Перестраивает chunk_entities по всем чанкам (для баз, нарезанных до появления индекса)"""
+        try:
+            conn = get_connection(self.db_path)
+            cursor = conn.cursor()
+            with transaction(conn):
+                cursor.execute('DELETE FROM chunk_entities')
+                self._index_chunk_entities(cursor, 0)
+            cursor.execute('SELECT COUNT(*), COUNT(DISTINCT entity_id) FROM chunk_entities')
+            links, entities = cursor.fetchone()
+            logger.info(f"Entity index rebuilt: {links} links for {entities} entities")
+        except sqlite3.Error as e:
+            logger.error(f"Error rebuilding entity index: {e}")
+            self._entity_ids = None
+
+    def get_chunks_with_entity(self, entity_name, entity_type=None, limit=1000, lemma=False):
+        """
+        Возвращает чанки, содержащие указанную entity.
+        Точное совпадение (без учёта регистра) через индекс chunk_entities;
+        lemma=True — совпадение по лемме («Хоруса» найдёт «Хорус»).
+        """
+        return self.get_chunks_with_entities([entity_name], limit=limit, lemma=lemma).get(entity_name, [])
+
+    def get_chunks_with_entities(self, entity_names, limit=1000, lemma=False):
+        """
+        Пакетный вариант: чанки для многих сущностей одним запросом.
+        Возвращает {entity_name: [Document, ...]} (не больше limit чанков на сущность).
+        """
+        names = [n for n in entity_names if n and n.strip()]
+        if not names:
+            return {}
+
+        if lemma:
+            from app.rag.NER import _lemmatize
+            keys = {name: _lemmatize(name) or normalize_entity_name(name) for name in names}
+            key_column = 'lemma'
+        else:
+            keys = {name: normalize_entity_name(name) for name in names}
+            key_column = 'norm'
+
+        by_key = {}
+        for name, key in keys.items():
+            by_key.setdefault(key, []).append(name)
+
+        try:
+            conn = get_connection(self.db_path, readonly=True)
+            cursor = conn.cursor()
+            # Лимит на сущность — в SQL: частые сущности не вычитывают весь постинг-лист с текстами
+            cursor.execute(f'''
+                WITH matched AS (
+                    SELECT DISTINCT d.{key_column} AS entity_key, ce.chunk_id
+                    FROM entity_dictionary d
+                    JOIN chunk_entities ce ON ce.entity_id = d.id
+                    WHERE d.{key_column} IN ({placeholders(len(by_key))})
+                ), ranked AS (
+                    SELECT m.entity_key, c.id AS chunk_id,
+                           ROW_NUMBER() OVER (PARTITION BY m.entity_key ORDER BY c.article_id, c.chunk_index) AS rank
+                    FROM matched m
+                    JOIN article_chunks c ON c.id = m.chunk_id
+                    WHERE LENGTH(c.chunk_text) > 10
+                )
+                SELECT r.entity_key, c.id, c.chunk_text, c.article_id, c.chunk_index, c.title,
+                       c.article_url, c.sources, c.entities
+                FROM ranked r
+                JOIN article_chunks c ON c.id = r.chunk_id
+                WHERE r.rank <= ?
+                ORDER BY r.entity_key, c.article_id, c.chunk_index
+            ''', list(by_key) + [limit])
+
+            result = {name: [] for name in names}
+            for row in cursor.fetchall():
+                doc = chunk_row_to_document(row[1:])
+                if not doc.page_content.strip():
+                    continue
+                for name in by_key[row[0]]:
+                    result[name].append(doc)
+
+            logger.info(f"Found chunks for {sum(1 for v in result.values() if v)}/{len(names)} entities")
+            return result
+
         except sqlite3.Error as e:
             logger.error(f"Error searching chunks by entity: {e}")
-            return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+            return {}
@@ -14,4 +14,115 @@ MAX_MESSAGE_LENGTH = int(os.getenv("MAX_MESSAGE_LENGTH"))
 GIGA_KEY = os.getenv("GIGA_KEY")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
-NEO4J_URI = os.getenv("NEO4J_URI")
\ No newline at end of file
+NEO4J_URI = os.getenv("NEO4J_URI")
+
+# --- Webhook ---
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+MEMORY_REPORT_INTERVAL = int(os.getenv("MEMORY_REPORT_INTERVAL", "60"))
+
+# --- Старт приложения ---
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "300"))
+
+# --- CPU-пул для нормализации сущностей и эмбеддинга запросов (0 — в текущем процессе) ---
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "0"))
+
+# --- SQLite (app/db.py) ---
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+# --- Лексический поиск (FTS5) ---
+ARTICLES_DB_PATH = os.getenv("ARTICLES_DB_PATH", "warhammer_articles.db")
+# off — только векторный поиск; fusion — BM25 + векторы через RRF;
+# exact — как fusion, но точное совпадение с названием статьи отвечается одним лексическим поиском
+LEXICAL_MODE = os.getenv("LEXICAL_MODE", "fusion")
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# --- Векторный индекс: chroma, flat (memory-mapped NumPy, см. app/rag/flat_index.py)
+# или sharded (коллекции Chroma по категориям графа, см. app/rag/sharding.py) ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Сколько шардов строит python -m app.rag.indexer --build-shards (включая общий шард other)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "8"))
+FLAT_INDEX_DIR = Path(os.getenv("FLAT_INDEX_DIR", "flat_index"))
+# Для квантованного индекса с float32-копией: сколько кандидатов на один результат пересчитывать точно (0 — без пересчёта)
+FLAT_RESCORE_FACTOR = int(os.getenv("FLAT_RESCORE_FACTOR", "4"))
+
+# --- Индекс названий для связывания сущностей со статьями (см. app/rag/title_index.py) ---
+TITLE_INDEX_PATH = Path(os.getenv("TITLE_INDEX_PATH", "title_index.npz"))
+# Минимальная косинусная близость сущности к названию, ниже — сущность ищется по всему индексу чанков
+TITLE_MATCH_THRESHOLD = float(os.getenv("TITLE_MATCH_THRESHOLD", "0.9"))
+TITLE_MAX_ARTICLES = int(os.getenv("TITLE_MAX_ARTICLES", "3"))
+# Поиск по связанным сущностям: filtered — векторный поиск только по чанкам найденных статей,
+# lead — вводные чанки найденных статей без векторного поиска, full — без связывания, по всему индексу
+ENTITY_SEARCH_MODE = os.getenv("ENTITY_SEARCH_MODE", "filtered")
+
+# --- Кеш результатов поиска по под-вопросам и сущностям (см. app/rag/cache.py) ---
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "10000"))  # записей на кеш, 0 — выключен
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))  # с
+
+# --- Упаковка контекста в промпт (см. app/rag/context_packer.py) ---
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "6000"))  # 0 — без ограничения
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))  # косинус почти дубликатов чанков
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+
+# --- Память диалога: уточняющие вопросы без повторного поиска (см. app/rag/conversation.py) ---
+CONVERSATION_MAX_CHATS = int(os.getenv("CONVERSATION_MAX_CHATS", "10000"))  # 0 — выключена
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "900"))  # с
+# Вопрос длиннее этого числа слов всегда обрабатывается полным конвейером
+FOLLOWUP_MAX_WORDS = int(os.getenv("FOLLOWUP_MAX_WORDS", "8"))
+
+# --- Спекулятивный поиск параллельно с LLM-декомпозицией (см. app/rag/speculation.py) ---
+# off — как раньше, поиск после декомпозиции; always — поиск по запросу и локальным сущностям сразу,
+# декомпозиция дожидается всегда; auto — декомпозиция пропускается, если локальных сущностей достаточно;
+# never — без LLM-декомпозиции
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "always")
+# auto: вопрос длиннее этого числа слов всегда ждёт декомпозицию
+SPECULATIVE_MAX_WORDS = int(os.getenv("SPECULATIVE_MAX_WORDS", "10"))
+SPECULATIVE_THREADS = int(os.getenv("SPECULATIVE_THREADS", "8"))
+
+# --- Декомпозиция вопроса (см. app/rag/local_decomposer.py) ---
+# local — простые вопросы (одна сущность, одно предложение) разбираются локально, сложные — в GigaChat;
+# llm — всегда GigaChat
+DECOMPOSER_MODE = os.getenv("DECOMPOSER_MODE", "local")
+# Вопрос длиннее этого числа слов считается сложным
+LOCAL_DECOMPOSER_MAX_WORDS = int(os.getenv("LOCAL_DECOMPOSER_MAX_WORDS", "8"))
+
+# --- Маршрутизация LLM: дедлайны, хеджирование и размыкатели (см. app/rag/llm_router.py) ---
+LLM_PRIMARY = os.getenv("LLM_PRIMARY", "gigachat")  # gigachat или ollama
+LLM_SECONDARY = os.getenv("LLM_SECONDARY", "ollama")  # пусто — без запасного бэкенда
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "owl/t-lite:latest")
+GIGACHAT_MODEL = os.getenv("GIGACHAT_MODEL", "GigaChat")
+# Общий токен GigaChat обновляется заранее, за столько секунд до истечения (см. app/rag/llm_clients.py)
+GIGACHAT_TOKEN_REFRESH_MARGIN = float(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", "120"))
+# Дедлайн одного вызова LLM по ролям (с)
+LLM_TIMEOUT_DECOMPOSER = float(os.getenv("LLM_TIMEOUT_DECOMPOSER", "10"))
+LLM_TIMEOUT_AGENT = float(os.getenv("LLM_TIMEOUT_AGENT", "20"))
+LLM_TIMEOUT_ANSWER = float(os.getenv("LLM_TIMEOUT_ANSWER", "40"))
+# Запасной бэкенд вызывается параллельно, когда основной отвечает дольше этого перцентиля своих задержек
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))  # с, нижняя граница и значение без статистики
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))  # доля вызовов, которые можно хеджировать
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # ошибок подряд до размыкания
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # с до пробного вызова
+LLM_THREADS = int(os.getenv("LLM_THREADS", "16"))
+
+# --- Дедлайн запроса (см. app/rag/deadline.py) ---
+# Общий бюджет вопроса (с), 0 — без ограничения. Стадии урезают работу по остатку бюджета
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+# Последние столько секунд бюджета отданы итоговому ответу
+DEADLINE_ANSWER_RESERVE = float(os.getenv("DEADLINE_ANSWER_RESERVE", "20"))
+
+# --- Учёт LLM по вопросу (см. app/rag/accounting.py) ---
+# Бюджеты вопроса: исчерпав их, декомпозиция и агент графа обходятся без LLM (0 — без ограничения)
+LLM_REQUEST_TOKEN_BUDGET = int(os.getenv("LLM_REQUEST_TOKEN_BUDGET", "20000"))
+LLM_REQUEST_CALL_BUDGET = int(os.getenv("LLM_REQUEST_CALL_BUDGET", "8"))
+# Сводка учёта пишется в лог каждые столько вопросов
+ACCOUNTING_REPORT_EVERY = int(os.getenv("ACCOUNTING_REPORT_EVERY", "100"))
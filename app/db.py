@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import logging
+import threading
+from typing import List
+
+from app.config import SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT
+from app import db_core
+# Пакетные операции и транзакции не зависят от настроек — реэкспорт из db_core
+from app.db_core import transaction, placeholders, batched, bulk_execute, iter_pages  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+# Соединения, унаследованные от родителя после fork: не используем и не закрываем
+_inherited: List[sqlite3.Connection] = []
+
+
+def connect(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """Новое соединение с настройками SQLITE_* из app.config (см. db_core.connect)."""
+    return db_core.connect(
+        db_path, readonly,
+        mmap_size=SQLITE_MMAP_SIZE,
+        cache_size_kb=SQLITE_CACHE_SIZE_KB,
+        synchronous=SQLITE_SYNCHRONOUS,
+        busy_timeout=SQLITE_BUSY_TIMEOUT,
+    )
+
+
+def get_connection(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """
+    Соединение текущего потока (создаётся один раз на поток, БД и режим).
+    Закрывать его не нужно; для записи используйте transaction().
+    """
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid:
+        # После fork соединения родителя переиспользовать нельзя
+        _inherited.extend(getattr(_local, "connections", {}).values())
+        _local.pid = pid
+        _local.connections = {}
+
+    key = (os.path.abspath(db_path), readonly)
+    conn = _local.connections.get(key)
+    if conn is None:
+        conn = connect(db_path, readonly=readonly)
+        _local.connections[key] = conn
+        logger.debug(f"Opened {'read-only ' if readonly else ''}SQLite connection to {db_path} "
+                     f"in thread {threading.current_thread().name}")
+    return conn
+
+
+def close_connections():
+    """Закрывает соединения текущего потока (например, перед завершением воркера)."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
@@ -0,0 +1,106 @@
+"""
+Настроенные соединения SQLite и пакетные операции без зависимости от app.config:
+парсер (parser/warhammer_wiki.py) запускается отдельно и не требует окружения бота.
+Параметры берутся аргументами; app/db.py подставляет в них настройки из app.config.
+"""
+import sqlite3
+from pathlib import Path
+from urllib.request import pathname2url
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Sequence
+
+# Кеш подготовленных выражений sqlite3 на соединение: одинаковые запросы не парсятся заново
+STATEMENT_CACHE_SIZE = 256
+# Значения по умолчанию — те же, что у SQLITE_* в app/config.py
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KB = 64 * 1024
+DEFAULT_SYNCHRONOUS = "NORMAL"
+DEFAULT_BUSY_TIMEOUT = 30.0
+
+
+def _apply_pragmas(conn: sqlite3.Connection, readonly: bool, mmap_size: int, cache_size_kb: int, synchronous: str):
+    if not readonly:
+        # WAL хранится в самом файле БД: читатели не блокируют писателя (краулер пишет, загрузчики читают)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute(f"PRAGMA mmap_size={mmap_size}")
+    # отрицательное значение — размер в КБ, а не в страницах
+    conn.execute(f"PRAGMA cache_size={-cache_size_kb}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def connect(
+    db_path: str,
+    readonly: bool = False,
+    mmap_size: int = DEFAULT_MMAP_SIZE,
+    cache_size_kb: int = DEFAULT_CACHE_SIZE_KB,
+    synchronous: str = DEFAULT_SYNCHRONOUS,
+    busy_timeout: float = DEFAULT_BUSY_TIMEOUT,
+) -> sqlite3.Connection:
+    """
+    Новое настроенное соединение. readonly=True открывает БД через URI с mode=ro:
+    такое соединение не может случайно писать и не создаёт пустой файл, если базы нет.
+    """
+    if readonly:
+        uri = f"file:{pathname2url(str(Path(db_path).resolve()))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=busy_timeout, cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(db_path, timeout=busy_timeout, cached_statements=STATEMENT_CACHE_SIZE)
+    _apply_pragmas(conn, readonly, mmap_size, cache_size_kb, synchronous)
+    return conn
+
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    commit при успехе и rollback при любой ошибке: переиспользуемое соединение
+    не должно оставаться с незавершённой транзакцией.
+    """
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# ---------- Пакетные операции ----------
+def placeholders(n: int) -> str:
+    return ",".join("?" * n)
+
+
+def batched(items: Sequence, size: int = 500) -> Iterator[Sequence]:
+    """Делит список параметров для IN (...) на части — у SQLite есть лимит на число параметров."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def bulk_execute(conn: sqlite3.Connection, sql: str, rows: Iterable[Sequence], batch_size: int = 5000) -> int:
+    """
+    executemany одним подготовленным выражением, пачками по batch_size строк
+    (генератор строк не материализуется целиком). Без commit — вызывается внутри transaction().
+    """
+    cursor = conn.cursor()
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def iter_pages(conn: sqlite3.Connection, sql: str, params: Sequence = (), page_size: int = 1000) -> Iterator[List[tuple]]:
+    """Постраничное чтение результата запроса через fetchmany."""
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    while True:
+        page = cursor.fetchmany(page_size)
+        if not page:
+            break
+        yield page
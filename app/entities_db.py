@@ -1,12 +1,10 @@
-import sqlite3
 import logging
 from pathlib import Path
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 
 logger = logging.getLogger(__name__)
 from app.config import CHROMA_PERSIST_DIR, EMBEDDING_MODEL_NAME
-embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+from app.db import get_connection, transaction, bulk_execute
 
 
 def load_vectorstore_and_sync_entities(
@@ -31,34 +29,52 @@ def load_vectorstore_and_sync_entities(
 
     logger.info(f"Loaded {len(metadatas)} documents from Chroma, syncing entities to DB")
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = get_connection(db_path)
+    with transaction(conn):
+        cursor = conn.cursor()
 
-    # проверяем, есть ли колонка entities
-    cursor.execute("PRAGMA table_info(articles)")
-    cols = [c[1] for c in cursor.fetchall()]
-    if "entities" not in cols:
-        logger.info("Adding 'entities' column to articles table")
-        cursor.execute("ALTER TABLE articles ADD COLUMN entities TEXT")
+        # проверяем, есть ли колонка entities
+        cursor.execute("PRAGMA table_info(articles)")
+        cols = [c[1] for c in cursor.fetchall()]
+        if "entities" not in cols:
+            logger.info("Adding 'entities' column to articles table")
+            cursor.execute("ALTER TABLE articles ADD COLUMN entities TEXT")
 
-    # обновляем сущности для каждой статьи
-    for m in metadatas:
-        article_id = m.get("article_id")
-        entities = m.get("entities", "")
-        if article_id is not None:
-            cursor.execute(
-                "UPDATE articles SET entities = ? WHERE id = ?",
-                (entities, article_id)
+        # обновляем сущности для каждой статьи одним подготовленным выражением
+        bulk_execute(
+            conn,
+            "UPDATE articles SET entities = ? WHERE id = ?",
+            ((m["entities"], m["article_id"]) for m in metadatas
+             if m.get("article_id") is not None and "entities" in m)
+        )
+
+        # тонкий индекс хранит в метаданных только chunk_id/article_id — сущности берутся из article_chunks
+        slim_ids = {m["article_id"] for m in metadatas if m.get("article_id") is not None and "entities" not in m}
+        if slim_ids:
+            logger.info(f"Slim index: syncing entities of {len(slim_ids)} articles from article_chunks")
+            bulk_execute(
+                conn,
+                """
+                UPDATE articles SET entities = (
+                    SELECT c.entities FROM article_chunks c
+                    WHERE c.article_id = articles.id AND c.entities IS NOT NULL
+                    ORDER BY c.chunk_index DESC LIMIT 1
+                )
+                WHERE id = ? AND EXISTS (
+                    SELECT 1 FROM article_chunks c WHERE c.article_id = articles.id AND c.entities IS NOT NULL
+                )
+                """,
+                ((article_id,) for article_id in slim_ids)
             )
 
-    conn.commit()
-    conn.close()
     logger.info("Entities successfully synced to database")
 
     return vectorstore
 
 if __name__ == "__main__":
+    from langchain_huggingface import HuggingFaceEmbeddings
 
+    embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
     try:
         load_vectorstore_and_sync_entities(
             embedding_model=embedding_model,
@@ -1,11 +1,35 @@
-from neo4j import GraphDatabase
+import math
+import threading
+from neo4j import GraphDatabase, Query
+from neo4j.exceptions import Neo4jError
 from app.config import NEO4J_USER, NEO4J_PASSWORD, NEO4J_URI
 from itertools import combinations
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def get_driver():
+    """Общий драйвер Neo4j, создаётся при первом обращении."""
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    return _driver
+
+
+def close_driver():
+    """Закрывает драйвер (например, перед fork — соединения не должны наследоваться воркерами)."""
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
 
 def get_node_info(node_title: str, detailed: bool = False):
-    with driver.session() as session:
+    with get_driver().session() as session:
 
         if detailed:
             query = """
@@ -55,19 +79,25 @@ def get_node_info(node_title: str, detailed: bool = False):
         return node_data
 
 
-def calculate_graph_metrics(nodes: list, max_length=5):
+def calculate_graph_metrics(nodes: list, max_length=5, budget=None):
     """
     Возвращает:
     1) node_scores: {узел: графовый скор}
     2) paths_between_nodes: {(node1, node2): путь с типами связей}
     3) intermediate_nodes: список промежуточных узлов, которых нет в nodes
+    budget — бюджет стадии (app/rag/deadline.py): пары перебираются, пока он не исчерпан, каждый запрос
+    ограничен остатком бюджета. Тогда метрики частичные — по парам, которые успели посчитать.
     """
     node_scores = {node: 0.0 for node in nodes}
     paths_between_nodes = {}
     intermediate_nodes = set()
+    pairs = list(combinations(nodes, 2))
 
-    with driver.session() as session:
-        for node1, node2 in combinations(nodes, 2):
+    with get_driver().session() as session:
+        for done, (node1, node2) in enumerate(pairs):
+            if budget is not None and budget.exhausted():
+                budget.shrink(f"{done}/{len(pairs)} pairs")
+                break
             query = f"""
             MATCH p=(a {{title: $node1}})-[rels*..{max_length}]-(b {{title: $node2}})
             WHERE all(r IN rels 
@@ -97,7 +127,17 @@ def calculate_graph_metrics(nodes: list, max_length=5):
             ORDER BY path_length ASC
             LIMIT 1
             """
-            record = session.run(query, node1=node1, node2=node2).single()
+            remaining = budget.remaining() if budget is not None else math.inf
+            timeout = None if math.isinf(remaining) else max(remaining, 0.1)
+            try:
+                record = session.run(Query(query, timeout=timeout), node1=node1, node2=node2).single()
+            except Neo4jError as e:
+                if "TimedOut" not in (e.code or ""):
+                    raise
+                # таймаут транзакции: по бюджету стадии или серверный (dbms.transaction.timeout)
+                if budget is not None:
+                    budget.shrink(f"pair query timed out, {done}/{len(pairs)} pairs")
+                break
             if record and record["path_length"] is not None:
                 dist = record["path_length"]
                 score = 1 / (1 + dist)
@@ -127,3 +167,17 @@ def calculate_graph_metrics(nodes: list, max_length=5):
                 node_scores[node2] += 0
 
     return node_scores, paths_between_nodes, list(intermediate_nodes)
+
+
+def get_labels(titles: list, batch_size: int = 1000) -> dict:
+    """Метки узлов графа по названиям: {title: [labels]}. Названия без узла в ответ не попадают."""
+    labels = {}
+    with get_driver().session() as session:
+        for i in range(0, len(titles), batch_size):
+            result = session.run(
+                "MATCH (n) WHERE n.title IN $titles RETURN n.title AS title, labels(n) AS labels",
+                titles=titles[i:i + batch_size],
+            )
+            for record in result:
+                labels.setdefault(record["title"], record["labels"])
+    return labels
@@ -4,7 +4,7 @@ from aiogram import Dispatcher
 from aiogram.types import Message, ContentType
 
 from app.utils import send_typing_action, safe_send_error
-from app.rag.rag_service import get_rag_answer
+from app.rag.rag_service import get_rag_answer, reset_conversation
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,8 @@ def register_handlers(dp: Dispatcher):
                 return
 
             if message.text.startswith("/"):
+                # любая команда (/start) начинает диалог заново
+                reset_conversation(message.chat.id)
                 await message.answer("Привет! Я бот по Warhammer 40k. Задай мне любой вопрос о вселенной.")
                 return
 
@@ -27,7 +29,7 @@ def register_handlers(dp: Dispatcher):
             stop_typing = asyncio.Event()
             typing_task = asyncio.create_task(send_typing_action(message.bot, message.chat.id, stop_typing))
 
-            response_chunks = await get_rag_answer(message.text)
+            response_chunks = await get_rag_answer(message.text, chat_id=message.chat.id)
 
             stop_typing.set()
             await typing_task
@@ -4,26 +4,68 @@ from typing import List, Tuple, Set
 import re
 import sqlite3
 import logging
+import threading
 
 from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsNERTagger, Doc
 from razdel import tokenize as razdel_tokenize
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 from pymorphy2 import MorphAnalyzer
 from stop_words import get_stop_words
 import pickle
 
+from app.db import get_connection
+
 # ---------- Логгер ----------
 logger = logging.getLogger(__name__)
 
 GAZETTEER_FILE = "gazetteer.pkl"
-segmenter = Segmenter()
-emb = NewsEmbedding()
-ner_tagger = NewsNERTagger(emb)
-morph_vocab = MorphVocab()
+
+# ---------- Ленивые ресурсы ----------
+# Модели Natasha, словари pymorphy и газеттир грузятся при первом обращении
+# (или явно через init_ner() на старте приложения), а не при импорте модуля.
+_resources = {}
+_resources_lock = threading.RLock()
+
+
+def _get_resource(name: str, factory):
+    resource = _resources.get(name)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+
+def _load_natasha():
+    emb = NewsEmbedding()
+    return Segmenter(), NewsNERTagger(emb), MorphVocab()
+
+
+def get_natasha():
+    """Возвращает (segmenter, ner_tagger, morph_vocab)."""
+    return _get_resource("natasha", _load_natasha)
+
+
+def get_morph() -> MorphAnalyzer:
+    return _get_resource("morph", MorphAnalyzer)
+
+
+def get_gazetteer() -> List[str]:
+    return _get_resource("gazetteer", build_or_load_gazetteer)
+
+
+def init_ner():
+    """Загружает все ресурсы NER заранее (для bootstrap и прогрева воркеров)."""
+    get_morph()
+    get_natasha()
+    return get_gazetteer()
 
 # ---------- Загрузка заголовков из БД ----------
 def extract_named_entities(text: str) -> Set[str]:
     """Возвращает множество нормализованных именованных сущностей из текста."""
+    segmenter, ner_tagger, morph_vocab = get_natasha()
     doc = Doc(text)
     doc.segment(segmenter)
     doc.tag_ner(ner_tagger)
@@ -37,9 +79,9 @@ STOP_WORDS = set(get_stop_words("ru"))  # русские стоп-слова
 
 def load_titles_with_entities(db_path: str = 'warhammer_articles.db', limit: int = 50000) -> List[str]:
     enriched_entities = set()
-    morph = MorphAnalyzer()
+    morph = get_morph()
     try:
-        conn = sqlite3.connect(db_path)
+        conn = get_connection(db_path, readonly=True)
         cursor = conn.cursor()
         cursor.execute('''
             SELECT original_title, final_title, entities 
@@ -73,9 +115,6 @@ def load_titles_with_entities(db_path: str = 'warhammer_articles.db', limit: int
 
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
     return list(enriched_entities)
 
@@ -95,16 +134,6 @@ def build_or_load_gazetteer(db_path='warhammer_articles.db', limit=50000):
         logger.info(f"Saved gazetteer to {GAZETTEER_FILE}")
         return gazetteer
 
-# Пример загрузки
-GAZETTEER = build_or_load_gazetteer()
-
-# ---------- Natasha / Morph ----------
-segmenter = Segmenter()
-emb = NewsEmbedding()
-ner_tagger = NewsNERTagger(emb)
-morph_vocab = MorphVocab()
-morph = MorphAnalyzer()
-
 @dataclass
 class Entity:
     text: str
@@ -116,11 +145,13 @@ class Entity:
 # ---------- Утилиты ----------
 def _lemmatize(s: str) -> str:
     tokens = [t.text for t in razdel_tokenize(s.lower()) if re.search(r"\w", t.text)]
+    morph = get_morph()
     lemmas = [morph.parse(tok)[0].normal_form for tok in tokens]
     return " ".join(lemmas)
 
 # ---------- NER через Natasha ----------
 def natasha_ner(text: str) -> List[Entity]:
+    segmenter, ner_tagger, morph_vocab = get_natasha()
     doc = Doc(text)
     doc.segment(segmenter)
     doc.tag_ner(ner_tagger)
@@ -137,27 +168,33 @@ def natasha_ner(text: str) -> List[Entity]:
     return ents
 
 # ---------- NER через словарь ----------
+def get_gazetteer_lower() -> List[str]:
+    return _get_resource("gazetteer_lower", lambda: [name.lower() for name in get_gazetteer()])
+
+
 def gazetteer_ner(text: str, cutoff: int = 82) -> List[Entity]:
     tokens = list(razdel_tokenize(text))
     lowered_tokens = [tok.text.lower() for tok in tokens]
+    gazetteer = get_gazetteer()
+    lowered_gazetteer = get_gazetteer_lower()
     ents: List[Entity] = []
 
     for i in range(len(tokens)):
         for j in range(i+1, min(i+6, len(tokens))+1):  # ngram длиной до 5 слов
             fragment = " ".join(lowered_tokens[i:j])
             orig_fragment = text[tokens[i].start:tokens[j-1].stop]  # корректный фрагмент в тексте
-            for name in GAZETTEER:
-                score = fuzz.ratio(fragment, name.lower())
-                if score >= cutoff:
-                    start = tokens[i].start
-                    end = tokens[j-1].stop
-                    ents.append(Entity(
-                        text=orig_fragment,
-                        span=(start, end),
-                        canonical=name,
-                        score=float(score),
-                        source="gazetteer"
-                    ))
+            # сравнение со всем словарём — в C (rapidfuzz), совпадения в порядке словаря, как при переборе
+            matches = process.extract(fragment, lowered_gazetteer, scorer=fuzz.ratio, score_cutoff=cutoff, limit=None)
+            for _, score, index in sorted(matches, key=lambda m: m[2]):
+                start = tokens[i].start
+                end = tokens[j-1].stop
+                ents.append(Entity(
+                    text=orig_fragment,
+                    span=(start, end),
+                    canonical=gazetteer[index],
+                    score=float(score),
+                    source="gazetteer"
+                ))
     return ents
 
 
@@ -200,6 +237,7 @@ def inflect_to_case(word: str, canonical: str) -> str:
     Приводит canonical к падежу исходного слова.
     Сохраняет заглавную букву, если исходное слово было с большой.
     """
+    morph = get_morph()
     parsed = morph.parse(word)[0]
     target = morph.parse(canonical)[0]
 
@@ -0,0 +1,181 @@
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import LLM_REQUEST_TOKEN_BUDGET, LLM_REQUEST_CALL_BUDGET, ACCOUNTING_REPORT_EVERY
+
+logger = logging.getLogger(__name__)
+
+
+def token_usage(message) -> Tuple[int, int]:
+    """(токены запроса, токены ответа) из ответа чат-модели: usage_metadata или token_usage провайдера."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        return usage.get("input_tokens", 0) or 0, usage.get("output_tokens", 0) or 0
+    usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+
+
+def _role_counters() -> Dict:
+    return {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0}
+
+
+class RequestLedger:
+    """
+    Учёт LLM одного вопроса по ролям (decomposer, agent, answer): вызовы бэкендов, в том числе
+    хеджированные, токены запроса и ответа, суммарная задержка. Бюджеты вопроса — токены и вызовы
+    (0 — без ограничения); превысив их, стадии до ответа переходят на дешёвый путь без LLM.
+    """
+
+    def __init__(self, token_budget: int = LLM_REQUEST_TOKEN_BUDGET, call_budget: int = LLM_REQUEST_CALL_BUDGET):
+        self.token_budget = token_budget
+        self.call_budget = call_budget
+        self.started = time.monotonic()
+        self.roles: Dict[str, Dict] = {}
+        self.downgraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def record(self, role: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0, failed: bool = False):
+        with self._lock:
+            counters = self.roles.setdefault(role, _role_counters())
+            counters["calls"] += 1
+            counters["errors"] += failed
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["latency_s"] += latency
+
+    @property
+    def calls(self) -> int:
+        with self._lock:
+            return sum(c["calls"] for c in self.roles.values())
+
+    @property
+    def tokens(self) -> int:
+        with self._lock:
+            return sum(c["prompt_tokens"] + c["completion_tokens"] for c in self.roles.values())
+
+    def over_budget(self) -> Optional[str]:
+        """Причина, если бюджет вопроса исчерпан, иначе None."""
+        tokens, calls = self.tokens, self.calls
+        if self.token_budget and tokens >= self.token_budget:
+            return f"{tokens} of {self.token_budget} tokens"
+        if self.call_budget and calls >= self.call_budget:
+            return f"{calls} of {self.call_budget} calls"
+        return None
+
+    def summary(self) -> str:
+        with self._lock:
+            roles = ", ".join(
+                f"{role} {c['calls']}/{c['prompt_tokens']}+{c['completion_tokens']}/{c['latency_s']:.1f}s"
+                for role, c in self.roles.items()
+            )
+        return f"{self.calls} calls, {self.tokens} tokens (role calls/prompt+completion/latency: {roles or '-'})"
+
+
+current_ledger_var: ContextVar[Optional[RequestLedger]] = ContextVar("current_ledger", default=None)
+
+
+def current_ledger() -> Optional[RequestLedger]:
+    """Учёт текущего вопроса; вне вопроса (бенчмарки, индексация) — None."""
+    return current_ledger_var.get()
+
+
+def budget_exceeded(stage: str) -> bool:
+    """Стадия проверяет бюджет вопроса перед вызовом LLM; True — пора на дешёвый путь (отмечается в учёте)."""
+    ledger = current_ledger()
+    reason = ledger.over_budget() if ledger is not None else None
+    if reason is None:
+        return False
+    if stage not in ledger.downgraded:
+        ledger.downgraded.append(stage)
+        logger.info(f"LLM budget exceeded ({reason}): {stage} switches to the path without LLM")
+    return True
+
+
+class LLMAccounting:
+    """
+    Сводка учёта LLM по всем вопросам воркера: итоги по ролям (в том числе брошенные хеджированные вызовы,
+    завершившиеся после ответа), распределение токенов и вызовов на вопрос, превышения бюджета
+    и переходы стадий на дешёвый путь. Каждые ACCOUNTING_REPORT_EVERY вопросов сводка пишется в лог.
+    """
+
+    def __init__(self, report_every: int = ACCOUNTING_REPORT_EVERY):
+        self.report_every = report_every
+        self.requests = 0
+        self.over_budget_requests = 0
+        self.roles: Dict[str, Dict] = {}
+        self.downgrades = Counter()
+        self._request_tokens = deque(maxlen=1000)
+        self._request_calls = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def record_call(self, role: str, latency: float, prompt_tokens: int, completion_tokens: int, failed: bool):
+        with self._lock:
+            counters = self.roles.setdefault(role, {**_role_counters(), "latencies": deque(maxlen=1000)})
+            counters["calls"] += 1
+            counters["errors"] += failed
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["latency_s"] += latency
+            counters["latencies"].append(latency)
+
+    def close(self, ledger: RequestLedger):
+        """Итог вопроса: строка в лог и вклад в распределения; раз в report_every вопросов — сводка."""
+        logger.info(f"LLM usage: {ledger.summary()}")
+        with self._lock:
+            self.requests += 1
+            self.over_budget_requests += bool(ledger.downgraded)
+            self.downgrades.update(ledger.downgraded)
+            self._request_tokens.append(ledger.tokens)
+            self._request_calls.append(ledger.calls)
+            if self.report_every and self.requests % self.report_every == 0:
+                logger.info(f"LLM accounting over {self.requests} requests: {self._stats()}")
+
+    def _stats(self) -> Dict:
+        roles = {}
+        for role, counters in self.roles.items():
+            latencies = list(counters["latencies"])
+            roles[role] = {
+                **{key: value for key, value in counters.items() if key not in ("latencies", "latency_s")},
+                "latency_p50_s": round(float(np.percentile(latencies, 50)), 3),
+                "latency_p95_s": round(float(np.percentile(latencies, 95)), 3),
+            }
+        tokens, calls = list(self._request_tokens), list(self._request_calls)
+        return {
+            "requests": self.requests,
+            "over_budget": self.over_budget_requests,
+            "downgrades": dict(self.downgrades),
+            "tokens_per_request_p50": round(float(np.percentile(tokens, 50))) if tokens else 0,
+            "tokens_per_request_p95": round(float(np.percentile(tokens, 95))) if tokens else 0,
+            "calls_per_request_p50": round(float(np.percentile(calls, 50)), 1) if calls else 0,
+            "roles": roles,
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return self._stats()
+
+
+_accounting = None
+_accounting_lock = threading.Lock()
+
+
+def get_accounting() -> LLMAccounting:
+    global _accounting
+    with _accounting_lock:
+        if _accounting is None:
+            _accounting = LLMAccounting()
+        return _accounting
+
+
+def record_call(ledger: Optional[RequestLedger], role: str, latency: float, message=None, failed: bool = False):
+    """Один вызов бэкенда: в учёт вопроса (если он есть) и в сводку воркера."""
+    prompt_tokens, completion_tokens = token_usage(message) if message is not None else (0, 0)
+    if ledger is not None:
+        ledger.record(role, latency, prompt_tokens, completion_tokens, failed)
+    get_accounting().record_call(role, latency, prompt_tokens, completion_tokens, failed)
@@ -1,14 +1,15 @@
+import logging
 from typing import Annotated, List, Dict
 from typing_extensions import TypedDict
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, AIMessage
 from langgraph.graph import StateGraph, START, END, add_messages
 from langchain.tools import tool
-from neo4j import GraphDatabase
-from app.graph.node import get_node_info
-from app.config import NEO4J_USER, NEO4J_PASSWORD, NEO4J_URI
+from app.graph.node import get_node_info, get_driver
+from app.rag.llm_router import LLMTimeoutError, LLMUnavailableError
+from app.rag.accounting import budget_exceeded
 from langsmith import traceable
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+logger = logging.getLogger(__name__)
 
 class GraphState(TypedDict):
     messages: Annotated[list, add_messages]
@@ -57,7 +58,7 @@ def expand_nodes_via_relation(source_node_title: str, relation_type: str):
     """
     clean_rel = relation_type.strip("()[]'\" ").upper()
     
-    with driver.session() as session:
+    with get_driver().session() as session:
         query = """
         MATCH (n {title: $source_title})-[r]-(m)
         WHERE type(r) = $rel_type OR type(r) = toUpper($rel_type)
@@ -83,6 +84,7 @@ class GraphContextOptimizer:
         self.model_with_tools = model.bind_tools(self.tools)
         self.tools_by_name = {tool.name: tool for tool in self.tools}
         self.max_iterations = max_iterations
+        self.budget = None
         self.graph = self._build_graph()
 
     def _llm_node(self, state: GraphState):
@@ -107,8 +109,22 @@ class GraphContextOptimizer:
 """)
         if state.get("llm_calls", 0) >= self.max_iterations:
             return {"messages": [AIMessage(content="ГОТОВО")]}
+        if self.budget is not None and self.budget.exhausted():
+            # время стадий вышло: ответ строится по графу, очищенному за прошлые итерации
+            self.budget.shrink(f"stopped after {state.get('llm_calls', 0)} iterations")
+            return {"messages": [AIMessage(content="ГОТОВО")]}
+        if budget_exceeded("agent"):
+            # бюджет LLM вопроса исчерпан: токены остаются на ответ
+            return {"messages": [AIMessage(content="ГОТОВО")]}
 
-        response = self.model_with_tools.invoke([system_msg] + state["messages"])
+        try:
+            response = self.model_with_tools.invoke([system_msg] + state["messages"])
+        except (LLMTimeoutError, LLMUnavailableError) as e:
+            # граф остаётся таким, каким его успели очистить: ответ важнее ещё одного шага агента
+            logger.warning(f"Graph agent stopped: {e}")
+            if self.budget is not None and self.budget.exhausted():
+                self.budget.shrink(f"LLM call cut by deadline after {state.get('llm_calls', 0)} iterations")
+            return {"messages": [AIMessage(content="ГОТОВО")], "llm_calls": state.get("llm_calls", 0) + 1}
         return {"messages": [response], "llm_calls": state.get("llm_calls", 0) + 1}
 
     def _tools_node(self, state: GraphState):
@@ -155,7 +171,9 @@ class GraphContextOptimizer:
         builder.add_edge("tools", "llm")
         return builder.compile()
 
-    def optimize(self, query: str, initial_payload: dict) -> dict:
+    def optimize(self, query: str, initial_payload: dict, budget=None) -> dict:
+        """budget — бюджет стадии (app/rag/deadline.py): когда он исчерпан, новые итерации не начинаются."""
+        self.budget = budget
         state = {
             "messages": [HumanMessage(content=query)],
             "graph_payload": initial_payload,
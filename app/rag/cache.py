@@ -0,0 +1,138 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.config import (
+    VECTOR_BACKEND, FLAT_INDEX_DIR, CHROMA_PERSIST_DIR, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_FILE = "index_version"
+# как часто перечитывать штамп версии индекса (с): не на каждый запрос к кешу
+VERSION_CHECK_INTERVAL = 5.0
+
+
+# ---------- Версия индекса ----------
+def stamp_index_version(directory: Path) -> str:
+    """Записывает новый штамп версии рядом с индексом; вызывается при каждом построении и обновлении."""
+    directory = Path(directory)
+    version = uuid.uuid4().hex
+    tmp_path = directory / (INDEX_VERSION_FILE + ".tmp")
+    tmp_path.write_text(version, encoding="utf-8")
+    os.replace(tmp_path, directory / INDEX_VERSION_FILE)
+    logger.info(f"Index version {version} stamped in {directory}")
+    return version
+
+
+def active_index_dir() -> Path:
+    return FLAT_INDEX_DIR if VECTOR_BACKEND == "flat" else CHROMA_PERSIST_DIR
+
+
+_version = {"value": None, "checked_at": 0.0}
+
+
+def current_index_version() -> str:
+    now = time.monotonic()
+    if _version["value"] is None or now - _version["checked_at"] > VERSION_CHECK_INTERVAL:
+        try:
+            _version["value"] = (active_index_dir() / INDEX_VERSION_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            _version["value"] = "unversioned"
+        _version["checked_at"] = now
+    return _version["value"]
+
+
+# ---------- Кеш ----------
+class RetrievalCache:
+    """
+    LRU-кеш результатов поиска с TTL. Записи привязаны к версии индекса: при смене штампа
+    (переиндексация, новый плоский индекс, шарды) кеш очищается целиком.
+    maxsize=0 отключает кеш.
+    """
+
+    def __init__(self, name: str, maxsize: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self):
+        version = current_index_version()
+        if version != self._version:
+            if self._version is not None:
+                self._counters["invalidations"] += 1
+                logger.info(f"[cache:{self.name}] index version changed, dropping {len(self._data)} entries")
+            self._data.clear()
+            self._version = version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.maxsize:
+            return None
+        with self._lock:
+            self._check_version()
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._check_version()
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "size": len(self._data),
+                "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+_caches: Dict[str, RetrievalCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, maxsize: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL) -> RetrievalCache:
+    """Кеш с таким именем; maxsize и ttl применяются при первом создании."""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = RetrievalCache(name, maxsize, ttl)
+        return _caches[name]
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,237 @@
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Callable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import CONTEXT_MAX_TOKENS, CONTEXT_DEDUP_THRESHOLD, CONTEXT_TOKENIZER
+
+logger = logging.getLogger(__name__)
+
+# разделитель документов в create_stuff_documents_chain
+DOCUMENT_SEPARATOR = "\n\n"
+# каждые столько запросов в лог пишется распределение размеров контекста
+REPORT_EVERY = 100
+
+
+@dataclass
+class NodeContext:
+    """Материал одного узла графа для промпта."""
+    title: str
+    description: str
+    chunks: List[Tuple[Document, float]]
+    metadata: Dict
+    score: float = 0.0
+    kept: List[bool] = field(default_factory=list)
+
+
+def render_node(title: str, description: str, chunks: List[Document]) -> str:
+    content_parts = [f"=== СУЩНОСТЬ: {title} ==="]
+    if description:
+        content_parts.append(f"[ОПИСАНИЕ]: {description}")
+    if chunks:
+        content_parts.append("[ДОПОЛНИТЕЛЬНЫЕ ДАННЫЕ ИЗ АРХИВОВ]:")
+        for i, chunk in enumerate(chunks, 1):
+            content_parts.append(f"Фрагмент {i}:\n{chunk.page_content}")
+    return "\n\n".join(content_parts)
+
+
+class TokenCounter:
+    """Подсчёт токенов через tiktoken; без словаря BPE (нет сети) — грубая оценка по символам."""
+
+    def __init__(self, encoding: str = CONTEXT_TOKENIZER):
+        self.encoding_name = encoding
+        self._encoding = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def _get_encoding(self):
+        with self._lock:
+            if self._encoding is None and not self._failed:
+                try:
+                    import tiktoken
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    self._failed = True
+                    logger.warning(f"tiktoken encoding {self.encoding_name} unavailable ({e}), estimating tokens by length")
+            return self._encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // 3 + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+def _percentiles(values) -> str:
+    if not values:
+        return "n/a"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50={p50:.0f} p95={p95:.0f} max={max(values)}"
+
+
+class ContextPacker:
+    """
+    Упаковывает материал узлов в промпт не больше max_tokens токенов:
+    1. почти дубликаты чанков (косинус эмбеддингов >= dedup_threshold) отбрасываются,
+       остаётся более релевантный;
+    2. описания узлов из графа входят первыми, в порядке оценки узла;
+    3. оставшийся бюджет делится между узлами пропорционально весу (оценка графа + лучший чанк),
+       каждый узел заполняется своими чанками по убыванию релевантности, остаток бюджета
+       раздаётся вторым проходом.
+    max_tokens=0 отключает упаковку.
+    """
+
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+                 counter: Optional[TokenCounter] = None):
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.counter = counter or TokenCounter()
+        self._before = deque(maxlen=1000)
+        self._after = deque(maxlen=1000)
+        self._packed = 0
+        self._lock = threading.Lock()
+
+    # ---------- Почти дубликаты ----------
+    def _deduplicate(self, nodes: List[NodeContext], embed: Callable[[List[Document]], np.ndarray]) -> int:
+        items = [(score, n, i) for n, node in enumerate(nodes) for i, (_, score) in enumerate(node.chunks)]
+        if len(items) < 2 or self.dedup_threshold >= 1.0:
+            return 0
+        items.sort(key=lambda x: -x[0])
+        vectors = np.asarray(embed([nodes[n].chunks[i][0] for _, n, i in items]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarities = vectors @ vectors.T
+
+        kept_rows: List[int] = []
+        dropped = 0
+        for row, (_, n, i) in enumerate(items):
+            if kept_rows and similarities[row, kept_rows].max() >= self.dedup_threshold:
+                nodes[n].kept[i] = False
+                dropped += 1
+            else:
+                kept_rows.append(row)
+        return dropped
+
+    # ---------- Бюджет ----------
+    def _allocate(self, nodes: List[NodeContext]) -> Tuple[List[str], int]:
+        """Отмечает в node.kept чанки, попавшие в бюджет; возвращает описания узлов (возможно, пустые)."""
+        separator = self.counter.count(DOCUMENT_SEPARATOR)
+        chunks_header = self.counter.count("[ДОПОЛНИТЕЛЬНЫЕ ДАННЫЕ ИЗ АРХИВОВ]:") + separator
+        order = sorted(range(len(nodes)), key=lambda n: -nodes[n].score)
+        descriptions = ["" for _ in nodes]
+        included = [False for _ in nodes]
+        used = 0
+
+        # описания — основа ответа, входят первыми; узел, чьё описание не помещается, остаётся без него
+        for n in order:
+            node = nodes[n]
+            overhead = separator + (chunks_header if node.chunks else 0)
+            cost = self.counter.count(render_node(node.title, node.description, [])) + overhead
+            if used + cost <= self.max_tokens:
+                descriptions[n] = node.description
+                included[n] = True
+                used += cost
+            elif node.description:
+                cost = self.counter.count(render_node(node.title, "", [])) + overhead
+                if used + cost <= self.max_tokens:
+                    included[n] = True
+                    used += cost
+
+        chunk_costs = [
+            [self.counter.count(f"Фрагмент 00:\n{doc.page_content}") + separator for doc, _ in node.chunks]
+            for node in nodes
+        ]
+        best = max((score for node in nodes for _, score in node.chunks), default=0.0) or 1.0
+        weights = [
+            (1.0 + node.score + max((s for _, s in node.chunks), default=0.0) / best) if included[n] else 0.0
+            for n, node in enumerate(nodes)
+        ]
+        remaining = self.max_tokens - used
+        total_weight = sum(weights) or 1.0
+        selected = [[False] * len(node.chunks) for node in nodes]
+
+        def fill(n, budget):
+            spent = 0
+            for i in sorted(range(len(nodes[n].chunks)), key=lambda i: -nodes[n].chunks[i][1]):
+                if not nodes[n].kept[i] or selected[n][i]:
+                    continue
+                if spent + chunk_costs[n][i] > budget:
+                    continue
+                selected[n][i] = True
+                spent += chunk_costs[n][i]
+            return spent
+
+        # первый проход — доля каждого узла, второй — остаток по порядку важности узлов
+        spent_total = sum(fill(n, remaining * weights[n] / total_weight) for n in order if included[n])
+        left = remaining - spent_total
+        for n in order:
+            if included[n] and left > 0:
+                left -= fill(n, left)
+
+        for n, node in enumerate(nodes):
+            node.kept = selected[n]
+            if not included[n]:
+                node.kept = [False] * len(node.chunks)
+        return descriptions, sum(included)
+
+    # ---------- Сборка ----------
+    def _render(self, nodes: List[NodeContext], descriptions: Optional[List[str]] = None) -> List[Document]:
+        docs = []
+        for n, node in enumerate(nodes):
+            description = node.description if descriptions is None else descriptions[n]
+            chunks = [doc for i, (doc, _) in enumerate(node.chunks) if descriptions is None or node.kept[i]]
+            if descriptions is not None and not description and not chunks:
+                continue
+            docs.append(Document(page_content=render_node(node.title, description, chunks), metadata=node.metadata))
+        return docs
+
+    def _tokens(self, docs: List[Document]) -> int:
+        return self.counter.count(DOCUMENT_SEPARATOR.join(doc.page_content for doc in docs))
+
+    def pack(self, nodes: List[NodeContext], embed: Callable[[List[Document]], np.ndarray]) -> List[Document]:
+        """embed — эмбеддинги чанков (строка на чанк) для поиска почти дубликатов."""
+        unpacked = self._render(nodes)
+        if not self.max_tokens or not nodes:
+            return unpacked
+        before = self._tokens(unpacked)
+
+        for node in nodes:
+            node.kept = [True] * len(node.chunks)
+        dropped = self._deduplicate(nodes, embed)
+        descriptions, kept_nodes = self._allocate(nodes)
+        packed = self._render(nodes, descriptions)
+        after = self._tokens(packed)
+
+        chunks_total = sum(len(node.chunks) for node in nodes)
+        chunks_kept = sum(sum(node.kept) for node in nodes)
+        logger.info(
+            f"Context packed: {before} -> {after} tokens (limit {self.max_tokens}), "
+            f"nodes {kept_nodes}/{len(nodes)}, chunks {chunks_kept}/{chunks_total}, near-duplicates {dropped}"
+        )
+        with self._lock:
+            self._before.append(before)
+            self._after.append(after)
+            self._packed += 1
+            if self._packed % REPORT_EVERY == 0:
+                logger.info(
+                    f"Context tokens over last {len(self._after)} requests: "
+                    f"before {_percentiles(self._before)}, after {_percentiles(self._after)}"
+                )
+        return packed
+
+    def stats(self) -> Dict[str, str]:
+        with self._lock:
+            return {"requests": self._packed, "before": _percentiles(self._before), "after": _percentiles(self._after)}
+
+
+_packer = None
+
+
+def get_context_packer() -> ContextPacker:
+    global _packer
+    if _packer is None:
+        _packer = ContextPacker()
+    return _packer
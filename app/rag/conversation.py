@@ -0,0 +1,114 @@
+import re
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Optional, Set
+
+from langchain_core.documents import Document
+
+from app.rag.cache import RetrievalCache, get_cache
+from app.config import CONVERSATION_MAX_CHATS, CONVERSATION_TTL, FOLLOWUP_MAX_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Чат текущего запроса: выставляется в get_rag_answer, asyncio.to_thread переносит его в поток ретривера
+current_chat: ContextVar[Optional[int]] = ContextVar("current_chat", default=None)
+
+# Слова, отсылающие к предыдущему ответу («а кто его брат?», «где он родился?»)
+ANAPHORA = {
+    "он", "она", "оно", "они", "его", "её", "ее", "их", "ему", "ей", "им", "ими", "него", "неё", "нее", "них",
+    "нему", "ней", "ним", "нём", "нем", "этот", "эта", "это", "эти", "этого", "этой", "этих", "этому", "этим",
+    "тот", "та", "те", "того", "той", "тех", "там", "туда", "оттуда", "тогда", "тоже", "также", "ещё", "еще",
+}
+# Уточнение, начатое с союза: «а почему?», «и что было дальше?»
+FOLLOWUP_OPENERS = {"а", "и", "ну", "тогда"}
+# Сколько вводных чанков берётся для узла, добавленного агентом при уточнении
+FOLLOWUP_LEAD_CHUNKS = 2
+
+
+@dataclass
+class ConversationTurn:
+    """Итог последнего вопроса чата: найденные сущности, очищенный граф и ID чанков по узлам."""
+    query: str
+    entities: List[str]
+    payload: Dict
+    chunks: Dict[str, List[Tuple[int, float]]]
+    article_ids: Set[int] = field(default_factory=set)
+    follow_ups: int = 0
+
+    @classmethod
+    def from_context(
+        cls, query: str, entities: List[str], payload: Dict,
+        doc_to_chunks: Dict[str, List[Tuple[Document, float]]], follow_ups: int = 0,
+    ) -> "ConversationTurn":
+        chunks = {
+            title: [(doc.metadata["chunk_id"], score) for doc, score in chunks_scores if "chunk_id" in doc.metadata]
+            for title, chunks_scores in doc_to_chunks.items()
+        }
+        article_ids = {
+            doc.metadata["article_id"]
+            for chunks_scores in doc_to_chunks.values()
+            for doc, _ in chunks_scores
+            if doc.metadata.get("article_id") is not None
+        }
+        return cls(query, entities, payload, chunks, article_ids, follow_ups)
+
+    def chunk_ids(self) -> List[int]:
+        return [chunk_id for chunks in self.chunks.values() for chunk_id, _ in chunks]
+
+
+def is_follow_up(query: str, turn: ConversationTurn) -> bool:
+    """
+    Уточняющий вопрос: короткий, со ссылкой на предыдущий ответ (местоимение или начальный союз)
+    и без названий статей, которых не было в прошлом ответе. Иначе — новая тема, полный конвейер.
+    """
+    from app.rag.lexical import get_lexical_index
+
+    words = re.findall(r"\w+", query.lower())
+    if not words or len(words) > FOLLOWUP_MAX_WORDS:
+        return False
+    if words[0] not in FOLLOWUP_OPENERS and not ANAPHORA.intersection(words):
+        return False
+    new_articles = [a for a in get_lexical_index().find_articles(query) if a not in turn.article_ids]
+    return not new_articles
+
+
+def contextualize(query: str, turn: ConversationTurn) -> str:
+    """Запрос для агента графа: уточнение само по себе не называет сущность, о которой идёт речь."""
+    topic = f"{turn.query} ({', '.join(turn.entities)})" if turn.entities else turn.query
+    return f"{topic}\nУточнение: {query}"
+
+
+class ConversationMemory:
+    """
+    Последний ход каждого чата с TTL и ограничением числа чатов (LRU). Хранится в RetrievalCache:
+    при переиндексации ID чанков меняются, и память сбрасывается вместе со штампом версии индекса.
+    Память своя у каждого процесса: при нескольких воркерах уточнение может попасть в другой процесс
+    и пойти полным конвейером.
+    """
+
+    def __init__(self, cache: RetrievalCache):
+        self.cache = cache
+
+    def recall(self, chat_id: Optional[int]) -> Optional[ConversationTurn]:
+        if chat_id is None:
+            return None
+        return self.cache.get(chat_id)
+
+    def remember(self, chat_id: Optional[int], turn: ConversationTurn):
+        if chat_id is not None:
+            self.cache.put(chat_id, turn)
+
+    def forget(self, chat_id: Optional[int]):
+        if chat_id is not None:
+            self.cache.pop(chat_id)
+
+
+_memory = None
+
+
+def get_conversation_memory() -> ConversationMemory:
+    global _memory
+    if _memory is None:
+        _memory = ConversationMemory(get_cache("conversation", CONVERSATION_MAX_CHATS, CONVERSATION_TTL))
+    return _memory
@@ -0,0 +1,157 @@
+import time
+import logging
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict
+
+import numpy as np
+
+from app.config import EMBEDDING_MODEL_NAME, CPU_POOL_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# ---------- Состояние процесса-воркера ----------
+_worker_embeddings = None
+_worker_normalize = None
+
+
+def _init_worker(model_path: str):
+    """Прогревает воркер: грузит модель эмбеддингов, газеттир и морфологию один раз."""
+    global _worker_embeddings, _worker_normalize
+    import torch
+    from app.rag.embedding_model import MLMEmbeddings
+    from app.rag.NER import normalize_text_entities, init_ner
+
+    # Параллелизм даёт пул процессов, внутри воркера torch не должен плодить потоки
+    torch.set_num_threads(1)
+    _worker_embeddings = MLMEmbeddings(model_path, device="cpu").load()
+    _worker_normalize = normalize_text_entities
+    init_ner()
+
+    _worker_embeddings.embed_array(["прогрев"])
+    _worker_normalize("прогрев")
+
+
+def _run_normalize(text: str, submitted_at: float):
+    started = time.time()
+    result = _worker_normalize(text)
+    return result, started - submitted_at, time.time() - started
+
+
+def _run_embed(texts: List[str], submitted_at: float):
+    started = time.time()
+    # float32-буфер вместо списка python-float: в разы меньше данных через pipe
+    result = _worker_embeddings.embed_array(texts).tobytes()
+    return result, started - submitted_at, time.time() - started
+
+
+class CPUPool:
+    """
+    Пул процессов для CPU-bound стадий запроса (нормализация сущностей, эмбеддинг запроса),
+    чтобы они не конкурировали за GIL с остальным процессом.
+    При workers=0 стадии выполняются в текущем процессе (поведение по умолчанию).
+    """
+
+    def __init__(self, workers: int = CPU_POOL_WORKERS, model_path: str = EMBEDDING_MODEL_NAME):
+        self.workers = workers
+        self.model_path = model_path
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"calls": 0, "queue_time": 0.0, "exec_time": 0.0, "max_queue_time": 0.0})
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: безопасно относительно потоков torch/chroma в родителе
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_path,),
+                )
+                logger.info(f"Started CPU pool with {self.workers} workers")
+            return self._executor
+
+    def warmup(self):
+        """Поднимает все воркеры заранее, чтобы первый запрос не платил за загрузку моделей."""
+        if not self.workers:
+            return
+        executor = self._get_executor()
+        futures = [executor.submit(_run_normalize, "прогрев", time.time()) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    def _record(self, stage: str, queue_time: float, exec_time: float):
+        with self._lock:
+            s = self._stats[stage]
+            s["calls"] += 1
+            s["queue_time"] += queue_time
+            s["exec_time"] += exec_time
+            s["max_queue_time"] = max(s["max_queue_time"], queue_time)
+        logger.debug(f"[cpu_pool] {stage}: queue={queue_time * 1000:.1f}ms exec={exec_time * 1000:.1f}ms")
+
+    def normalize_many(self, texts: List[str]) -> List[str]:
+        """Нормализует сущности в текстах параллельно."""
+        if not self.workers:
+            from app.rag.NER import normalize_text_entities
+            results = []
+            for text in texts:
+                started = time.time()
+                results.append(normalize_text_entities(text))
+                self._record("normalize", 0.0, time.time() - started)
+            return results
+
+        executor = self._get_executor()
+        futures = [executor.submit(_run_normalize, text, time.time()) for text in texts]
+        results = []
+        for f in futures:
+            result, queue_time, exec_time = f.result()
+            self._record("normalize", queue_time, exec_time)
+            results.append(result)
+        return results
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Эмбеддинги запросов (float32-матрица), по одному тексту на задачу — так они расходятся по ядрам."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        if not self.workers:
+            from app.rag.embedding_model import get_embedding_model
+            started = time.time()
+            vectors = get_embedding_model().embed_array(texts)
+            self._record("embed", 0.0, time.time() - started)
+            return vectors
+
+        executor = self._get_executor()
+        futures = [executor.submit(_run_embed, [text], time.time()) for text in texts]
+        rows = []
+        for f in futures:
+            buffer, queue_time, exec_time = f.result()
+            self._record("embed", queue_time, exec_time)
+            rows.append(np.frombuffer(buffer, dtype=np.float32))
+        return np.vstack(rows)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Средние и максимальные времена ожидания в очереди и выполнения по стадиям."""
+        with self._lock:
+            report = {}
+            for stage, s in self._stats.items():
+                calls = s["calls"] or 1
+                report[stage] = {
+                    "calls": s["calls"],
+                    "avg_queue_ms": round(s["queue_time"] / calls * 1000, 2),
+                    "max_queue_ms": round(s["max_queue_time"] * 1000, 2),
+                    "avg_exec_ms": round(s["exec_time"] / calls * 1000, 2),
+                }
+            return report
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+cpu_pool = CPUPool()
@@ -0,0 +1,131 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from app.config import REQUEST_DEADLINE, DEADLINE_ANSWER_RESERVE
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """
+    Дедлайн запроса: budget секунд с момента создания (None — без ограничения).
+    Последние reserve секунд отданы итоговому ответу: стадии до него видят remaining() без резерва,
+    поэтому ответ генерируется из того контекста, который успели собрать.
+    """
+
+    def __init__(self, budget: Optional[float] = REQUEST_DEADLINE, reserve: float = DEADLINE_ANSWER_RESERVE):
+        self.budget = budget if budget else None
+        self.reserve = reserve if self.budget else 0.0
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget if self.budget else None
+        self.shrunk: List[str] = []
+
+    def remaining(self, reserve: bool = True) -> float:
+        """Секунды до дедлайна стадий (reserve=False — до дедлайна всего запроса)."""
+        if self.expires_at is None:
+            return math.inf
+        return self.expires_at - time.monotonic() - (self.reserve if reserve else 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator["Stage"]:
+        """Стадия запроса: её длительность и то, пришлось ли урезать работу, попадают в статистику."""
+        stage = Stage(self, name)
+        try:
+            yield stage
+        finally:
+            _record(name, time.monotonic() - stage.started, stage.shrunk)
+            if stage.shrunk:
+                self.shrunk.append(name)
+
+
+class Stage:
+    """Бюджет одной стадии: стадия сама проверяет остаток и отмечает, что урезала работу."""
+
+    def __init__(self, deadline: Deadline, name: str):
+        self.deadline = deadline
+        self.name = name
+        self.started = time.monotonic()
+        self.shrunk = False
+
+    def remaining(self) -> float:
+        return self.deadline.remaining()
+
+    def exhausted(self, need: float = 0.0) -> bool:
+        """Осталось не больше need секунд (need=0 — время стадий вышло)."""
+        return self.remaining() <= need
+
+    def shrink(self, detail: str):
+        if not self.shrunk:
+            logger.info(f"Deadline: {self.name} shrunk ({detail}), {max(self.remaining(), 0):.1f} s left")
+        self.shrunk = True
+
+
+current_deadline_var: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+# Вне запроса (бенчмарки, индексация) стадии работают без ограничения
+NO_DEADLINE = Deadline(None)
+
+
+def current_deadline() -> Deadline:
+    """Дедлайн текущего запроса; копируется в потоки вместе с контекстом (to_thread, пулы)."""
+    return current_deadline_var.get() or NO_DEADLINE
+
+
+def llm_timeout(role: str, timeout: float) -> float:
+    """
+    Дедлайн вызова LLM с учётом дедлайна запроса. Стадии до ответа не трогают резерв ответа;
+    итоговому ответу отдаётся весь остаток, но не меньше резерва — ответ генерируется всегда.
+    """
+    deadline = current_deadline()
+    if deadline.expires_at is None:
+        return timeout
+    if role == "answer":
+        budget = max(deadline.remaining(reserve=False), deadline.reserve)
+    else:
+        budget = deadline.remaining()
+    capped = min(timeout, budget)
+    _record(f"llm_{role}", None, capped < timeout)
+    return capped
+
+
+# ---------- Статистика ----------
+_stats: Dict[str, Dict] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, elapsed: Optional[float], shrunk: bool):
+    with _stats_lock:
+        counters = _stats.setdefault(name, {"calls": 0, "shrunk": 0, "durations": deque(maxlen=1000)})
+        counters["calls"] += 1
+        counters["shrunk"] += shrunk
+        if elapsed is not None:
+            counters["durations"].append(elapsed)
+
+
+def deadline_stats() -> Dict[str, Dict]:
+    """По стадиям: вызовы, сколько раз дедлайн заставил урезать работу (hit_rate), длительность."""
+    with _stats_lock:
+        stats = {}
+        for name, counters in _stats.items():
+            durations = list(counters["durations"])
+            stats[name] = {
+                "calls": counters["calls"],
+                "shrunk": counters["shrunk"],
+                "hit_rate": round(counters["shrunk"] / counters["calls"], 3),
+                "p50_ms": round(float(np.percentile(durations, 50)) * 1000) if durations else None,
+                "p95_ms": round(float(np.percentile(durations, 95)) * 1000) if durations else None,
+            }
+        return stats
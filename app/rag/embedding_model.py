@@ -1,6 +1,8 @@
 import logging
-import torch
-from transformers import AutoTokenizer, AutoModel
+import threading
+import numpy as np
+
+from app.config import EMBEDDING_MODEL_NAME
 
 logger = logging.getLogger(__name__)
 
@@ -8,15 +10,33 @@ class MLMEmbeddings:
     """
     Обёртка для MLM модели, чтобы можно было получать эмбеддинги для Chroma.
     Делает mean pooling по токенам с учётом attention mask.
+    Модель (и сам torch/transformers) загружается лениво — при первом вызове или через load().
     """
     def __init__(self, model_path: str, device: str = None):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModel.from_pretrained(model_path)
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
-        self.model.eval()
+        self.model_path = model_path
+        self.device = device
+        self.tokenizer = None
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self) -> "MLMEmbeddings":
+        with self._lock:
+            if self.model is None:
+                import torch
+                from transformers import AutoTokenizer, AutoModel
+
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+                model = AutoModel.from_pretrained(self.model_path)
+                self.device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+                model.to(self.device)
+                model.eval()
+                self.model = model
+                logger.info(f"Embedding model loaded from {self.model_path} on {self.device}")
+        return self
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        import torch
+        self.load()
         all_embs = []
         with torch.no_grad():
             for text in texts:
@@ -31,8 +51,14 @@ class MLMEmbeddings:
 
     def embed_query(self, text: str) -> list[float]:
         return self.embed_documents([text])[0]
-    
+
     def embed_documents_batch(self, texts: list[str], batch_size=32):
+        return self.embed_array(texts, batch_size=batch_size).tolist()
+
+    def embed_array(self, texts: list[str], batch_size=32) -> np.ndarray:
+        """Батчевые эмбеддинги в виде компактной float32-матрицы (без python-списков)."""
+        import torch
+        self.load()
         all_embs = []
         with torch.no_grad():
             for i in range(0, len(texts), batch_size):
@@ -43,6 +69,18 @@ class MLMEmbeddings:
                 last_hidden = outputs.last_hidden_state
                 attention_mask = inputs["attention_mask"].unsqueeze(-1)
                 pooled = (last_hidden * attention_mask).sum(1) / attention_mask.sum(1)
-                all_embs.extend(pooled.cpu().tolist())
-        return all_embs
+                all_embs.append(pooled.cpu().numpy().astype(np.float32, copy=False))
+        if not all_embs:
+            return np.empty((0, self.model.config.hidden_size), dtype=np.float32)
+        return np.concatenate(all_embs)
+
+
+_embedding_model = None
+
 
+def get_embedding_model() -> MLMEmbeddings:
+    """Общий экземпляр модели эмбеддингов (веса грузятся лениво)."""
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = MLMEmbeddings(EMBEDDING_MODEL_NAME)
+    return _embedding_model
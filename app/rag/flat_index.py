@@ -0,0 +1,432 @@
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Tuple, Optional, Dict
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import CHROMA_PERSIST_DIR, FLAT_INDEX_DIR, FLAT_RESCORE_FACTOR
+from app.db import connect, get_connection, batched, placeholders
+from app.rag.cache import stamp_index_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "index.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+FULL_FILE = "embeddings_f32.npy"
+SQ_NORMS_FILE = "sq_norms.npy"
+ARTICLE_IDS_FILE = "article_ids.npy"
+METADATA_FILE = "metadata.db"
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Симметричное int8-квантование с отдельным масштабом на вектор: x ~ q * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class FlatVectorIndex:
+    """
+    Точный векторный поиск без ANN: эмбеддинги лежат в memory-mapped .npy (float32, float16
+    или int8 с масштабом на вектор), метаданные и тексты — в параллельной таблице SQLite
+    (строка матрицы = row в таблице). Top-k считается одним матричным умножением и argpartition.
+    Для квантованных матриц рядом может лежать float32-копия: первый проход идёт по компактной
+    матрице, затем короткий список кандидатов (k * rescore_factor) пересчитывается точно.
+    Интерфейс повторяет нужную HybridRetriever часть Chroma; оценка — квадрат L2-расстояния,
+    как у коллекции Chroma по умолчанию.
+    """
+
+    def __init__(
+        self,
+        index_dir: Path = FLAT_INDEX_DIR,
+        embedding_function=None,
+        block_size: int = 2048,
+        rescore_factor: int = FLAT_RESCORE_FACTOR,
+    ):
+        self.index_dir = Path(index_dir)
+        self.embedding_function = embedding_function
+        self.block_size = block_size
+        self.rescore_factor = rescore_factor
+
+        with open(self.index_dir / MANIFEST_FILE, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        # mmap: страницы матрицы общие для всех процессов и подгружаются ОС по требованию
+        self.embeddings = np.load(self.index_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        self.scales = np.load(self.index_dir / SCALES_FILE) if self.manifest["dtype"] == "int8" else None
+        # float32-копия читается только по строкам кандидатов, в память целиком не попадает
+        full_path = self.index_dir / FULL_FILE
+        self.full = np.load(full_path, mmap_mode="r") if full_path.exists() else None
+        self.sq_norms = np.load(self.index_dir / SQ_NORMS_FILE)
+        self.metadata_path = str(self.index_dir / METADATA_FILE)
+        self._article_order: Optional[np.ndarray] = None
+        self._article_keys: Optional[np.ndarray] = None
+        logger.info(
+            f"Loaded flat vector index from {self.index_dir}: "
+            f"{self.embeddings.shape[0]} x {self.embeddings.shape[1]} {self.manifest['dtype']}"
+            f"{' + float32 rescoring' if self.rescoring else ''}"
+        )
+
+    def count(self) -> int:
+        return int(self.embeddings.shape[0])
+
+    @property
+    def rescoring(self) -> bool:
+        return self.full is not None and self.rescore_factor > 0
+
+    # ---------- Поиск ----------
+    def _distances(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Квадраты L2-расстояний (m запросов x n векторов) по основной матрице: |q|^2 - 2 q.x + |x|^2.
+        Для int8 скалярное произведение домножается на масштаб вектора.
+        """
+        n = self.count()
+        if self.embeddings.dtype == np.float32:
+            # преобразование не нужно — одно умножение прямо по memmap
+            dots = queries @ self.embeddings.T
+        else:
+            # компактная матрица переводится во float32 небольшими блоками: целиком не копируется,
+            # а преобразование блока остаётся в кеше процессора
+            dots = np.empty((queries.shape[0], n), dtype=np.float32)
+            for start in range(0, n, self.block_size):
+                block = np.asarray(self.embeddings[start:start + self.block_size], dtype=np.float32)
+                block_dots = queries @ block.T
+                if self.scales is not None:
+                    block_dots *= self.scales[start:start + len(block)]
+                dots[:, start:start + len(block)] = block_dots
+        distances = np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * dots + self.sq_norms[None, :]
+        return np.maximum(distances, 0.0, out=distances)
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Индексы и расстояния k ближайших для каждой строки, по возрастанию расстояния."""
+        k = min(k, distances.shape[1])
+        if k == 0:
+            return np.empty((distances.shape[0], 0), dtype=np.int64), np.empty((distances.shape[0], 0), dtype=np.float32)
+        idx = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        part = np.take_along_axis(distances, idx, axis=1)
+        order = np.argsort(part, axis=1)
+        return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+    def _rescore(self, queries: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Точные расстояния по float32-копии только для кандидатов первого прохода."""
+        # строки memmap читаются по возрастанию — последовательный доступ к файлу
+        rows = np.unique(candidates)
+        full = np.asarray(self.full[rows], dtype=np.float32)
+        position = np.searchsorted(rows, candidates)
+        diff = full[position] - queries[:, None, :]
+        exact = np.einsum("ijk,ijk->ij", diff, diff)
+        idx, dist = self._top_k(exact, k)
+        return np.take_along_axis(candidates, idx, axis=1), dist
+
+    def search_rows(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Номера строк и расстояния k ближайших векторов для каждого запроса."""
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        distances = self._distances(queries)
+        if not self.rescoring:
+            return self._top_k(distances, k)
+        candidates, _ = self._top_k(distances, k * self.rescore_factor)
+        return self._rescore(queries, candidates, k)
+
+    def _documents(self, rows: List[int]) -> Dict[int, Document]:
+        """Один запрос к таблице метаданных на все найденные строки."""
+        conn = get_connection(self.metadata_path, readonly=True)
+        docs = {}
+        for part in batched(sorted(set(rows))):
+            for row, vector_id, document, metadata in conn.execute(
+                f"SELECT row, id, document, metadata FROM vectors WHERE row IN ({placeholders(len(part))})", part
+            ):
+                docs[row] = Document(id=vector_id, page_content=document or "", metadata=json.loads(metadata))
+        return docs
+
+    def similarity_search_by_vectors_with_scores(self, embeddings, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """Пакетный поиск: все запросы — одним умножением матриц."""
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if not len(queries) or not self.count():
+            return [[] for _ in range(len(queries))]
+        idx, dist = self.search_rows(queries, k)
+        docs = self._documents(idx.ravel().tolist())
+        return [
+            [(docs[int(i)], float(d)) for i, d in zip(row_idx, row_dist)]
+            for row_idx, row_dist in zip(idx, dist)
+        ]
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Сохранённые векторы по ID (float32-копия, если есть, иначе основная матрица)."""
+        conn = get_connection(self.metadata_path, readonly=True)
+        found = {}
+        for part in batched(sorted(set(ids))):
+            for row, vector_id in conn.execute(
+                f"SELECT row, id FROM vectors WHERE id IN ({placeholders(len(part))})", part
+            ):
+                if self.full is not None:
+                    found[vector_id] = np.asarray(self.full[row], dtype=np.float32)
+                else:
+                    vector = np.asarray(self.embeddings[row], dtype=np.float32)
+                    found[vector_id] = vector * self.scales[row] if self.scales is not None else vector
+        return found
+
+    # ---------- Поиск с фильтром по статьям ----------
+    def _load_article_rows(self):
+        """Строки, отсортированные по article_id: строки одной статьи — непрерывный диапазон."""
+        path = self.index_dir / ARTICLE_IDS_FILE
+        if path.exists():
+            article_ids = np.load(path)
+        else:
+            # индекс выгружен до появления article_ids.npy — берём из метаданных
+            conn = get_connection(self.metadata_path, readonly=True)
+            article_ids = np.full(self.count(), -1, dtype=np.int64)
+            for row, article_id in conn.execute('''
+                SELECT row, json_extract(metadata, '$.article_id') FROM vectors
+                WHERE json_extract(metadata, '$.article_id') IS NOT NULL
+            '''):
+                article_ids[row] = article_id
+        order = np.argsort(article_ids, kind="stable")
+        self._article_keys = article_ids[order]
+        self._article_order = order
+
+    def rows_for_articles(self, article_ids: List[int]) -> np.ndarray:
+        """Номера строк всех чанков указанных статей (кандидаты для фильтрованного поиска)."""
+        if self._article_order is None:
+            self._load_article_rows()
+        keys = np.asarray(sorted(set(article_ids)), dtype=np.int64)
+        if not len(keys):
+            return np.empty(0, dtype=np.int64)
+        starts = np.searchsorted(self._article_keys, keys, side="left")
+        ends = np.searchsorted(self._article_keys, keys, side="right")
+        return np.sort(np.concatenate([self._article_order[s:e] for s, e in zip(starts, ends)]))
+
+    def _filter_rows(self, filter: dict) -> np.ndarray:
+        """Поддерживаются фильтры Chroma вида {"article_id": id} и {"article_id": {"$in": [...]}}."""
+        if not isinstance(filter, dict):
+            raise TypeError(f"FlatVectorIndex filter must be a dict, got {filter!r}")
+        if set(filter) != {"article_id"}:
+            raise ValueError(f"FlatVectorIndex supports only article_id filters, got {filter}")
+        condition = filter["article_id"]
+        if isinstance(condition, dict):
+            if set(condition) != {"$in"}:
+                raise ValueError(f"Unsupported article_id condition {condition}")
+            return self.rows_for_articles(condition["$in"])
+        return self.rows_for_articles([condition])
+
+    def search_rows_in(self, query: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Точный top-k только среди заданных строк: читаются лишь их векторы."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self.full is not None:
+            vectors = np.asarray(self.full[rows], dtype=np.float32)
+        else:
+            vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+            if self.scales is not None:
+                vectors *= self.scales[rows, None]
+        diff = vectors - query[None, :]
+        distances = np.einsum("ij,ij->i", diff, diff)[None, :]
+        idx, dist = self._top_k(distances, k)
+        return rows[idx[0]], dist[0]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        if not filter:
+            return self.similarity_search_by_vectors_with_scores([embedding], k=k)[0]
+        rows = self._filter_rows(filter)
+        if not len(rows):
+            return []
+        idx, dist = self.search_rows_in(embedding, rows, k)
+        docs = self._documents(idx.tolist())
+        return [(docs[int(i)], float(d)) for i, d in zip(idx, dist)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        if self.embedding_function is None:
+            raise RuntimeError("FlatVectorIndex was created without embedding_function")
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Размеры частей индекса в байтах: resident — то, что читается при каждом запросе."""
+        resident = self.embeddings.nbytes + self.sq_norms.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return {
+            "resident": int(resident),
+            "rescore_on_disk": int(self.full.nbytes) if self.full is not None else 0,
+            "bytes_per_vector": int(resident // max(self.count(), 1)),
+        }
+
+
+# ---------- Запись индекса ----------
+class FlatIndexWriter:
+    """
+    Пишет плоский индекс во временный каталог и подменяет им out_dir только в finish().
+    rescore=True дополнительно сохраняет float32-копию для точного пересчёта кандидатов.
+    """
+
+    def __init__(self, out_dir: Path, total: int, dtype: str = "float16", rescore: bool = False):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype}, expected one of {DTYPES}")
+        self.out_dir = Path(out_dir)
+        self.tmp_dir = self.out_dir.with_name(self.out_dir.name + ".tmp")
+        self.total = total
+        self.dtype = dtype
+        self.rescore = rescore and dtype != "float32"
+        self.row = 0
+        self.started = time.time()
+
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.matrix = None
+        self.full = None
+        self.scales = np.ones(total, dtype=np.float32)
+        self.sq_norms = np.empty(total, dtype=np.float32)
+        self.article_ids = np.full(total, -1, dtype=np.int64)
+        self.conn = connect(str(self.tmp_dir / METADATA_FILE))
+        self.conn.execute("CREATE TABLE vectors (row INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT, metadata TEXT)")
+
+    def add(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[dict]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.matrix is None:
+            shape = (self.total, vectors.shape[1])
+            self.matrix = np.lib.format.open_memmap(self.tmp_dir / EMBEDDINGS_FILE, mode="w+", dtype=self.dtype, shape=shape)
+            if self.rescore:
+                self.full = np.lib.format.open_memmap(self.tmp_dir / FULL_FILE, mode="w+", dtype=np.float32, shape=shape)
+
+        rows = slice(self.row, self.row + len(vectors))
+        if self.dtype == "int8":
+            stored, scales = quantize_int8(vectors)
+            self.scales[rows] = scales
+            approx = stored.astype(np.float32) * scales[:, None]
+        else:
+            stored = vectors.astype(self.dtype)
+            approx = stored.astype(np.float32)
+        self.matrix[rows] = stored
+        if self.full is not None:
+            self.full[rows] = vectors
+        # нормы считаются по сохранённым (округлённым) значениям — так первый проход согласован
+        self.sq_norms[rows] = np.einsum("ij,ij->i", approx, approx)
+        article_ids = [(metadata or {}).get("article_id") for metadata in metadatas]
+        self.article_ids[rows] = [-1 if article_id is None else article_id for article_id in article_ids]
+
+        self.conn.executemany(
+            "INSERT INTO vectors (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+            [
+                (self.row + i, vector_id, document, json.dumps(metadata or {}, ensure_ascii=False))
+                for i, (vector_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+            ]
+        )
+        self.row += len(vectors)
+        logger.info(f"Written {self.row}/{self.total} vectors")
+
+    def finish(self, source: str) -> Dict:
+        if self.row != self.total:
+            self.conn.close()
+            raise RuntimeError(f"Source changed during export: expected {self.total} vectors, got {self.row}")
+
+        self.conn.execute("CREATE INDEX idx_vectors_id ON vectors (id)")
+        self.conn.commit()
+        # индекс раздаётся только на чтение — без WAL-файлов рядом
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.close()
+
+        dim = int(self.matrix.shape[1])
+        for matrix in (self.matrix, self.full):
+            if matrix is not None:
+                matrix.flush()
+        self.matrix = self.full = None
+        np.save(self.tmp_dir / SQ_NORMS_FILE, self.sq_norms)
+        np.save(self.tmp_dir / ARTICLE_IDS_FILE, self.article_ids)
+        if self.dtype == "int8":
+            np.save(self.tmp_dir / SCALES_FILE, self.scales)
+
+        manifest = {
+            "count": self.row,
+            "dim": dim,
+            "dtype": self.dtype,
+            "rescore": self.rescore,
+            "metric": "l2",
+            "source": source,
+            "created_at": time.time(),
+        }
+        with open(self.tmp_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        stamp_index_version(self.tmp_dir)
+
+        if self.out_dir.exists():
+            shutil.rmtree(self.out_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+        logger.info(f"Flat index written to {self.out_dir} in {time.time() - self.started:.1f}s: {manifest}")
+        return manifest
+
+
+def export_from_chroma(
+    vectorstore,
+    out_dir: Path = FLAT_INDEX_DIR,
+    dtype: str = "float16",
+    rescore: bool = False,
+    page_size: int = 5000,
+) -> Dict:
+    """Выгружает коллекцию Chroma в плоский индекс."""
+    collection = vectorstore._collection
+    total = collection.count()
+    if not total:
+        raise RuntimeError("Chroma collection is empty, nothing to export")
+
+    writer = FlatIndexWriter(out_dir, total, dtype=dtype, rescore=rescore)
+    for offset in range(0, total, page_size):
+        page = collection.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        writer.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+    return writer.finish(source=str(CHROMA_PERSIST_DIR))
+
+
+def convert_index(src_dir: Path, out_dir: Path, dtype: str, rescore: bool = False, page_size: int = 5000) -> Dict:
+    """
+    Перекодирует существующий плоский индекс в другой формат хранения.
+    Исходные значения берутся из float32-копии, если она есть, иначе из основной матрицы.
+    """
+    src = FlatVectorIndex(src_dir)
+    source = src.full if src.full is not None else src.embeddings
+    conn = get_connection(src.metadata_path, readonly=True)
+    writer = FlatIndexWriter(out_dir, src.count(), dtype=dtype, rescore=rescore)
+    for start in range(0, src.count(), page_size):
+        vectors = np.asarray(source[start:start + page_size], dtype=np.float32)
+        if src.scales is not None and source is src.embeddings:
+            vectors *= src.scales[start:start + page_size, None]
+        rows = conn.execute(
+            "SELECT id, document, metadata FROM vectors WHERE row >= ? AND row < ? ORDER BY row",
+            (start, start + len(vectors))
+        ).fetchall()
+        writer.add([r[0] for r in rows], vectors, [r[1] for r in rows], [json.loads(r[2]) for r in rows])
+    return writer.finish(source=str(src_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт коллекции Chroma в плоский memory-mapped индекс")
+    parser.add_argument("--out", default=str(FLAT_INDEX_DIR))
+    parser.add_argument("--dtype", choices=DTYPES, default="float16")
+    parser.add_argument("--rescore", action="store_true",
+                        help="сохранить float32-копию для точного пересчёта кандидатов (для float16/int8)")
+    parser.add_argument("--from-flat", default=None,
+                        help="перекодировать существующий плоский индекс вместо выгрузки из Chroma")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    if args.from_flat:
+        convert_index(Path(args.from_flat), Path(args.out), dtype=args.dtype, rescore=args.rescore, page_size=args.page_size)
+        return
+
+    from langchain_chroma import Chroma
+    vectorstore = Chroma(persist_directory=str(CHROMA_PERSIST_DIR))
+    export_from_chroma(vectorstore, Path(args.out), dtype=args.dtype, rescore=args.rescore, page_size=args.page_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import logging
+from typing import List, Tuple, Dict
+
+from langchain_core.documents import Document
+
+from app.config import ARTICLES_DB_PATH
+from app.db import get_connection, batched, placeholders
+
+logger = logging.getLogger(__name__)
+
+# В «тонком» индексе у вектора остаются только эти поля: ID чанка и минимальный набор для фильтров
+SLIM_METADATA_KEYS = ("chunk_id", "article_id")
+
+HYDRATE_SQL = '''
+    SELECT id, chunk_text, article_id, chunk_index, title, article_url, sources, entities
+    FROM article_chunks
+    WHERE id IN ({})
+'''
+
+MAX_SHARED_ARTICLES = 10000
+
+
+def slim_metadata(doc: Document) -> Dict:
+    return {key: doc.metadata[key] for key in SLIM_METADATA_KEYS if doc.metadata.get(key) is not None}
+
+
+def is_slim(doc: Document) -> bool:
+    """Документ из тонкого индекса: текста нет, есть только ID чанка."""
+    return not doc.page_content and "chunk_id" in doc.metadata
+
+
+class ChunkHydrator:
+    """
+    Восстанавливает текст и метаданные чанков тонкого индекса из article_chunks:
+    один запрос WHERE id IN (...) на все результаты поиска. Поля уровня статьи (название, URL,
+    источники, сущности) одинаковы у всех её чанков — их строки переиспользуются, а не копируются.
+    """
+
+    def __init__(self, db_path: str = ARTICLES_DB_PATH):
+        self.db_path = db_path
+        self._shared: Dict[tuple, tuple] = {}
+
+    def _article_fields(self, title, article_url, sources, entities) -> tuple:
+        fields = (title, article_url, sources, entities)
+        if len(self._shared) >= MAX_SHARED_ARTICLES:
+            self._shared.clear()
+        return self._shared.setdefault(fields, fields)
+
+    def load(self, chunk_ids: List[int]) -> Dict[int, Document]:
+        conn = get_connection(self.db_path, readonly=True)
+        docs = {}
+        for part in batched(sorted(set(chunk_ids))):
+            for chunk_id, chunk_text, article_id, chunk_index, *article in conn.execute(
+                HYDRATE_SQL.format(placeholders(len(part))), part
+            ):
+                title, article_url, sources, entities = self._article_fields(*article)
+                docs[chunk_id] = Document(
+                    page_content=chunk_text,
+                    metadata={
+                        'chunk_id': chunk_id,
+                        'article_id': article_id,
+                        'chunk_index': chunk_index,
+                        'title': title,
+                        'source': article_url,
+                        'sources': sources,
+                        'entities': entities,
+                    },
+                )
+        return docs
+
+    def hydrate(self, ranked_lists: List[List[Tuple[Document, float]]]) -> List[List[Tuple[Document, float]]]:
+        """
+        Подставляет полные документы вместо тонких во всех списках сразу. Чанки, которых уже нет
+        в базе (статья переиндексирована после построения векторного индекса), отбрасываются.
+        """
+        chunk_ids = [doc.metadata["chunk_id"] for ranked in ranked_lists for doc, _ in ranked if is_slim(doc)]
+        if not chunk_ids:
+            return ranked_lists
+        docs = self.load(chunk_ids)
+        missing = len(set(chunk_ids) - docs.keys())
+        if missing:
+            logger.warning(f"{missing} chunks from the vector index are missing in article_chunks")
+        return [
+            [
+                (docs[doc.metadata["chunk_id"]], score) if is_slim(doc) else (doc, score)
+                for doc, score in ranked
+                if not is_slim(doc) or doc.metadata["chunk_id"] in docs
+            ]
+            for ranked in ranked_lists
+        ]
+
+
+_hydrator = None
+
+
+def get_hydrator() -> ChunkHydrator:
+    global _hydrator
+    if _hydrator is None:
+        _hydrator = ChunkHydrator()
+    return _hydrator
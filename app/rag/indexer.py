@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Dict
+
+from langchain_core.documents import Document
+from langchain_chroma import Chroma
+
+from app.config import CHROMA_PERSIST_DIR, SHARD_COUNT
+from app.chunks_loader import DatabaseTextLoader
+from app.db import get_connection, transaction, batched
+from app.rag.embedding_model import get_embedding_model
+from app.rag.hydration import slim_metadata
+from app.rag.cache import stamp_index_version
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "index_checkpoint.json"
+
+
+def chunk_doc_id(chunk_id: int) -> str:
+    """Стабильный ID чанка в векторном хранилище (повторная индексация делает upsert, а не дубль)."""
+    return f"chunk-{chunk_id}"
+
+
+def chunk_metadata(doc: Document) -> Dict:
+    # Chroma не принимает None в метаданных
+    return {k: v for k, v in doc.metadata.items() if v is not None}
+
+
+class VectorIndexer:
+    """
+    Офлайн-индексация: потоково читает article_chunks страницами, считает эмбеддинги
+    большими батчами и делает upsert в Chroma. После каждого батча пишет чекпоинт,
+    поэтому прерванную индексацию можно продолжить с того же места.
+    В тонком режиме (slim) у вектора хранятся только chunk_id и article_id, текст и остальные
+    метаданные при поиске подтягиваются из article_chunks (app/rag/hydration.py).
+    """
+
+    def __init__(
+        self,
+        loader: DatabaseTextLoader,
+        persist_dir: Path = CHROMA_PERSIST_DIR,
+        batch_size: int = 256,
+        page_size: int = 2048,
+        slim: bool = False,
+    ):
+        self.loader = loader
+        self.persist_dir = Path(persist_dir)
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.checkpoint_path = self.persist_dir / CHECKPOINT_FILE
+        self.embeddings = get_embedding_model()
+
+        self.persist_dir.mkdir(parents=True, exist_ok=True)
+        # раскладка запоминается в чекпоинте: дозапуск и --incremental продолжают в том же режиме
+        self.slim_requested = slim
+        self.slim = slim or self.load_checkpoint().get("slim", False)
+        self.vectorstore = Chroma(persist_directory=str(self.persist_dir), embedding_function=self.embeddings)
+
+    # ---------- Чекпоинт ----------
+    def load_checkpoint(self) -> Dict:
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"last_chunk_id": 0, "indexed": 0}
+
+    def save_checkpoint(self, last_chunk_id: int, indexed: int):
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"last_chunk_id": last_chunk_id, "indexed": indexed, "slim": self.slim, "updated_at": time.time()}, f
+            )
+        # атомарная замена: чекпоинт никогда не бывает «наполовину записан»
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def reset(self):
+        logger.info("Resetting vector collection and checkpoint")
+        self.vectorstore.reset_collection()
+        if self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+        stamp_index_version(self.persist_dir)
+        self.slim = self.slim_requested
+
+    # ---------- Индексация ----------
+    def upsert_documents(self, docs: List[Document], shards=None):
+        """
+        Эмбеддинг батча одним проходом модели и upsert по стабильным ID.
+        shards (ShardedVectorStore) — те же векторы дополнительно пишутся в шарды их статей.
+        """
+        if not docs:
+            return
+        vectors = self.embeddings.embed_array([d.page_content for d in docs], batch_size=self.batch_size)
+        ids = [chunk_doc_id(d.metadata["chunk_id"]) for d in docs]
+        metadatas = [slim_metadata(d) if self.slim else chunk_metadata(d) for d in docs]
+        # пустая строка, а не None: langchain_chroma пропускает результаты без документа
+        documents = ["" if self.slim else d.page_content for d in docs]
+        self.vectorstore._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=documents)
+        if shards is not None:
+            shards.upsert(ids, vectors, metadatas, documents)
+
+    def load_shards(self):
+        """Шарды по категориям (shards.json), если коллекция уже разложена, иначе None."""
+        from app.rag.sharding import ShardedVectorStore, SHARDS_FILE
+
+        if not (self.persist_dir / SHARDS_FILE).exists():
+            return None
+        return ShardedVectorStore(self.persist_dir)
+
+    def run(self) -> Dict:
+        checkpoint = self.load_checkpoint()
+        last_chunk_id = checkpoint["last_chunk_id"]
+        indexed = checkpoint["indexed"]
+
+        remaining = self.loader.count_chunks(after_id=last_chunk_id)
+        if last_chunk_id:
+            logger.info(f"Resuming from chunk id {last_chunk_id} ({indexed} already indexed)")
+        logger.info(f"{remaining} chunks to index")
+
+        started = time.time()
+        done = 0
+
+        for page_last_id, page in self.loader.iter_chunk_pages(after_id=last_chunk_id, page_size=self.page_size):
+            for i in range(0, len(page), self.batch_size):
+                batch = page[i:i + self.batch_size]
+                self.upsert_documents(batch)
+
+                done += len(batch)
+                indexed += len(batch)
+                last_chunk_id = batch[-1].metadata["chunk_id"]
+                self.save_checkpoint(last_chunk_id, indexed)
+
+                elapsed = time.time() - started
+                rate = done / elapsed if elapsed else 0.0
+                eta = (remaining - done) / rate if rate else 0.0
+                logger.info(
+                    f"Indexed {done}/{remaining} chunks ({rate:.1f} chunks/s, ETA {eta / 60:.1f} min)"
+                )
+
+            # страница могла целиком состоять из отфильтрованных чанков
+            if page_last_id > last_chunk_id:
+                last_chunk_id = page_last_id
+                self.save_checkpoint(last_chunk_id, indexed)
+
+        if done:
+            stamp_index_version(self.persist_dir)
+        elapsed = time.time() - started
+        summary = {
+            "indexed_this_run": done,
+            "indexed_total": indexed,
+            "seconds": round(elapsed, 1),
+            "chunks_per_sec": round(done / elapsed, 1) if elapsed else 0.0,
+        }
+        logger.info(f"Indexing finished: {summary}")
+        return summary
+
+    def run_incremental(self, articles_per_batch: int = 100) -> Dict:
+        """
+        Переиндексирует только новые и изменённые статьи (по content_hash) и удаляет исчезнувшие.
+        Каждая пачка статей — одна транзакция SQLite: чанки и отметки indexed_articles фиксируются
+        только после успешных delete/upsert в Chroma. При сбое транзакция откатывается, хеши
+        не обновляются, и следующий запуск повторит эти статьи (операции в Chroma идемпотентны).
+        Если коллекция разложена по шардам (--build-shards), те же удаления и upsert применяются
+        к шардам статей: новые статьи попадают в общий шард до следующей раскладки.
+        """
+        started = time.time()
+        shards = self.load_shards()
+        self.loader.refresh_content_hashes()
+        diff = self.loader.diff_articles()
+        to_index = diff["new"] + diff["changed"]
+        deleted = diff["deleted"]
+
+        logger.info(
+            f"Article diff: {len(diff['new'])} new, {len(diff['changed'])} changed, "
+            f"{len(deleted)} deleted, {diff['unchanged']} unchanged"
+        )
+
+        chunks_added = 0
+        chunks_removed = 0
+        failed = 0
+        batches = [to_index[i:i + articles_per_batch] for i in range(0, len(to_index), articles_per_batch)]
+        if deleted:
+            batches.append([])
+
+        for n, batch in enumerate(batches, 1):
+            batch_deleted = deleted if not batch else []
+            conn = get_connection(self.loader.db_path)
+            try:
+                with transaction(conn):
+                    removed_ids, new_chunks = self.loader.replace_article_chunks(conn, batch, batch_deleted)
+                    if removed_ids:
+                        # по article_id, а не по chunk-<id>: индексы, построенные до стабильных ID,
+                        # хранят векторы под UUID, и удаление по ID оставило бы их дублями
+                        for part in batched(batch + batch_deleted):
+                            self.vectorstore._collection.delete(where={"article_id": {"$in": list(part)}})
+                            if shards is not None:
+                                shards.delete_articles(list(part))
+                    for i in range(0, len(new_chunks), self.batch_size):
+                        self.upsert_documents(new_chunks[i:i + self.batch_size], shards)
+                chunks_added += len(new_chunks)
+                chunks_removed += len(removed_ids)
+                logger.info(f"Batch {n}/{len(batches)}: -{len(removed_ids)} +{len(new_chunks)} chunks")
+            except Exception as e:
+                # в кеше словаря могли остаться id откатанных сущностей
+                self.loader._entity_ids = None
+                failed += len(batch) + len(batch_deleted)
+                logger.error(f"Batch {n}/{len(batches)} failed, rolled back: {e}")
+
+        # Новые чанки получили id больше чекпоинта — полный прогон не должен индексировать их повторно
+        if chunks_added or chunks_removed:
+            if shards is not None:
+                shards.save_counts()
+            # кеши результатов поиска в работающих процессах сбросятся по новому штампу
+            stamp_index_version(self.persist_dir)
+
+        checkpoint = self.load_checkpoint()
+        max_chunk_id = self.loader.max_chunk_id()
+        if max_chunk_id > checkpoint["last_chunk_id"]:
+            self.save_checkpoint(max_chunk_id, checkpoint["indexed"] + chunks_added)
+
+        summary = {
+            "new": len(diff["new"]),
+            "changed": len(diff["changed"]),
+            "deleted": len(deleted),
+            "unchanged": diff["unchanged"],
+            "failed": failed,
+            "chunks_added": chunks_added,
+            "chunks_removed": chunks_removed,
+            "seconds": round(time.time() - started, 1),
+        }
+        logger.info(f"Incremental reindex finished: {summary}")
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-построение векторного индекса по article_chunks")
+    parser.add_argument("--db", default="warhammer_articles.db")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--page-size", type=int, default=2048)
+    parser.add_argument("--reset", action="store_true", help="очистить коллекцию и начать с нуля")
+    parser.add_argument("--incremental", action="store_true",
+                        help="переиндексировать только новые/изменённые статьи и удалить исчезнувшие")
+    parser.add_argument("--mark-current", action="store_true",
+                        help="считать текущие чанки актуальными (однократная миграция для --incremental)")
+    parser.add_argument("--rebuild-entity-index", action="store_true",
+                        help="перестроить индекс сущность -> чанки (chunk_entities) по уже нарезанным чанкам")
+    parser.add_argument("--slim", action="store_true",
+                        help="хранить в Chroma только chunk_id/article_id, текст и метаданные брать из SQLite")
+    parser.add_argument("--build-shards", action="store_true",
+                        help="разложить готовую коллекцию по коллекциям-категориям (метки узлов графа)")
+    parser.add_argument("--shard-count", type=int, default=SHARD_COUNT)
+    parser.add_argument("--rebuild-fts", action="store_true",
+                        help="перестроить полнотекстовый индекс чанков (article_chunks_fts)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    loader = DatabaseTextLoader(db_path=args.db)
+    if args.mark_current:
+        loader.refresh_content_hashes()
+        loader.mark_all_current()
+        return
+
+    if args.rebuild_entity_index:
+        loader.rebuild_entity_index()
+        return
+
+    if args.rebuild_fts:
+        loader.rebuild_fts_index()
+        return
+
+    if args.build_shards:
+        from app.rag.sharding import build_shards
+        build_shards(CHROMA_PERSIST_DIR, args.db, max_shards=args.shard_count)
+        return
+
+    if args.incremental:
+        VectorIndexer(loader, batch_size=args.batch_size, slim=args.slim).run_incremental()
+        return
+
+    if not loader._check_chunks_exist():
+        logger.info("No chunks in database, splitting articles first")
+        loader.build_chunks()
+
+    indexer = VectorIndexer(loader, batch_size=args.batch_size, page_size=args.page_size, slim=args.slim)
+    if args.reset:
+        indexer.reset()
+    indexer.run()
+
+
+if __name__ == "__main__":
+    main()
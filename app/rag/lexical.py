@@ -0,0 +1,194 @@
+import re
+import logging
+import threading
+from typing import List, Tuple, Dict, Optional
+
+from langchain_core.documents import Document
+
+from app.config import ARTICLES_DB_PATH
+from app.db import get_connection, placeholders
+from app.chunks_loader import chunk_row_to_document, normalize_entity_name
+
+logger = logging.getLogger(__name__)
+
+# Вопросительные обороты, которые не входят в название статьи: «Кто такой Хорус?» -> «Хорус»
+QUESTION_PREFIXES = (
+    "кто такой", "кто такая", "кто такие", "кто такое", "что такое", "что такой",
+    "расскажи про", "расскажи о", "расскажи об", "расскажите про", "расскажите о", "расскажите об",
+    "кто был", "кто была", "кто были", "что было", "кто", "что",
+)
+
+MAX_QUERY_TERMS = 12
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Tuple[Document, float]]], k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    Reciprocal Rank Fusion: score = sum(1 / (k + rank)) по всем спискам, где встречается чанк.
+    Шкалы исходных оценок (расстояния Chroma, BM25) не сравниваются — важен только ранг.
+    Возвращает (Document, rrf_score) по убыванию оценки.
+    """
+    scores: Dict[tuple, float] = {}
+    docs: Dict[tuple, Document] = {}
+    for ranked in ranked_lists:
+        for rank, (doc, _) in enumerate(ranked, 1):
+            key = (doc.metadata.get("title", "Без названия"), doc.page_content.strip())
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda x: -x[1])
+
+
+class LexicalIndex:
+    """
+    Лексический поиск по чанкам: BM25 по FTS5-индексу article_chunks_fts
+    и точное сопоставление запроса с названиями статей (словарь в памяти).
+    """
+
+    def __init__(self, db_path: str = ARTICLES_DB_PATH):
+        self.db_path = db_path
+        self._titles: Optional[Dict[str, List[int]]] = None
+        self._title_lemmas: Optional[Dict[str, List[int]]] = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        return get_connection(self.db_path, readonly=True)
+
+    # ---------- BM25 ----------
+    def build_match_query(self, text: str) -> Optional[str]:
+        """
+        FTS5-запрос из текста: стоп-слова отбрасываются, каждое слово ищется как есть
+        и по префиксу леммы («Хоруса» -> "хоруса" OR "хорус"*), слова объединяются через OR.
+        """
+        from app.rag.NER import STOP_WORDS, get_morph
+
+        morph = get_morph()
+        groups = []
+        for token in re.findall(r"\w+", text.lower()):
+            if len(token) < 2 or token in STOP_WORDS or token.isdigit():
+                continue
+            lemma = morph.parse(token)[0].normal_form
+            terms = [f'"{token}"']
+            if lemma != token:
+                terms.append(f'"{lemma}"*')
+            groups.append("(" + " OR ".join(terms) + ")")
+            if len(groups) >= MAX_QUERY_TERMS:
+                break
+        return " OR ".join(groups) if groups else None
+
+    def search(self, text: str, k: int = 20) -> List[Tuple[Document, float]]:
+        """BM25-поиск чанков; оценка — -bm25 (чем больше, тем релевантнее), совпадение в названии весит больше."""
+        match = self.build_match_query(text)
+        if not match:
+            return []
+        rows = self._connection().execute('''
+            SELECT c.id, c.chunk_text, c.article_id, c.chunk_index, c.title,
+                   c.article_url, c.sources, c.entities,
+                   bm25(article_chunks_fts, 5.0, 1.0) AS rank
+            FROM article_chunks_fts
+            JOIN article_chunks c ON c.id = article_chunks_fts.rowid
+            WHERE article_chunks_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match, k)).fetchall()
+        return [(chunk_row_to_document(row[:8]), -row[8]) for row in rows]
+
+    def search_many(self, texts: List[str], k: int = 20) -> List[List[Tuple[Document, float]]]:
+        return [self.search(text, k=k) for text in texts if text.strip()]
+
+    # ---------- Точное совпадение с названием ----------
+    def load_titles(self) -> int:
+        """Загружает словарь названий и редиректов (original_title) -> article_id, в том числе по леммам."""
+        from app.rag.NER import _lemmatize
+
+        with self._lock:
+            if self._titles is not None:
+                return len(self._titles)
+            titles: Dict[str, List[int]] = {}
+            lemmas: Dict[str, List[int]] = {}
+            rows = self._connection().execute('''
+                SELECT DISTINCT a.id, a.final_title, a.original_title
+                FROM articles a
+                WHERE EXISTS (SELECT 1 FROM article_chunks c WHERE c.article_id = a.id)
+            ''').fetchall()
+            for article_id, final_title, original_title in rows:
+                for title in {final_title, original_title}:
+                    if not title:
+                        continue
+                    for index, key in ((titles, normalize_entity_name(title)), (lemmas, _lemmatize(title))):
+                        if not key:
+                            continue
+                        ids = index.setdefault(key, [])
+                        if article_id not in ids:
+                            ids.append(article_id)
+            self._titles, self._title_lemmas = titles, lemmas
+            logger.info(f"Loaded {len(titles)} article titles for exact matching")
+            return len(titles)
+
+    def match_title(self, query: str) -> Optional[int]:
+        """
+        article_id, если запрос (без вопросительного оборота) однозначно совпадает с названием статьи
+        или её редиректом — дословно или по леммам. Иначе None.
+        """
+        from app.rag.NER import _lemmatize
+
+        self.load_titles()
+        key = normalize_entity_name(re.sub(r"[^\w\s-]", " ", query))
+        for prefix in QUESTION_PREFIXES:
+            if key.startswith(prefix + " "):
+                key = key[len(prefix) + 1:]
+                break
+        if not key:
+            return None
+
+        ids = self._titles.get(key) or self._title_lemmas.get(_lemmatize(key)) or []
+        return ids[0] if len(ids) == 1 else None
+
+    def find_articles(self, text: str, max_ngram: int = 3) -> List[int]:
+        """
+        article_id статей, чьё название (по леммам) встречается в тексте как последовательность
+        из 1..max_ngram слов. Дешёвая замена NER для маршрутизации запроса.
+        """
+        from app.rag.NER import STOP_WORDS, get_morph
+
+        self.load_titles()
+        morph = get_morph()
+        tokens = re.findall(r"\w+", text.lower())
+        lemmas = [morph.parse(t)[0].normal_form for t in tokens]
+        found: List[int] = []
+        for n in range(1, max_ngram + 1):
+            for i in range(len(lemmas) - n + 1):
+                if n == 1 and (tokens[i] in STOP_WORDS or len(tokens[i]) < 3):
+                    continue
+                for article_id in self._title_lemmas.get(" ".join(lemmas[i:i + n]), []):
+                    if article_id not in found:
+                        found.append(article_id)
+        return found
+
+    def article_titles(self, article_ids: List[int]) -> Dict[int, str]:
+        """Названия статей (final_title, как у узлов графа) по article_id."""
+        if not article_ids:
+            return {}
+        return dict(self._connection().execute(
+            f"SELECT id, final_title FROM articles WHERE id IN ({placeholders(len(article_ids))})",
+            list(article_ids),
+        ))
+
+    def article_chunks(self, article_id: int, limit: int = 6) -> List[Tuple[Document, float]]:
+        """Первые чанки статьи по порядку (вводная часть — самая общая информация)."""
+        rows = self._connection().execute('''
+            SELECT id, chunk_text, article_id, chunk_index, title, article_url, sources, entities
+            FROM article_chunks
+            WHERE article_id = ? AND LENGTH(chunk_text) > 10
+            ORDER BY chunk_index
+            LIMIT ?
+        ''', (article_id, limit)).fetchall()
+        return [(chunk_row_to_document(row), 1.0) for row in rows]
+
+
+_lexical_index = None
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical_index
+    if _lexical_index is None:
+        _lexical_index = LexicalIndex()
+    return _lexical_index
@@ -1,21 +1,20 @@
-from langchain_community.chat_models import ChatOpenAI
-from langchain_ollama import ChatOllama
-from app.config import OPENROUTER_API_KEY, LLM_MODEL_NAME, OPENROUTER_API_BASE
-from langchain_gigachat.chat_models import GigaChat
-from app.config import GIGA_KEY
+from app.config import LLM_PRIMARY, LLM_SECONDARY
+from app.rag.llm_router import LLMRouter, register_router
+from app.rag.llm_clients import get_client_registry, role_config
 
-def get_llm(temperature: float = 0.12, ollama: bool = False):
-    if ollama == True:
-        return ChatOllama(
-            model="owl/t-lite:latest",
-            #openai_api_key=OPENROUTER_API_KEY,
-            #openai_api_base=OPENROUTER_API_BASE,
-            base_url="http://localhost:11434",
-            temperature=temperature
-            )
-    else:
-        return GigaChat(
-            credentials=GIGA_KEY,
-            verify_ssl_certs=False,
-            temperature=temperature
-        )
+_llms = {}
+
+
+def get_llm(role: str = "answer") -> LLMRouter:
+    """
+    Маршрутизатор LLM для роли (один на процесс): LLM_PRIMARY, при задержке или ошибке — LLM_SECONDARY,
+    с дедлайном роли и размыкателями (app/rag/llm_router.py). Клиенты бэкендов и токен GigaChat
+    общие для всех ролей (app/rag/llm_clients.py).
+    """
+    if role not in _llms:
+        registry = get_client_registry()
+        names = [LLM_PRIMARY] + ([LLM_SECONDARY] if LLM_SECONDARY and LLM_SECONDARY != LLM_PRIMARY else [])
+        _llms[role] = register_router(LLMRouter(
+            role, [(name, registry.chat_model(name, role)) for name in names], timeout=role_config(role)["timeout"]
+        ))
+    return _llms[role]
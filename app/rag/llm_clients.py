@@ -0,0 +1,227 @@
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from langchain_ollama import ChatOllama
+from langchain_gigachat.chat_models import GigaChat
+
+from app.config import (
+    GIGA_KEY, GIGACHAT_MODEL, GIGACHAT_TOKEN_REFRESH_MARGIN, OLLAMA_BASE_URL, OLLAMA_MODEL,
+    LLM_TIMEOUT_DECOMPOSER, LLM_TIMEOUT_AGENT, LLM_TIMEOUT_ANSWER,
+)
+
+logger = logging.getLogger(__name__)
+
+# Настройки ролей: у каждой своя температура и дедлайн вызова (с), клиенты и токен — общие
+ROLE_CONFIG = {
+    "decomposer": {"temperature": None, "timeout": LLM_TIMEOUT_DECOMPOSER},
+    "agent": {"temperature": 0.12, "timeout": LLM_TIMEOUT_AGENT},
+    "answer": {"temperature": 0.12, "timeout": LLM_TIMEOUT_ANSWER},
+}
+# Токен GigaChat живёт 30 минут; если время жизни не пришло — обновлять с таким интервалом (с)
+DEFAULT_TOKEN_TTL = 1800
+# Не обновлять токен чаще, чем раз в столько секунд (защита от цикла при коротком сроке жизни)
+MIN_REFRESH_INTERVAL = 30
+
+
+def role_config(role: str) -> Dict:
+    return ROLE_CONFIG.get(role, ROLE_CONFIG["answer"])
+
+
+class SharedGigaChat(GigaChat):
+    """
+    GigaChat, который вместо собственного SDK-клиента (свой httpx-пул и свой OAuth-токен на экземпляр)
+    берёт общий клиент реестра. Температура, модель и прочие параметры запроса остаются свои.
+    """
+
+    @property
+    def _client(self):
+        registry = get_client_registry()
+        # токен — в процессе, который обращается к GigaChat (после fork — в воркере, а не в родителе)
+        registry.start_token_refresh()
+        return registry.gigachat_client()
+
+
+class SharedChatOllama(ChatOllama):
+    """ChatOllama с общим клиентом реестра вместо собственного; клиент берётся при каждом вызове."""
+
+    @property
+    def _client(self):
+        return get_client_registry().ollama_client(max(c["timeout"] for c in ROLE_CONFIG.values()))
+
+
+class LLMClientRegistry:
+    """
+    Общие клиенты LLM процесса:
+    - один SDK-клиент GigaChat на все роли: один keep-alive пул соединений и один OAuth-токен,
+      который обновляется заранее, за GIGACHAT_TOKEN_REFRESH_MARGIN до истечения (SDK сам обновляет
+      токен только после ответа 401, то есть ценой лишнего запроса);
+    - один клиент Ollama на все роли;
+    - чат-модели по (бэкенд, роль) создаются один раз.
+    Счётчики: HTTP-запросы, новые соединения (остальные — переиспользованные), получения токена.
+    Клиенты и таймер токена принадлежат процессу: после fork воркер создаёт свои (reset_after_fork),
+    модели же хранят не клиенты, а обращаются к реестру, поэтому их можно создать до fork.
+    """
+
+    def __init__(self):
+        self._models: Dict[tuple, object] = {}
+        self._lock = threading.RLock()
+        self._reset_clients()
+
+    def _reset_clients(self):
+        self._gigachat = None
+        self._ollama = None
+        self._counters = Counter()
+        self._refresh_timer: Optional[threading.Timer] = None
+        self._refresh_started = False
+        self._token_expires_at: Optional[float] = None
+
+    def reset_after_fork(self):
+        """
+        В дочернем процессе: пулы соединений родителя (общие TLS-сокеты) не используются, таймер
+        обновления токена после fork не существует — клиенты и токен создаются заново при первом вызове.
+        """
+        self._lock = threading.RLock()
+        self._reset_clients()
+
+    # ---------- Метрики HTTP ----------
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def _instrument(self, http_client, prefix: str):
+        """Хуки httpx: каждый запрос и каждое новое TCP-соединение (событие trace httpcore)."""
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.started":
+                self._count(f"{prefix}_connections")
+
+        def on_request(request):
+            request.extensions["trace"] = trace
+            self._count(f"{prefix}_requests")
+
+        http_client.event_hooks = {"request": [on_request], "response": []}
+
+    # ---------- GigaChat ----------
+    def gigachat_client(self):
+        with self._lock:
+            if self._gigachat is None:
+                import gigachat
+
+                # HTTP-таймаут общий: не меньше самого длинного дедлайна ролей
+                timeout = max(config["timeout"] for config in ROLE_CONFIG.values())
+                client = gigachat.GigaChat(credentials=GIGA_KEY, verify_ssl_certs=False, timeout=timeout)
+                try:
+                    # _client и _auth_client — httpx-клиенты SDK (gigachat 0.1.x)
+                    self._instrument(client._client, "gigachat")
+                    self._instrument(client._auth_client, "gigachat_auth")
+                except AttributeError as e:
+                    logger.warning(f"GigaChat SDK clients not instrumented: {e}")
+                self._gigachat = client
+                logger.info("Created shared GigaChat client")
+            return self._gigachat
+
+    def refresh_token(self):
+        """Получает новый токен GigaChat и планирует следующее обновление до истечения этого."""
+        client = self.gigachat_client()
+        try:
+            token = client.get_token()
+            self._count("token_refreshes")
+            expires_at = token.expires_at / 1000 if token and token.expires_at else time.time() + DEFAULT_TOKEN_TTL
+            self._token_expires_at = expires_at
+            delay = max(expires_at - time.time() - GIGACHAT_TOKEN_REFRESH_MARGIN, MIN_REFRESH_INTERVAL)
+            logger.info(f"GigaChat token refreshed, next refresh in {delay:.0f} s")
+        except Exception as e:
+            self._count("token_refresh_errors")
+            delay = MIN_REFRESH_INTERVAL
+            logger.warning(f"GigaChat token refresh failed, retry in {delay} s: {e}")
+        self._schedule_refresh(delay)
+
+    def _schedule_refresh(self, delay: float):
+        with self._lock:
+            if self._refresh_timer is not None:
+                self._refresh_timer.cancel()
+            self._refresh_timer = threading.Timer(delay, self.refresh_token)
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+
+    def start_token_refresh(self):
+        """Первый токен — сразу (при старте, а не в первом запросе), дальше — по таймеру."""
+        with self._lock:
+            if not GIGA_KEY or self._refresh_started:
+                return
+            self._refresh_started = True
+        self.refresh_token()
+
+    # ---------- Ollama ----------
+    def ollama_client(self, timeout: float):
+        with self._lock:
+            if self._ollama is None:
+                from ollama import Client
+
+                self._ollama = Client(host=OLLAMA_BASE_URL, timeout=timeout)
+                try:
+                    self._instrument(self._ollama._client, "ollama")
+                except AttributeError as e:
+                    logger.warning(f"Ollama client not instrumented: {e}")
+            return self._ollama
+
+    # ---------- Чат-модели ----------
+    def chat_model(self, backend: str, role: str):
+        """Чат-модель бэкенда с настройками роли; HTTP-клиенты и токен общие для всех ролей."""
+        key = (backend, role)
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            config = role_config(role)
+            if backend == "gigachat":
+                model = SharedGigaChat(
+                    credentials=GIGA_KEY,
+                    verify_ssl_certs=False,
+                    model=GIGACHAT_MODEL,
+                    temperature=config["temperature"],
+                    timeout=config["timeout"],
+                )
+            elif backend == "ollama":
+                model = SharedChatOllama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, temperature=config["temperature"])
+            else:
+                raise ValueError(f"Unknown LLM backend: {backend}")
+            self._models[key] = model
+            logger.info(f"Created {backend} chat model for role {role}")
+        return model
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        stats = {"models": len(self._models), **counters}
+        for prefix in ("gigachat", "ollama"):
+            requests = counters.get(f"{prefix}_requests", 0)
+            if requests:
+                stats[f"{prefix}_connection_reuse"] = round(1 - counters.get(f"{prefix}_connections", 0) / requests, 3)
+        if self._token_expires_at:
+            stats["token_expires_in_s"] = round(self._token_expires_at - time.time())
+        return stats
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> LLMClientRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMClientRegistry()
+        return _registry
+
+
+def _after_fork_in_child():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    if _registry is not None:
+        _registry.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,320 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from app.config import (
+    LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_BUDGET,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN, LLM_THREADS,
+)
+from app.rag.deadline import llm_timeout
+from app.rag.accounting import current_ledger, record_call
+
+logger = logging.getLogger(__name__)
+
+# Пока успешных вызовов меньше, задержка хеджирования — LLM_HEDGE_MIN_DELAY, а не перцентиль
+MIN_LATENCY_SAMPLES = 20
+
+
+class LLMTimeoutError(TimeoutError):
+    """Ни один бэкенд не ответил до дедлайна вызова."""
+
+
+class LLMUnavailableError(RuntimeError):
+    """Все бэкенды недоступны: размыкатели открыты или вызовы завершились ошибкой."""
+
+
+# ---------- Размыкатели ----------
+class CircuitBreaker:
+    """
+    Размыкатель на бэкенд (общий для всех ролей): после failure_threshold ошибок подряд
+    (таймаут — тоже ошибка) бэкенд не вызывается cooldown секунд, затем пропускается
+    один пробный вызов (half_open): успех замыкает цепь, ошибка размыкает снова.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"[llm:{self.name}] circuit closed")
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"[llm:{self.name}] circuit opened after {self._failures} failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+# ---------- Статистика ----------
+class RouterStats:
+    """Счётчики роли: вызовы, хеджирование и по каждому бэкенду — задержки успешных вызовов и ошибки."""
+
+    def __init__(self, backends: List[str]):
+        self.calls = 0
+        self.hedges = 0
+        self.backends = {
+            name: {"calls": 0, "errors": 0, "timeouts": 0, "wins": 0, "hedge_wins": 0, "latencies": deque(maxlen=500)}
+            for name in backends
+        }
+        self.lock = threading.Lock()
+
+    def percentile(self, name: str, q: float) -> Optional[float]:
+        with self.lock:
+            latencies = list(self.backends[name]["latencies"])
+        return float(np.percentile(latencies, q)) if len(latencies) >= MIN_LATENCY_SAMPLES else None
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            backends = {}
+            for name, counters in self.backends.items():
+                latencies = list(counters["latencies"])
+                backends[name] = {
+                    **{key: value for key, value in counters.items() if key != "latencies"},
+                    "p50_s": round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+                    "p95_s": round(float(np.percentile(latencies, 95)), 3) if latencies else None,
+                    "circuit": get_breaker(name).state,
+                }
+            return {"calls": self.calls, "hedges": self.hedges, "backends": backends}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _submit(fn, *args, **kwargs) -> Future:
+    """Вызов бэкенда в общем пуле; своя копия контекста — трассировка langsmith сохраняется."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=LLM_THREADS, thread_name_prefix="llm")
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class _Settled:
+    """Вызовы, исход которых уже передан размыкателю: settle и ветка дедлайна учитывают каждый ровно раз."""
+
+    def __init__(self):
+        self._futures: set = set()
+        self._lock = threading.Lock()
+
+    def claim(self, future: Future) -> bool:
+        with self._lock:
+            if future in self._futures:
+                return False
+            self._futures.add(future)
+            return True
+
+
+# ---------- Маршрутизатор ----------
+class LLMRouter(Runnable[LanguageModelInput, BaseMessage]):
+    """
+    Runnable поверх нескольких чат-моделей (первая — основная), подключается вместо модели
+    в цепочки, агента и нормализатор запросов:
+    - у каждого вызова дедлайн timeout, урезанный по дедлайну запроса (llm_timeout):
+      не ответил ни один бэкенд — LLMTimeoutError;
+    - если основной бэкенд не ответил за перцентиль hedge_percentile своих задержек (не меньше
+      hedge_min_delay), параллельно вызывается следующий; берётся первый ответ. Хеджируется
+      не больше доли hedge_budget вызовов;
+    - ошибка бэкенда сразу передаёт вызов следующему; бэкенд с открытым размыкателем пропускается.
+    Брошенные вызовы не прерываются, но их исход учитывается в статистике и размыкателях.
+    Каждый вызов бэкенда (токены, задержка) записывается в учёт вопроса (app/rag/accounting.py).
+    """
+
+    def __init__(
+        self,
+        role: str,
+        backends: List[Tuple[str, Runnable]],
+        timeout: float,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_budget: float = LLM_HEDGE_BUDGET,
+        stats: Optional[RouterStats] = None,
+    ):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.role = role
+        self.backends = backends
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.stats = stats or RouterStats([name for name, _ in backends])
+
+    def bind_tools(self, tools, **kwargs) -> "LLMRouter":
+        """Те же бэкенды с инструментами; статистика и размыкатели общие с исходным маршрутизатором."""
+        return LLMRouter(
+            self.role,
+            [(name, model.bind_tools(tools, **kwargs)) for name, model in self.backends],
+            self.timeout, self.hedge_percentile, self.hedge_min_delay, self.hedge_budget, self.stats,
+        )
+
+    def hedge_delay(self, name: str) -> float:
+        latency = self.stats.percentile(name, self.hedge_percentile)
+        return self.hedge_min_delay if latency is None else max(self.hedge_min_delay, latency)
+
+    def _launch(self, name: str, model: Runnable, input, config, kwargs, settled: "_Settled") -> Future:
+        launched_at = time.monotonic()
+
+        def call():
+            # учёт пишется до того, как ответ увидит вызывающий: следующая стадия видит его в бюджете
+            try:
+                message = model.invoke(input, config, **kwargs)
+            except Exception:
+                record_call(current_ledger(), self.role, time.monotonic() - launched_at, failed=True)
+                raise
+            record_call(current_ledger(), self.role, time.monotonic() - launched_at, message)
+            return message
+
+        future = _submit(call)
+
+        def settle(done: Future):
+            # исход каждого вызова, в том числе брошенного после ответа другого бэкенда
+            failed = done.exception() is not None
+            with self.stats.lock:
+                counters = self.stats.backends[name]
+                counters["calls"] += 1
+                if failed:
+                    counters["errors"] += 1
+                else:
+                    counters["latencies"].append(time.monotonic() - launched_at)
+            # размыкатель получает один исход на вызов: если его уже засчитали таймаутом — пропускаем
+            if not settled.claim(done):
+                return
+            if failed:
+                get_breaker(name).record_failure()
+            else:
+                get_breaker(name).record_success()
+
+        future.add_done_callback(settle)
+        return future
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> BaseMessage:
+        started = time.monotonic()
+        timeout = llm_timeout(self.role, self.timeout)
+        if timeout <= 0:
+            raise LLMTimeoutError(f"[{self.role}] request deadline exhausted, LLM not called")
+        deadline = started + timeout
+        candidates = list(self.backends)
+        pending: Dict[Future, Tuple[str, bool]] = {}
+        settled = _Settled()
+        errors: List[str] = []
+        with self.stats.lock:
+            self.stats.calls += 1
+
+        def launch_next(hedge: bool) -> bool:
+            while candidates:
+                name, model = candidates.pop(0)
+                if get_breaker(name).allow():
+                    pending[self._launch(name, model, input, config, kwargs, settled)] = (name, hedge)
+                    return True
+                errors.append(f"{name}: circuit open")
+            return False
+
+        if not launch_next(hedge=False):
+            raise LLMUnavailableError(f"[{self.role}] no LLM backend available: {'; '.join(errors)}")
+        primary = next(iter(pending.values()))[0]
+        hedge_at = started + self.hedge_delay(primary)
+        hedged = False
+
+        while pending:
+            wake = deadline if hedged or not candidates else min(deadline, hedge_at)
+            done, _ = wait(list(pending), timeout=max(wake - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                name, hedge = pending.pop(future)
+                if future.exception() is not None:
+                    errors.append(f"{name}: {future.exception()}")
+                    logger.warning(f"[llm:{self.role}] {name} failed: {future.exception()}")
+                    continue
+                with self.stats.lock:
+                    self.stats.backends[name]["wins"] += 1
+                    self.stats.backends[name]["hedge_wins"] += hedge
+                if hedge:
+                    logger.info(f"[llm:{self.role}] hedged call to {name} answered first "
+                                f"after {time.monotonic() - started:.2f} s")
+                return future.result()
+
+            now = time.monotonic()
+            if now >= deadline:
+                for future, (name, _) in pending.items():
+                    # вызов мог завершиться после wait(): тогда его исход уже учёл settle
+                    if not settled.claim(future):
+                        continue
+                    get_breaker(name).record_failure()
+                    with self.stats.lock:
+                        self.stats.backends[name]["timeouts"] += 1
+                raise LLMTimeoutError(
+                    f"[{self.role}] no LLM answer within {timeout:.3g} s "
+                    f"({', '.join(name for name, _ in pending.values())})"
+                )
+            if not pending:
+                # основной бэкенд упал — сразу следующий, без ожидания перцентиля
+                launch_next(hedge=False)
+            elif not hedged and candidates and now >= hedge_at:
+                hedged = True
+                with self.stats.lock:
+                    within_budget = self.stats.hedges < self.hedge_budget * self.stats.calls
+                    if within_budget:
+                        self.stats.hedges += 1
+                if within_budget and launch_next(hedge=True):
+                    logger.info(f"[llm:{self.role}] {primary} slower than {now - started:.2f} s, hedging")
+
+        raise LLMUnavailableError(f"[{self.role}] all LLM backends failed: {'; '.join(errors)}")
+
+
+_routers: Dict[str, LLMRouter] = {}
+
+
+def register_router(router: LLMRouter) -> LLMRouter:
+    _routers[router.role] = router
+    return router
+
+
+def router_stats() -> Dict[str, Dict]:
+    return {role: router.stats.snapshot() for role, router in _routers.items()}
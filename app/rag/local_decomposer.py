@@ -0,0 +1,150 @@
+import re
+import time
+import logging
+import threading
+from collections import deque
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+from app.config import DECOMPOSER_MODE, LOCAL_DECOMPOSER_MAX_WORDS
+from app.rag.accounting import budget_exceeded
+
+logger = logging.getLogger(__name__)
+
+# каждые столько вопросов в лог пишется доля вопросов без LLM и задержки
+REPORT_EVERY = 100
+# Слова, после которых вопрос почти всегда распадается на несколько под-вопросов или требует связей
+COMPLEX_MARKERS = {
+    "и", "или", "либо", "чем", "между", "против", "vs", "сравни", "сравнить", "сравнение",
+    "отличие", "отличия", "отличается", "отличаются", "разница", "связь", "связаны", "связан",
+}
+
+
+def ner_entities(question: str) -> List[str]:
+    """
+    Сущности вопроса без LLM: газеттир (нечёткое совпадение с названиями статей) и Natasha NER,
+    пересечения разрешаются merge_entities. Каноническое написание — из газеттира или нормальная форма Natasha.
+    """
+    from app.rag.NER import gazetteer_ner, natasha_ner, merge_entities, STOP_WORDS
+
+    entities = []
+    for entity in merge_entities(gazetteer_ner(question) + natasha_ner(question)):
+        if entity.text.lower() in STOP_WORDS or len(entity.text) < 3:
+            continue
+        name = (entity.canonical or entity.text).strip()
+        if name and name not in entities:
+            entities.append(name)
+    return entities
+
+
+def classify(question: str, max_words: int = LOCAL_DECOMPOSER_MAX_WORDS) -> Tuple[bool, str, List[str]]:
+    """
+    Простой вопрос — одно короткое предложение без перечислений и сравнений ровно с одной сущностью
+    («Кто такой Ферр Манус?»): LLM вернула бы его же и эту сущность.
+    Возвращает (простой ли, причина, сущности).
+    """
+    from razdel import sentenize, tokenize as razdel_tokenize
+
+    words = [t.text.lower() for t in razdel_tokenize(question) if re.search(r"\w", t.text)]
+    if not words:
+        return False, "empty", []
+    if len(words) > max_words:
+        return False, f"{len(words)} words", []
+    if len(list(sentenize(question.strip()))) > 1:
+        return False, "several sentences", []
+    markers = COMPLEX_MARKERS.intersection(words)
+    if markers or re.search(r"[,;]", question):
+        return False, f"markers {sorted(markers) or 'punctuation'}", []
+
+    entities = ner_entities(question)
+    if len(entities) != 1:
+        return False, f"{len(entities)} entities", entities
+    return True, "single entity", entities
+
+
+def _percentile(values, q) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class LocalDecomposer:
+    """
+    Разбор вопроса на под-вопросы и сущности: простые вопросы — локально (газеттир, razdel, Natasha),
+    сложные — через GigaChat (split_and_extract_entities). Каждое решение и его задержка пишутся в лог,
+    раз в REPORT_EVERY вопросов — доля вопросов без LLM. Если бюджет LLM вопроса исчерпан
+    (app/rag/accounting.py), сложный вопрос ищется целиком с локально найденными сущностями.
+    mode=llm — всегда GigaChat, как раньше.
+    """
+
+    def __init__(self, mode: str = DECOMPOSER_MODE, max_words: int = LOCAL_DECOMPOSER_MAX_WORDS):
+        self.mode = mode
+        self.max_words = max_words
+        self._counts = {"local": 0, "llm": 0}
+        self._check_ms = deque(maxlen=1000)
+        self._llm_ms = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def decompose(self, question: str) -> Dict:
+        from app.rag.query_normalizer import split_and_extract_entities
+
+        check_ms = 0.0
+        reason = "mode llm"
+        entities = []
+        if self.mode == "local":
+            started = time.perf_counter()
+            try:
+                simple, reason, entities = classify(question, self.max_words)
+            except Exception as e:
+                logger.warning(f"Local decomposition failed, falling back to LLM: {e}")
+                simple, reason, entities = False, "error", []
+            check_ms = (time.perf_counter() - started) * 1000
+            if simple:
+                logger.info(f"Decomposition: local ({reason}) in {check_ms:.1f} ms, entities={entities}")
+                self._record("local", check_ms)
+                return {"entities": entities, "questions": [{"text": question.strip()}]}
+
+        if budget_exceeded("decomposer"):
+            self._record("local", check_ms)
+            return {"entities": entities, "questions": [{"text": question.strip()}]}
+
+        started = time.perf_counter()
+        parsed = split_and_extract_entities(question)
+        llm_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Decomposition: LLM ({reason}), local check {check_ms:.1f} ms, LLM {llm_ms:.0f} ms")
+        self._record("llm", check_ms, llm_ms)
+        return parsed
+
+    def _record(self, decision: str, check_ms: float, llm_ms: float = None):
+        with self._lock:
+            self._counts[decision] += 1
+            if self.mode == "local":
+                self._check_ms.append(check_ms)
+            if llm_ms is not None:
+                self._llm_ms.append(llm_ms)
+            if sum(self._counts.values()) % REPORT_EVERY == 0:
+                logger.info(f"Decomposition stats: {self._stats()}")
+
+    def _stats(self) -> Dict:
+        total = sum(self._counts.values())
+        return {
+            **self._counts,
+            "skip_rate": round(self._counts["local"] / total, 3) if total else 0.0,
+            "local_check_p50_ms": round(_percentile(self._check_ms, 50), 1),
+            "local_check_p95_ms": round(_percentile(self._check_ms, 95), 1),
+            "llm_p50_ms": round(_percentile(self._llm_ms, 50)),
+            "llm_p95_ms": round(_percentile(self._llm_ms, 95)),
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return self._stats()
+
+
+_decomposer = None
+
+
+def get_decomposer() -> LocalDecomposer:
+    global _decomposer
+    if _decomposer is None:
+        _decomposer = LocalDecomposer()
+    return _decomposer
@@ -1,18 +1,11 @@
 import logging
 import json
 from langchain.prompts import PromptTemplate
-from langchain_gigachat.chat_models import GigaChat
 from langchain_core.utils.json import parse_json_markdown
-from app.config import GIGA_KEY
+from app.rag.llm import get_llm
 
 logger = logging.getLogger(__name__)
 
-# Инициализация модели
-giga = GigaChat(
-    credentials=GIGA_KEY,
-    verify_ssl_certs=False
-)
-
 split_prompt_template = PromptTemplate(
     input_variables=["question"],
     template="""
@@ -51,7 +44,7 @@ def split_and_extract_entities(user_question: str) -> dict:
     prompt = split_prompt_template.format(question=user_question)
 
     try:
-        raw_response = giga.invoke(prompt).content
+        raw_response = get_llm("decomposer").invoke(prompt).content
     except Exception as e:
         logger.error(f"Ошибка при запросе к LLM: {e}")
         return {"entities": [], "questions": []}
@@ -1,27 +1,29 @@
 import logging
 import asyncio
-from app.config import CHROMA_PERSIST_DIR
-from app.chunks_loader import DatabaseTextLoader
-from app.rag.retriever import build_or_load_vectorstore
+from app.rag.retriever import get_vectorstore, build_retriever
 from app.rag.llm import get_llm
 from app.rag.rag_chain import build_rag_chain
+from app.rag.cpu_pool import cpu_pool
+from app.rag.cache import cache_stats
+from app.rag.conversation import current_chat, get_conversation_memory
+from app.rag.deadline import Deadline, current_deadline_var
+from app.rag.accounting import RequestLedger, current_ledger_var, get_accounting
 from app.formatter import TelegramMarkdownFormatter
 
 logger = logging.getLogger(__name__)
 
-# Инициализация
-if CHROMA_PERSIST_DIR.exists() and any(CHROMA_PERSIST_DIR.iterdir()):
-    logger.info("Loading existing vectorstore from %s", CHROMA_PERSIST_DIR)
-    retriever = build_or_load_vectorstore([])
-else:
-    logger.info("Creating new vectorstore")
-    loader = DatabaseTextLoader()
-    chunks, _ = loader.load_and_split_documents()
-    retriever = build_or_load_vectorstore(chunks)
-    logger.info("Vectorstore created at %s", CHROMA_PERSIST_DIR)
+# Инициализируется явно через init_rag() (см. app/bootstrap.py), а не при импорте
+retriever = None
+rag_chain = None
 
-llm = get_llm()
-rag_chain = build_rag_chain(llm, retriever)
+
+def init_rag(llm=None):
+    """Собирает ретривер и RAG-цепочку из уже загруженных ресурсов."""
+    global retriever, rag_chain
+    if rag_chain is None:
+        retriever = build_retriever(get_vectorstore())
+        rag_chain = build_rag_chain(llm or get_llm("answer"), retriever)
+    return rag_chain
 
 
 def format_sources(source_documents):
@@ -49,8 +51,37 @@ def format_sources(source_documents):
     return sources_text
 
 
-async def get_rag_answer(user_input: str):
-    result = await asyncio.to_thread(rag_chain.invoke, {"input": user_input})
+async def get_rag_answer(user_input: str, chat_id: int = None):
+    """
+    chat_id включает память диалога: уточняющий вопрос опирается на контекст прошлого ответа чата.
+    У вопроса общий дедлайн (REQUEST_DEADLINE): стадии урезают работу по его остатку,
+    ответ генерируется из контекста, собранного к этому моменту.
+    Вызовы LLM и токены вопроса учитываются по ролям (app/rag/accounting.py).
+    """
+    if rag_chain is None:
+        raise RuntimeError("RAG pipeline is not initialized")
+    deadline = Deadline()
+    ledger = RequestLedger()
+    chat_token = current_chat.set(chat_id)
+    deadline_token = current_deadline_var.set(deadline)
+    ledger_token = current_ledger_var.set(ledger)
+    try:
+        # asyncio.to_thread копирует контекст, ретривер видит current_chat, дедлайн и учёт LLM
+        result = await asyncio.to_thread(rag_chain.invoke, {"input": user_input})
+    finally:
+        current_ledger_var.reset(ledger_token)
+        current_deadline_var.reset(deadline_token)
+        current_chat.reset(chat_token)
+        get_accounting().close(ledger)
+    if deadline.shrunk:
+        logger.info(f"Answered in {deadline.elapsed():.1f} s within deadline {deadline.budget:g} s, "
+                    f"shrunk stages: {', '.join(deadline.shrunk)}")
     raw_response = result.get("answer", "Не удалось получить ответ")
     sources = format_sources(result.get("context", []))
+    logger.debug("CPU pool stats: %s", cpu_pool.stats())
+    logger.debug("Retrieval cache stats: %s", cache_stats())
     return TelegramMarkdownFormatter.format_into_chunks(raw_response + sources)
+
+
+def reset_conversation(chat_id: int):
+    get_conversation_memory().forget(chat_id)
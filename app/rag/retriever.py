@@ -1,5 +1,6 @@
 import logging
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import List, Dict, Tuple, Any, Optional, Callable
 from collections import defaultdict
 
 from langchain_core.documents import Document
@@ -7,10 +8,28 @@ from langchain_chroma import Chroma
 from langchain.schema import BaseRetriever
 from pydantic import Field
 
-from app.rag.embedding_model import MLMEmbeddings
-from app.rag.NER import normalize_text_entities
-from app.config import EMBEDDING_MODEL_NAME, CHROMA_PERSIST_DIR
-from app.rag.query_normalizer import split_and_extract_entities
+from app.rag.embedding_model import get_embedding_model
+from app.rag.cpu_pool import cpu_pool
+from app.rag.lexical import get_lexical_index, reciprocal_rank_fusion
+from app.rag.flat_index import FlatVectorIndex
+from app.rag.hydration import get_hydrator
+from app.rag.cache import get_cache
+from app.rag.context_packer import NodeContext, get_context_packer
+from app.rag.indexer import chunk_doc_id
+from app.chunks_loader import normalize_entity_name
+from app.rag.sharding import ShardedVectorStore, ShardRouter, SHARDS_FILE
+from app.rag.title_index import get_title_index
+from app.rag.speculation import submit, local_entities, looks_sufficient, prefetch_nodes
+from app.rag.conversation import (
+    ConversationTurn, current_chat, get_conversation_memory, is_follow_up, contextualize, FOLLOWUP_LEAD_CHUNKS,
+)
+from app.config import (
+    CHROMA_PERSIST_DIR, LEXICAL_MODE, LEXICAL_TOP_K, RRF_K, VECTOR_BACKEND, FLAT_INDEX_DIR, ENTITY_SEARCH_MODE,
+    SPECULATIVE_MODE,
+)
+from app.rag.local_decomposer import get_decomposer
+from app.rag.deadline import current_deadline
+from app.rag.accounting import budget_exceeded
 from app.graph.node import get_node_info, calculate_graph_metrics
 from app.rag.llm import get_llm
 from app.rag.agent import GraphContextOptimizer
@@ -18,39 +37,165 @@ from langsmith import traceable
 
 logger = logging.getLogger(__name__)
 
-# --- Эмбеддинги ---
-embedding_model = MLMEmbeddings(EMBEDDING_MODEL_NAME)
+_vectorstore = None
+
+# Если до дедлайна стадий меньше стольких секунд, попарные метрики графа (O(n²) запросов к Neo4j)
+# считаются только для top_k_final лучших по RRF кандидатов
+GRAPH_FULL_BUDGET = 10.0
+# С меньшим остатком агент графа не запускается: контекст собирается из неочищенного графа
+MIN_AGENT_BUDGET = 3.0
 
 
 class HybridRetriever(BaseRetriever):
     """Retriever с гибридным поиском по под-вопросам, сущностям и графовой структуре."""
     
-    vectorstore: Chroma = Field(...)
+    vectorstore: Any = Field(...)  # Chroma или FlatVectorIndex
     top_k_vector: int = Field(default=50)
     top_k_final: int = Field(default=10)
+    top_k_lexical: int = Field(default=LEXICAL_TOP_K)
+    lexical_mode: str = Field(default=LEXICAL_MODE)
+    rrf_k: int = Field(default=RRF_K)
+    entity_search_mode: str = Field(default=ENTITY_SEARCH_MODE)
+    speculative_mode: str = Field(default=SPECULATIVE_MODE)
+
+    @traceable
+    def _search_by_vectors(self, texts: List[str]) -> List[List[Tuple[Document, float]]]:
+        """
+        Векторный поиск по готовым текстам; эмбеддинги считаются в CPU-пуле. Один ранжированный список на текст.
+        Результаты тонкого индекса (только ID чанков) дополняются из SQLite одним запросом на все списки.
+        """
+        if not texts:
+            return []
+        return self._search_by_embeddings(cpu_pool.embed_many(texts), texts)
+
+    def _search_by_embeddings(self, vectors, texts: Optional[List[str]] = None) -> List[List[Tuple[Document, float]]]:
+        if not len(vectors):
+            return []
+        if isinstance(self.vectorstore, FlatVectorIndex):
+            # все тексты запроса — одним умножением матриц
+            ranked_lists = self.vectorstore.similarity_search_by_vectors_with_scores(vectors, k=self.top_k_vector)
+        elif isinstance(self.vectorstore, ShardedVectorStore):
+            # каждый текст — только в шарды категорий упомянутых в нём статей
+            router = ShardRouter(self.vectorstore)
+            ranked_lists = [
+                self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                    vector.tolist(), k=self.top_k_vector, shards=router.route(texts[i]) if texts else None
+                )
+                for i, vector in enumerate(vectors)
+            ]
+        else:
+            ranked_lists = [
+                self.vectorstore.similarity_search_by_vector_with_relevance_scores(vector, k=self.top_k_vector)
+                for vector in vectors
+            ]
+        return get_hydrator().hydrate(ranked_lists)
+
+    def _cached_search(
+        self, cache_name: str, texts: List[str], search: Callable[[List[str]], List[List[Tuple[Document, float]]]]
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Результат по каждому тексту берётся из кеша (chunk_id и оценки), промахи считаются одним вызовом
+        search(промахи) и попадают в кеш. Чанки из кеша дозагружаются из SQLite одним запросом.
+        Результат, в котором есть документ без chunk_id, не кешируется: по ID его не восстановить.
+        """
+        cache = get_cache(cache_name)
+        keys = [(normalize_entity_name(text), self.top_k_vector, self.entity_search_mode) for text in texts]
+        cached = [cache.get(key) for key in keys]
+
+        results: Dict[int, List[Tuple[Document, float]]] = {}
+        missing = [i for i, entry in enumerate(cached) if entry is None]
+        if missing:
+            for i, ranked in zip(missing, search([texts[i] for i in missing])):
+                results[i] = ranked
+                if all("chunk_id" in doc.metadata for doc, _ in ranked):
+                    cache.put(keys[i], [(doc.metadata["chunk_id"], score) for doc, score in ranked])
+
+        hits = [i for i, entry in enumerate(cached) if entry is not None]
+        if hits:
+            docs = get_hydrator().load([chunk_id for i in hits for chunk_id, _ in cached[i]])
+            for i in hits:
+                results[i] = [(docs[chunk_id], score) for chunk_id, score in cached[i] if chunk_id in docs]
+        return [results[i] for i in range(len(texts))]
 
     @traceable
-    def _search_by_questions(self, questions: List[Dict[str, str]]) -> List[Tuple[Document, float]]:
-        """Поиск релевантных документов по под-вопросам."""
-        docs_collected = []
-        for q in questions:
-            text = q.get("text", "").strip()
-            if text:
-                results = self.vectorstore.similarity_search_with_score(text, k=self.top_k_vector)
-                docs_collected.extend(results)
-        return docs_collected
+    def _search_by_questions(self, questions: List[Dict[str, str]]) -> List[List[Tuple[Document, float]]]:
+        """Поиск релевантных документов по под-вопросам (через кеш результатов)."""
+        texts = [t for t in (q.get("text", "").strip() for q in questions) if t]
+        return self._cached_search("questions", texts, self._search_by_vectors)
 
     @traceable
-    def _search_by_entities(self, entities: List[str]) -> List[Tuple[Document, float]]:
-        """Поиск релевантных документов по сущностям."""
-        docs_collected = []
-        for ent in entities:
-            ent = ent.strip()
-            if not ent:
+    def _search_by_entities(self, entities: List[str]) -> List[List[Tuple[Document, float]]]:
+        """Поиск релевантных документов по сущностям (через кеш результатов)."""
+        entities = [ent.strip() for ent in entities if ent.strip()]
+        return self._cached_search("entities", entities, self._search_entities)
+
+    def _search_entities(self, entities: List[str]) -> List[List[Tuple[Document, float]]]:
+        """
+        Сущность, которую индекс названий связал со статьями, даёт чанки только этих статей;
+        остальные ищутся по всему векторному индексу. Один ранжированный список на сущность.
+        """
+        if not entities:
+            return []
+        normalized = cpu_pool.normalize_many(entities)
+        vectors = cpu_pool.embed_many(normalized)
+        if self.entity_search_mode == "full":
+            return self._search_by_embeddings(vectors, normalized)
+        resolved = get_title_index().resolve(normalized, vectors)
+
+        ranked_lists: Dict[int, List[Tuple[Document, float]]] = {}
+        for i, entity in enumerate(normalized):
+            if entity not in resolved:
                 continue
-            results = self.vectorstore.similarity_search_with_score(normalize_text_entities(ent), k=self.top_k_vector)
-            docs_collected.extend(results)
-        return docs_collected
+            if self.entity_search_mode == "filtered":
+                ranked_lists[i] = self._search_in_articles(vectors[i], [a for a, _ in resolved[entity]])
+            else:
+                ranked_lists[i] = self._lead_chunks(resolved[entity])
+        unresolved = [i for i, entity in enumerate(normalized) if entity not in resolved]
+        if resolved:
+            logger.info(f"Entities linked to articles: {len(resolved)}, searched in full index: {len(unresolved)}")
+        ranked_lists.update(zip(unresolved, self._search_by_embeddings(vectors[unresolved], [normalized[i] for i in unresolved])))
+        return [ranked_lists[i] for i in range(len(entities))]
+
+    def _search_in_articles(self, vector, article_ids: List[int]) -> List[Tuple[Document, float]]:
+        """
+        Векторный поиск только среди чанков заданных статей: фильтр where по article_id в Chroma,
+        в плоском индексе — точный подсчёт по строкам этих статей.
+        """
+        ranked = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            vector if isinstance(self.vectorstore, FlatVectorIndex) else vector.tolist(),
+            k=self.top_k_vector,
+            filter={"article_id": {"$in": article_ids}},
+        )
+        return get_hydrator().hydrate([ranked])[0]
+
+    def _lead_chunks(self, articles: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        """Вводные чанки связанных статей в порядке близости названия к сущности."""
+        lexical = get_lexical_index()
+        limit = max(2, self.top_k_vector // len(articles))
+        return [
+            (doc, similarity)
+            for article_id, similarity in articles
+            for doc, _ in lexical.article_chunks(article_id, limit=limit)
+        ]
+
+    @traceable
+    def _search_lexical(self, texts: List[str]) -> List[List[Tuple[Document, float]]]:
+        """BM25-поиск по FTS5-индексу чанков."""
+        if self.lexical_mode == "off":
+            return []
+        return get_lexical_index().search_many(texts, k=self.top_k_lexical)
+
+    @traceable
+    def _search_exact_title(self, query: str) -> List[Tuple[Document, float]]:
+        """Режим exact: запрос однозначно совпал с названием статьи — берём её вводные чанки."""
+        if self.lexical_mode != "exact":
+            return []
+        lexical = get_lexical_index()
+        article_id = lexical.match_title(query)
+        if article_id is None:
+            return []
+        logger.info(f"Exact title match for query, article_id={article_id}: skipping decomposition and vector search")
+        return lexical.article_chunks(article_id, limit=self.top_k_vector)
 
     def _merge_chunks(self, docs_collected: List[Tuple[Document, float]]) -> Dict[str, List[Tuple[Document, float]]]:
         """Объединение чанков по документам и фильтрация дубликатов."""
@@ -67,30 +212,63 @@ class HybridRetriever(BaseRetriever):
         return doc_to_chunks
 
     @traceable
-    def _prepare_agent_payload(self, doc_to_chunks: Dict) -> Dict:
+    def _prepare_agent_payload(self, doc_to_chunks: Dict, node_info: Optional[Dict[str, Dict]] = None) -> Dict:
+        """
+        Узлы графа для агента. По дедлайну запроса: при малом остатке метрики считаются для меньшего
+        числа кандидатов и обрываются на полпути; когда время вышло, узлы статей с чанками остаются
+        без данных графа, промежуточные узлы не читаются.
+        """
+        deadline = current_deadline()
         candidate_nodes = list(doc_to_chunks.keys())
-        node_scores, paths_dict, intermediate_nodes = calculate_graph_metrics(candidate_nodes)
+        with deadline.stage("graph_metrics") as stage:
+            if len(candidate_nodes) > self.top_k_final and stage.exhausted(GRAPH_FULL_BUDGET):
+                stage.shrink(f"{self.top_k_final} of {len(candidate_nodes)} candidates")
+                candidate_nodes = candidate_nodes[:self.top_k_final]
+            node_scores, paths_dict, intermediate_nodes = calculate_graph_metrics(candidate_nodes, budget=stage)
         
         all_nodes = []
         unique_titles = list(doc_to_chunks.keys()) + [n for n in intermediate_nodes if n not in doc_to_chunks]
         
-        for i, title in enumerate(unique_titles):
-            is_detailed = title in doc_to_chunks
-            node_data = get_node_info(title, detailed=is_detailed)
-            
-            if node_data:
-                all_nodes.append({
-                    "id": f"node_{i+1}", 
-                    "score": round(node_scores.get(title, 0.0), 3) if is_detailed else 0.0,
-                    "graph_info": node_data
-                })
+        with deadline.stage("node_info") as stage:
+            for i, title in enumerate(unique_titles):
+                is_detailed = title in doc_to_chunks
+                if is_detailed and node_info and title in node_info:
+                    node_data = node_info[title]  # уже прочитан, пока шёл поиск
+                elif stage.exhausted():
+                    stage.shrink(f"{i} of {len(unique_titles)} nodes read")
+                    if not is_detailed:
+                        continue
+                    node_data = {"title": title, "labels": [], "text": ""}  # чанки статьи остаются в контексте
+                else:
+                    node_data = get_node_info(title, detailed=is_detailed)
+
+                if node_data:
+                    all_nodes.append({
+                        "id": f"node_{i+1}", 
+                        "score": round(node_scores.get(title, 0.0), 3) if is_detailed else 0.0,
+                        "graph_info": node_data
+                    })
 
         return {"nodes": all_nodes, "paths": paths_dict}
+
+    def _optimize(self, query: str, payload: Dict) -> Dict:
+        """Агент графа в пределах дедлайна и бюджета LLM вопроса; без них граф остаётся как есть."""
+        with current_deadline().stage("agent") as stage:
+            if stage.exhausted(MIN_AGENT_BUDGET):
+                stage.shrink("skipped")
+                return payload
+            if budget_exceeded("agent"):
+                return payload
+            optimizer = GraphContextOptimizer(model=get_llm("agent"))
+            return optimizer.optimize(query, payload, budget=stage)
     
     @traceable
     def _assemble_final_context(self, clean_payload: Dict, doc_to_chunks: Dict) -> List[Document]:
-        """Собирает текст только если есть валидная ссылка в источнике."""
-        final_docs = []
+        """
+        Собирает текст только если есть валидная ссылка в источнике.
+        Итоговый контекст укладывается в бюджет токенов (app/rag/context_packer.py).
+        """
+        node_contexts = []
         nodes = clean_payload.get("nodes", [])
 
         for n in nodes:
@@ -119,22 +297,17 @@ class HybridRetriever(BaseRetriever):
             if not graph_description and not chunks_with_scores:
                 continue
 
-            content_parts = [f"=== СУЩНОСТЬ: {title} ==="]
-            
-            if graph_description:
-                content_parts.append(f"[ОПИСАНИЕ]: {graph_description}")
-
-            if chunks_with_scores:
-                content_parts.append("[ДОПОЛНИТЕЛЬНЫЕ ДАННЫЕ ИЗ АРХИВОВ]:")
-                for i, (chunk, _) in enumerate(chunks_with_scores, 1):
-                    content_parts.append(f"Фрагмент {i}:\n{chunk.page_content}")
-
-            final_docs.append(Document(
-                page_content="\n\n".join(content_parts),
-                metadata=base_metadata
+            node_contexts.append(NodeContext(
+                title=title,
+                description=graph_description,
+                chunks=chunks_with_scores,
+                metadata=base_metadata,
+                score=n.get("score", 0.0),
             ))
 
-        return final_docs
+        return get_context_packer().pack(
+            node_contexts, lambda docs: chunk_embeddings(self.vectorstore, docs)
+        )
 
     @traceable
     def _filter_top_k(self, doc_to_chunks: Dict[str, List[Tuple[Document, float]]], node_scores: Dict[str, float]) -> List[str]:
@@ -153,20 +326,144 @@ class HybridRetriever(BaseRetriever):
             filtered_titles = list(doc_to_chunks.keys())
         return filtered_titles
     
-    def _get_relevant_documents(self, query: str) -> List[Document]:
-        parsed = split_and_extract_entities(query)
+    @traceable
+    def _answer_follow_up(self, query: str, turn: ConversationTurn, chat_id: int) -> List[Document]:
+        """
+        Уточняющий вопрос к прошлому ответу чата: без декомпозиции, векторного поиска и попарных метрик графа.
+        Агент графа достраивает прошлый очищенный граф; чанки прошлых узлов дозагружаются из SQLite по ID,
+        узлам, которые добавил агент, достаются вводные чанки их статей.
+        """
+        docs = get_hydrator().load(turn.chunk_ids())
+        doc_to_chunks = {}
+        for title, chunks in turn.chunks.items():
+            restored = [(docs[chunk_id], score) for chunk_id, score in chunks if chunk_id in docs]
+            if restored:
+                doc_to_chunks[title] = restored
+
+        # агент дописывает узлы в payload["nodes"] на месте — список из памяти не трогаем
+        payload = {**turn.payload, "nodes": list(turn.payload.get("nodes", []))}
+        clean_payload = self._optimize(contextualize(query, turn), payload)
+
+        # у вводных чанков нет оценки поиска: они получают низшую из восстановленных (RRF), чтобы упаковщик
+        # контекста не ставил новые узлы выше чанков, на которых держался прошлый ответ
+        lead_score = min((score for chunks in doc_to_chunks.values() for _, score in chunks), default=1.0)
+        lexical = get_lexical_index()
+        added = 0
+        for node in clean_payload.get("nodes", []):
+            title = node.get("graph_info", {}).get("title")
+            if not title or title in doc_to_chunks:
+                continue
+            article_id = lexical.match_title(title)
+            if article_id is not None:
+                doc_to_chunks[title] = [
+                    (doc, lead_score) for doc, _ in lexical.article_chunks(article_id, limit=FOLLOWUP_LEAD_CHUNKS)
+                ]
+                added += 1
+
+        logger.info(
+            f"Follow-up in chat {chat_id}: reused {len(payload['nodes'])} graph nodes and {len(docs)} chunks, "
+            f"{len(clean_payload.get('nodes', []))} nodes after agent, {added} new articles"
+        )
+        get_conversation_memory().remember(chat_id, ConversationTurn.from_context(
+            turn.query, turn.entities, clean_payload, doc_to_chunks, follow_ups=turn.follow_ups + 1
+        ))
+        return self._assemble_final_context(clean_payload, doc_to_chunks)
+
+    def _decompose(self, query: str) -> Dict:
+        """Декомпозиция вопроса; если время стадий уже вышло — без неё, поиск только по исходному запросу."""
+        with current_deadline().stage("decomposition") as stage:
+            if stage.exhausted():
+                stage.shrink("skipped")
+                return {}
+            return get_decomposer().decompose(query)
+
+    def _sequential_search(self, query: str) -> Tuple[List[str], List[List[Tuple[Document, float]]], Dict[str, Dict]]:
+        """Поиск после декомпозиции (локальной или LLM): по под-вопросам, исходному запросу и сущностям."""
+        parsed = self._decompose(query)
         questions = parsed.get("questions", []) + [{"text": query}]
         entities = parsed.get("entities", [])
 
-        docs_by_questions = self._search_by_questions(questions)
-        docs_by_entities = self._search_by_entities(entities)
-        
-        doc_to_chunks = self._merge_chunks(docs_by_questions + docs_by_entities)
+        with current_deadline().stage("search") as stage:
+            searched_questions, searched_entities = questions, entities
+            if len(questions) > 1 and stage.exhausted():
+                stage.shrink(f"{len(questions) - 1} sub-questions and {len(entities)} entities not searched")
+                searched_questions, searched_entities = [{"text": query}], []
+            ranked_lists = self._search_by_questions(searched_questions) + self._search_by_entities(searched_entities)
+            ranked_lists += self._search_lexical([q.get("text", "") for q in searched_questions] + searched_entities)
+        return entities, ranked_lists, {}
 
-        agent_payload = self._prepare_agent_payload(doc_to_chunks)
+    @traceable
+    def _speculative_search(self, query: str) -> Tuple[List[str], List[List[Tuple[Document, float]]], Dict[str, Dict]]:
+        """
+        Исходный запрос входит в под-вопросы всегда, поэтому его векторный поиск, локальное связывание
+        сущностей со статьями, поиск по ним и чтение их узлов графа стартуют сразу, параллельно
+        с LLM-декомпозицией. Её под-вопросы и новые сущности досчитываются, когда она вернётся.
+        speculative_mode: always — декомпозиция дожидается всегда; auto — не запускается, если локальных
+        сущностей достаточно (looks_sufficient); never — не запускается никогда.
+        Возвращает сущности, ранжированные списки и предзагруженные узлы графа.
+        """
+        raw_search = submit(self._search_by_questions, [{"text": query}])
+        local = local_entities(query)
+        entity_search = submit(self._search_by_entities, local)
+        nodes = submit(prefetch_nodes, local)
+        raw_lexical = submit(self._search_lexical, [query] + local)
+
+        decompose = self.speculative_mode == "always" or (
+            self.speculative_mode == "auto" and not looks_sufficient(query, local)
+        )
+        parsed = self._decompose(query) if decompose else {}
+        if not decompose:
+            logger.info(f"Decomposition skipped ({self.speculative_mode}), local entities: {local}")
+
+        raw_key = normalize_entity_name(query)
+        questions = [
+            q for q in parsed.get("questions", [])
+            if q.get("text", "").strip() and normalize_entity_name(q["text"]) != raw_key
+        ]
+        known = {normalize_entity_name(e) for e in local}
+        extra = [e for e in parsed.get("entities", []) if normalize_entity_name(e) not in known]
+        entities = local + extra
+
+        # досчитывается только то, чего не было в спекулятивной части; после дедлайна стадий — ничего
+        with current_deadline().stage("search") as stage:
+            if (questions or extra) and stage.exhausted():
+                stage.shrink(f"{len(questions)} sub-questions and {len(extra)} entities not searched")
+                questions, extra = [], []
+            ranked_lists = raw_search.result() + self._search_by_questions(questions)
+            ranked_lists += entity_search.result() + self._search_by_entities(extra)
+            ranked_lists += raw_lexical.result() + self._search_lexical([q["text"] for q in questions] + extra)
+        return entities, ranked_lists, nodes.result()
 
-        optimizer = GraphContextOptimizer(model=get_llm())
-        clean_payload = optimizer.optimize(query, agent_payload)
+    def _get_relevant_documents(self, query: str) -> List[Document]:
+        chat_id = current_chat.get()
+        memory = get_conversation_memory()
+        previous = memory.recall(chat_id)
+        if previous is not None and is_follow_up(query, previous):
+            final_docs = self._answer_follow_up(query, previous, chat_id)
+            if final_docs:
+                return final_docs
+            logger.info(f"Follow-up in chat {chat_id} left no context, running the full pipeline")
+
+        exact_chunks = self._search_exact_title(query)
+        if exact_chunks:
+            # Одна статья без LLM-декомпозиции: отбор узлов графа агентом не нужен
+            doc_to_chunks = self._merge_chunks(exact_chunks)
+            agent_payload = self._prepare_agent_payload(doc_to_chunks)
+            memory.remember(chat_id, ConversationTurn.from_context(query, [], agent_payload, doc_to_chunks))
+            return self._assemble_final_context(agent_payload, doc_to_chunks)
+
+        if self.speculative_mode == "off":
+            entities, ranked_lists, node_info = self._sequential_search(query)
+        else:
+            entities, ranked_lists, node_info = self._speculative_search(query)
+
+        # Векторные и лексические списки сливаются по рангам (RRF)
+        doc_to_chunks = self._merge_chunks(reciprocal_rank_fusion(ranked_lists, k=self.rrf_k))
+
+        agent_payload = self._prepare_agent_payload(doc_to_chunks, node_info)
+
+        clean_payload = self._optimize(query, agent_payload)
+        memory.remember(chat_id, ConversationTurn.from_context(query, entities, clean_payload, doc_to_chunks))
 
         final_docs = self._assemble_final_context(clean_payload, doc_to_chunks)
 
@@ -174,18 +471,67 @@ class HybridRetriever(BaseRetriever):
 
 
 
-def build_or_load_vectorstore(documents: List[Document]) -> HybridRetriever:
-    """Создаёт или загружает векторное хранилище Chroma."""
-    CHROMA_PERSIST_DIR.mkdir(parents=True, exist_ok=True)
-    if any(CHROMA_PERSIST_DIR.iterdir()):
+def get_vectorstore():
+    """
+    Загружает существующий векторный индекс (VECTOR_BACKEND: chroma, flat или sharded).
+    Никогда не строит индекс неявно.
+    """
+    global _vectorstore
+    if _vectorstore is None and VECTOR_BACKEND == "flat":
+        if not FLAT_INDEX_DIR.exists():
+            raise RuntimeError(
+                f"Flat index dir {FLAT_INDEX_DIR} not found — "
+                "сначала выгрузите индекс: python -m app.rag.flat_index"
+            )
+        _vectorstore = FlatVectorIndex(FLAT_INDEX_DIR, embedding_function=get_embedding_model())
+    if _vectorstore is None and VECTOR_BACKEND == "sharded":
+        if not (CHROMA_PERSIST_DIR / SHARDS_FILE).exists():
+            raise RuntimeError(
+                f"{CHROMA_PERSIST_DIR / SHARDS_FILE} not found — "
+                "сначала разложите индекс по шардам: python -m app.rag.indexer --build-shards"
+            )
+        _vectorstore = ShardedVectorStore(CHROMA_PERSIST_DIR, embedding_function=get_embedding_model())
+    if _vectorstore is None:
+        if not CHROMA_PERSIST_DIR.exists() or not any(CHROMA_PERSIST_DIR.iterdir()):
+            raise RuntimeError(
+                f"Chroma persist dir {CHROMA_PERSIST_DIR} is empty — "
+                "сначала постройте индекс: python -m app.rag.indexer"
+            )
         logger.info("Loading existing Chroma vectorstore")
-        vectorstore = Chroma(persist_directory=str(CHROMA_PERSIST_DIR), embedding_function=embedding_model)
+        _vectorstore = Chroma(persist_directory=str(CHROMA_PERSIST_DIR), embedding_function=get_embedding_model())
+    return _vectorstore
+
+
+def chunk_embeddings(vectorstore, docs: List[Document]) -> np.ndarray:
+    """
+    Эмбеддинги чанков берутся из векторного индекса, без повторного прогона модели;
+    только недостающие (например, чанки из лексического поиска вне индекса) считаются в CPU-пуле.
+    """
+    ids = [chunk_doc_id(doc.metadata["chunk_id"]) if "chunk_id" in doc.metadata else None for doc in docs]
+    wanted = [i for i in ids if i is not None]
+    if isinstance(vectorstore, (FlatVectorIndex, ShardedVectorStore)):
+        found = vectorstore.get_embeddings(wanted)
     else:
-        logger.info("Building new Chroma vectorstore")
-        vectorstore = Chroma.from_documents(
-            documents=documents,
-            embedding=embedding_model,
-            persist_directory=str(CHROMA_PERSIST_DIR)
-        )
+        page = vectorstore._collection.get(ids=wanted, include=["embeddings"]) if wanted else {"ids": [], "embeddings": []}
+        found = dict(zip(page["ids"], page["embeddings"]))
+
+    missing = [n for n, vector_id in enumerate(ids) if vector_id not in found]
+    computed = cpu_pool.embed_many([docs[n].page_content for n in missing]) if missing else []
+    vectors = [None] * len(docs)
+    for n, vector_id in enumerate(ids):
+        if vector_id in found:
+            vectors[n] = np.asarray(found[vector_id], dtype=np.float32)
+    for n, vector in zip(missing, computed):
+        vectors[n] = vector
+    return np.vstack(vectors)
+
 
+def count_vectors(vectorstore) -> int:
+    if isinstance(vectorstore, (FlatVectorIndex, ShardedVectorStore)):
+        return vectorstore.count()
+    return vectorstore._collection.count()
+
+
+def build_retriever(vectorstore) -> HybridRetriever:
     return HybridRetriever(vectorstore=vectorstore, top_k_vector=6, top_k_final=10)
+
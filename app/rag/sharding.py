@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from collections import Counter
+from typing import List, Tuple, Dict, Optional
+
+from langchain_core.documents import Document
+from langchain_chroma import Chroma
+
+from app.config import CHROMA_PERSIST_DIR, ARTICLES_DB_PATH, SHARD_COUNT
+from app.db import get_connection
+from app.rag.cache import stamp_index_version
+
+logger = logging.getLogger(__name__)
+
+SHARDS_FILE = "shards.json"
+OTHER_SHARD = "other"
+
+
+def assign_shards(article_titles: Dict[int, str], labels: Dict[str, List[str]], max_shards: int) -> Dict[int, str]:
+    """
+    Категория статьи = самая частая из меток её узла графа, попавших в max_shards - 1 самых частых меток.
+    Статьи без узла или с редкими метками идут в общий шард OTHER_SHARD.
+    """
+    counts = Counter(label for node_labels in labels.values() for label in set(node_labels))
+    top = {label for label, _ in counts.most_common(max(max_shards - 1, 0))}
+    shards = {}
+    for article_id, title in article_titles.items():
+        candidates = [label for label in labels.get(title, []) if label in top]
+        shards[article_id] = max(candidates, key=lambda label: counts[label]) if candidates else OTHER_SHARD
+    return shards
+
+
+def build_shards(
+    persist_dir: Path = CHROMA_PERSIST_DIR,
+    db_path: str = ARTICLES_DB_PATH,
+    max_shards: int = SHARD_COUNT,
+    page_size: int = 5000,
+) -> Dict:
+    """
+    Раскладывает уже построенную коллекцию по коллекциям-категориям (метки узлов Neo4j).
+    Векторы копируются, модель эмбеддингов не нужна. Манифест пишется последним.
+    """
+    from app.graph.node import get_labels
+
+    persist_dir = Path(persist_dir)
+    source = Chroma(persist_directory=str(persist_dir))
+    total = source._collection.count()
+    if not total:
+        raise RuntimeError("Chroma collection is empty: сначала python -m app.rag.indexer")
+
+    article_titles = dict(get_connection(db_path, readonly=True).execute('''
+        SELECT a.id, a.final_title FROM articles a
+        WHERE EXISTS (SELECT 1 FROM article_chunks c WHERE c.article_id = a.id)
+    '''))
+    labels = get_labels(list(set(article_titles.values())))
+    article_shards = assign_shards(article_titles, labels, max_shards)
+    shard_names = sorted(set(article_shards.values()) | {OTHER_SHARD})
+    # в именах коллекций Chroma допустима только латиница
+    collections = {name: f"shard_{i}" for i, name in enumerate(shard_names)}
+    logger.info(f"{len(labels)}/{len(article_titles)} articles found in graph, {len(shard_names)} shards")
+
+    stores = {}
+    for name, collection in collections.items():
+        stores[name] = Chroma(persist_directory=str(persist_dir), collection_name=collection)
+        stores[name].reset_collection()
+
+    counts = Counter()
+    for offset in range(0, total, page_size):
+        page = source._collection.get(include=["embeddings", "metadatas", "documents"], limit=page_size, offset=offset)
+        grouped: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(page["metadatas"]):
+            grouped.setdefault(article_shards.get((metadata or {}).get("article_id"), OTHER_SHARD), []).append(i)
+        for name, rows in grouped.items():
+            stores[name]._collection.add(
+                ids=[page["ids"][i] for i in rows],
+                embeddings=[page["embeddings"][i] for i in rows],
+                metadatas=[page["metadatas"][i] for i in rows],
+                documents=[page["documents"][i] for i in rows],
+            )
+            counts[name] += len(rows)
+        logger.info(f"Sharded {min(offset + page_size, total)}/{total} vectors")
+
+    manifest = {
+        "shards": {name: {"collection": collections[name], "count": counts[name]} for name in shard_names},
+        "articles": {str(article_id): name for article_id, name in article_shards.items()},
+        "source_count": total,
+        "created_at": time.time(),
+    }
+    with open(persist_dir / SHARDS_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    stamp_index_version(persist_dir)
+    logger.info(f"Shards written: { {name: counts[name] for name in shard_names} }")
+    return manifest
+
+
+class ShardedVectorStore:
+    """
+    Набор коллекций Chroma по категориям статей. Поиск идёт только по переданным шардам
+    (по умолчанию — по всем), результаты сливаются по расстоянию: метрика во всех коллекциях одна.
+    Фильтр по article_id сам ограничивает поиск шардами этих статей.
+    """
+
+    def __init__(self, persist_dir: Path = CHROMA_PERSIST_DIR, embedding_function=None):
+        persist_dir = Path(persist_dir)
+        self.embedding_function = embedding_function
+        self.manifest_path = persist_dir / SHARDS_FILE
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.manifest = manifest
+        self.shards = {
+            name: Chroma(
+                persist_directory=str(persist_dir),
+                collection_name=info["collection"],
+                embedding_function=embedding_function,
+            )
+            for name, info in manifest["shards"].items()
+        }
+        self.article_shards = {int(article_id): name for article_id, name in manifest["articles"].items()}
+        logger.info(f"Loaded {len(self.shards)} vector shards from {persist_dir}")
+
+    def count(self) -> int:
+        return sum(store._collection.count() for store in self.shards.values())
+
+    def shards_for_articles(self, article_ids: List[int]) -> List[str]:
+        names = []
+        for article_id in article_ids:
+            name = self.article_shards.get(article_id, OTHER_SHARD)
+            if name not in names:
+                names.append(name)
+        return names
+
+    # ---------- Инкрементальное обновление ----------
+    def delete_articles(self, article_ids: List[int]):
+        """Удаляет векторы статей из их шардов (статьи вне раскладки живут в OTHER_SHARD)."""
+        for name in self.shards_for_articles(article_ids):
+            if name in self.shards:
+                self.shards[name]._collection.delete(where={"article_id": {"$in": list(article_ids)}})
+
+    def upsert(self, ids: List[str], embeddings, metadatas: List[dict], documents: List[str]):
+        """Upsert в шард статьи каждого вектора; новые статьи попадают в OTHER_SHARD до следующей раскладки."""
+        grouped: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            grouped.setdefault(self.article_shards.get((metadata or {}).get("article_id"), OTHER_SHARD), []).append(i)
+        for name, rows in grouped.items():
+            self.shards[name]._collection.upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                documents=[documents[i] for i in rows],
+            )
+
+    def save_counts(self):
+        """Пересчитывает размеры шардов в shards.json после инкрементального обновления."""
+        for name, store in self.shards.items():
+            self.manifest["shards"][name]["count"] = store._collection.count()
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, list]:
+        found = {}
+        for store in self.shards.values():
+            missing = [i for i in ids if i not in found]
+            if not missing:
+                break
+            page = store._collection.get(ids=missing, include=["embeddings"])
+            found.update(zip(page["ids"], page["embeddings"]))
+        return found
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 4, filter: Optional[dict] = None, shards: Optional[List[str]] = None
+    ) -> List[Tuple[Document, float]]:
+        condition = (filter or {}).get("article_id")
+        if condition is not None:
+            shards = self.shards_for_articles(condition["$in"] if isinstance(condition, dict) else [condition])
+        results = []
+        for name in shards or self.shards:
+            if name in self.shards:
+                results += self.shards[name].similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+        return sorted(results, key=lambda x: x[1])[:k]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, shards: Optional[List[str]] = None
+    ) -> List[Tuple[Document, float]]:
+        if self.embedding_function is None:
+            raise RuntimeError("ShardedVectorStore was created without embedding_function")
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter, shards=shards)
+
+
+class ShardRouter:
+    """
+    Выбирает шарды для под-вопроса: статьи, чьи названия встречаются в тексте (словарь названий
+    лексического индекса), дают свои категории. Если ни одна статья не узнана — поиск по всем шардам.
+    """
+
+    def __init__(self, store: ShardedVectorStore):
+        self.store = store
+
+    def route(self, text: str) -> Optional[List[str]]:
+        from app.rag.lexical import get_lexical_index
+
+        article_ids = get_lexical_index().find_articles(text)
+        return self.store.shards_for_articles(article_ids) or None
+
@@ -0,0 +1,78 @@
+import re
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Callable
+
+from app.config import SPECULATIVE_MAX_WORDS, SPECULATIVE_THREADS
+
+logger = logging.getLogger(__name__)
+
+# Сколько локально найденных статей считать сущностями запроса
+MAX_LOCAL_ENTITIES = 5
+# Признаки составного вопроса: его стоит разбить на под-вопросы LLM
+MULTI_PART = re.compile(r"[,;]|\?.+\?|\s(и|или|а также|либо|чем|vs)\s")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def submit(fn: Callable, *args) -> Future:
+    """
+    Запускает стадию запроса в общем пуле потоков. Каждой задаче — своя копия контекста:
+    трассировка langsmith и current_chat видны и в потоке пула.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SPECULATIVE_THREADS, thread_name_prefix="speculative")
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def local_entities(query: str) -> List[str]:
+    """
+    Сущности запроса без LLM: названия статей, встречающиеся в тексте по леммам (словарь названий
+    лексического индекса). Это названия узлов графа, их можно сразу искать и читать из Neo4j.
+    """
+    from app.rag.lexical import get_lexical_index
+
+    lexical = get_lexical_index()
+    article_ids = lexical.find_articles(query)[:MAX_LOCAL_ENTITIES]
+    titles = lexical.article_titles(article_ids)
+    entities = []
+    for article_id in article_ids:
+        title = titles.get(article_id)
+        if title and title not in entities:
+            entities.append(title)
+    return entities
+
+
+def looks_sufficient(query: str, entities: List[str]) -> bool:
+    """
+    Для auto: декомпозиция не нужна, если вопрос короткий, не составной и каждое слово
+    с заглавной буквы (кроме первого) покрыто найденными названиями.
+    """
+    from app.rag.NER import get_morph
+
+    if not entities:
+        return False
+    words = re.findall(r"\w+", query)
+    if len(words) > SPECULATIVE_MAX_WORDS or MULTI_PART.search(query.lower()):
+        return False
+    morph = get_morph()
+    covered = {morph.parse(w)[0].normal_form for title in entities for w in re.findall(r"\w+", title.lower())}
+    uncovered = [w for w in words[1:] if w[0].isupper() and morph.parse(w.lower())[0].normal_form not in covered]
+    return not uncovered
+
+
+def prefetch_nodes(titles: List[str]) -> Dict[str, Dict]:
+    """Подробная информация об узлах графа (как для _prepare_agent_payload), пока идёт поиск."""
+    from app.graph.node import get_node_info
+
+    nodes = {}
+    for title in titles:
+        node = get_node_info(title, detailed=True)
+        if node:
+            nodes[title] = node
+    return nodes
@@ -0,0 +1,200 @@
+import os
+import logging
+import argparse
+import threading
+from pathlib import Path
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np
+
+from app.config import ARTICLES_DB_PATH, TITLE_INDEX_PATH, TITLE_MATCH_THRESHOLD, TITLE_MAX_ARTICLES
+from app.db import get_connection
+from app.rag.cpu_pool import cpu_pool
+from app.chunks_loader import normalize_entity_name
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("title", "alias", "gazetteer")
+
+
+def collect_entries(db_path: str = ARTICLES_DB_PATH) -> List[Tuple[str, str, List[int]]]:
+    """
+    Записи индекса (текст, вид, article_ids): названия статей, редиректы (original_title)
+    и слова газеттира, которые по лемме совпадают с названием или редиректом.
+    Учитываются только статьи, у которых есть чанки.
+    """
+    from app.rag.NER import _lemmatize, build_or_load_gazetteer
+
+    rows = get_connection(db_path, readonly=True).execute('''
+        SELECT a.id, a.final_title, a.original_title
+        FROM articles a
+        WHERE EXISTS (SELECT 1 FROM article_chunks c WHERE c.article_id = a.id)
+    ''').fetchall()
+
+    entries: Dict[str, Tuple[str, str, List[int]]] = {}
+    by_lemma: Dict[str, List[int]] = {}
+
+    def add(text, kind, article_id):
+        key = normalize_entity_name(text)
+        if not key:
+            return
+        # одно и то же написание может быть названием одной статьи и редиректом другой
+        entry = entries.setdefault(key, (text.strip(), kind, []))
+        if article_id not in entry[2]:
+            entry[2].append(article_id)
+
+    for article_id, final_title, original_title in rows:
+        if final_title:
+            add(final_title, "title", article_id)
+        if original_title and original_title != final_title:
+            add(original_title, "alias", article_id)
+        for title in {final_title, original_title}:
+            if title:
+                ids = by_lemma.setdefault(_lemmatize(title), [])
+                if article_id not in ids:
+                    ids.append(article_id)
+
+    for word in build_or_load_gazetteer(db_path=db_path):
+        for article_id in by_lemma.get(_lemmatize(word), []):
+            add(word, "gazetteer", article_id)
+
+    return list(entries.values())
+
+
+def build_title_index(db_path: str = ARTICLES_DB_PATH, out_path: Path = TITLE_INDEX_PATH, batch_size: int = 64) -> int:
+    """Эмбеддинги всех записей одним батчевым проходом модели; результат — один .npz с атомарной заменой."""
+    from app.rag.embedding_model import get_embedding_model
+
+    entries = collect_entries(db_path)
+    if not entries:
+        raise RuntimeError("Нет статей с чанками: сначала python -m app.rag.indexer")
+    texts = [text for text, _, _ in entries]
+    logger.info(f"Embedding {len(texts)} titles, aliases and gazetteer entries")
+    vectors = get_embedding_model().embed_array(texts, batch_size=batch_size)
+
+    offsets = np.cumsum([0] + [len(ids) for _, _, ids in entries])
+    out_path = Path(out_path)
+    tmp_path = out_path.with_name(out_path.stem + ".tmp.npz")
+    np.savez(
+        tmp_path,
+        vectors=vectors.astype(np.float32),
+        texts=np.array(texts),
+        kinds=np.array([KINDS.index(kind) for _, kind, _ in entries], dtype=np.int8),
+        article_ids=np.array([i for _, _, ids in entries for i in ids], dtype=np.int64),
+        offsets=offsets.astype(np.int64),
+    )
+    os.replace(tmp_path, out_path)
+    logger.info(f"Saved title index to {out_path}: {len(texts)} entries")
+    return len(texts)
+
+
+class TitleIndex:
+    """
+    Небольшой индекс названий статей, редиректов и записей газеттира для связывания сущностей.
+    Нормированные эмбеддинги целиком в памяти; все сущности запроса сопоставляются одним
+    умножением матриц. Точное совпадение написания проверяется до эмбеддинга.
+    """
+
+    def __init__(self, path: Path = TITLE_INDEX_PATH, threshold: float = TITLE_MATCH_THRESHOLD,
+                 max_articles: int = TITLE_MAX_ARTICLES):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_articles = max_articles
+        self.vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        with self._lock:
+            if self.vectors is not None:
+                return len(self.texts)
+            if not self.path.exists():
+                logger.warning(f"Title index {self.path} not found, entity linking disabled "
+                               f"(build it with python -m app.rag.title_index)")
+                self.texts, self._exact = [], {}
+                self.vectors = np.empty((0, 0), dtype=np.float32)
+                return 0
+            with np.load(self.path) as data:
+                vectors = data["vectors"]
+                self.texts = data["texts"].tolist()
+                self.article_ids = data["article_ids"]
+                self.offsets = data["offsets"]
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._exact = {normalize_entity_name(text): i for i, text in enumerate(self.texts)}
+            self.vectors = vectors / norms
+            logger.info(f"Loaded title index from {self.path}: {len(self.texts)} entries")
+            return len(self.texts)
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self.texts)
+
+    def _articles(self, entry: int) -> List[int]:
+        return self.article_ids[self.offsets[entry]:self.offsets[entry + 1]].tolist()
+
+    def resolve(self, entities: List[str], vectors: Optional[np.ndarray] = None) -> Dict[str, List[Tuple[int, float]]]:
+        """
+        Сущность -> [(article_id, близость)] по убыванию близости, не больше max_articles статей.
+        Сущности, не связанные ни с одной статьей, в результат не попадают.
+        vectors — уже посчитанные эмбеддинги сущностей (в том же порядке); иначе считаются здесь.
+        """
+        if not entities or not len(self):
+            return {}
+
+        resolved: Dict[str, List[Tuple[int, float]]] = {}
+        pending = []
+        for i, entity in enumerate(entities):
+            entry = self._exact.get(normalize_entity_name(entity))
+            if entry is not None:
+                resolved[entity] = [(article_id, 1.0) for article_id in self._articles(entry)][:self.max_articles]
+            else:
+                pending.append(i)
+        if not pending:
+            return resolved
+
+        if vectors is None:
+            queries = cpu_pool.embed_many([entities[i] for i in pending])
+        else:
+            queries = np.asarray(vectors, dtype=np.float32)[pending]
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        similarities = queries @ self.vectors.T
+
+        top = min(self.max_articles * 4, similarities.shape[1])
+        candidates = np.argpartition(-similarities, top - 1, axis=1)[:, :top]
+        for row, i in enumerate(pending):
+            order = candidates[row][np.argsort(-similarities[row, candidates[row]])]
+            matches: Dict[int, float] = {}
+            for entry in order:
+                score = float(similarities[row, entry])
+                if score < self.threshold:
+                    break
+                for article_id in self._articles(entry):
+                    matches.setdefault(article_id, score)
+            if matches:
+                resolved[entities[i]] = list(matches.items())[:self.max_articles]
+        return resolved
+
+
+_title_index = None
+
+
+def get_title_index() -> TitleIndex:
+    global _title_index
+    if _title_index is None:
+        _title_index = TitleIndex()
+    return _title_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Построение индекса названий для связывания сущностей")
+    parser.add_argument("--db", default=ARTICLES_DB_PATH)
+    parser.add_argument("--out", default=str(TITLE_INDEX_PATH))
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    build_title_index(args.db, Path(args.out), batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
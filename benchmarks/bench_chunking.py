@@ -0,0 +1,58 @@
+"""
+Бенчмарк нарезки статей на чанки: статей/с и пиковый RSS.
+
+    python -m benchmarks.bench_chunking --db warhammer_articles.db --workers 1 4 8
+
+Работает на копии базы, исходная БД не меняется.
+"""
+import os
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+
+from app.chunks_loader import DatabaseTextLoader
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в КБ на Linux; учитываем и дочерние процессы пула
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="warhammer_articles.db")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--write-batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = os.path.join(tmp, "bench.db")
+        shutil.copy(args.db, db_copy)
+        loader = DatabaseTextLoader(db_path=db_copy)
+
+        print(f"{'workers':>8} {'articles':>9} {'chunks':>8} {'sec':>8} {'articles/s':>11} {'rss MB':>8} {'children MB':>12}")
+        for workers in args.workers:
+            started = time.time()
+            stats = loader.build_chunks(
+                limit=args.limit, overwrite=True, workers=workers,
+                page_size=args.page_size, write_batch=args.write_batch,
+            )
+            elapsed = time.time() - started
+            own, children = peak_rss_mb()
+            print(
+                f"{workers:>8} {stats['articles']:>9} {stats['chunks']:>8} {elapsed:>8.1f} "
+                f"{stats['articles'] / elapsed:>11.1f} {own:>8.1f} {children:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
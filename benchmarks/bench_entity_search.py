@@ -0,0 +1,98 @@
+"""
+Поиск по сущности: весь векторный индекс против поиска только по чанкам связанных статей
+(where-фильтр Chroma или точный подсчёт по строкам статей в плоском индексе).
+
+    python -m benchmarks.bench_entity_search --db warhammer_articles.db --queries 200 --k 6
+    VECTOR_BACKEND=flat python -m benchmarks.bench_entity_search
+
+Запрос — вектор случайного чанка статьи с шумом; фильтр — эта статья и ещё (articles - 1) случайных,
+как при связывании сущности с несколькими кандидатами. hit — в top-k есть чанк целевой статьи.
+"""
+import time
+import random
+import logging
+import argparse
+
+import numpy as np
+
+from app.db import get_connection
+from app.rag.flat_index import FlatVectorIndex
+from app.rag.indexer import chunk_doc_id
+from app.rag.retriever import get_vectorstore, count_vectors
+
+
+def chunk_vector(store, chunk_id):
+    if isinstance(store, FlatVectorIndex):
+        conn = get_connection(store.metadata_path, readonly=True)
+        row = conn.execute("SELECT row FROM vectors WHERE id = ?", (chunk_doc_id(chunk_id),)).fetchone()
+        if row is None:
+            return None
+        vector = np.asarray(store.embeddings[row[0]], dtype=np.float32)
+        return vector * store.scales[row[0]] if store.scales is not None else vector
+    found = store._collection.get(ids=[chunk_doc_id(chunk_id)], include=["embeddings"])
+    return np.asarray(found["embeddings"][0], dtype=np.float32) if len(found["ids"]) else None
+
+
+def search(store, vector, k, article_ids=None):
+    query = vector if isinstance(store, FlatVectorIndex) else vector.tolist()
+    where = {"article_id": {"$in": article_ids}} if article_ids else None
+    return store.similarity_search_by_vector_with_relevance_scores(query, k=k, filter=where)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="warhammer_articles.db")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--articles", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    store = get_vectorstore()
+    conn = get_connection(args.db, readonly=True)
+    chunks_per_article = dict(conn.execute("SELECT article_id, COUNT(*) FROM article_chunks GROUP BY article_id"))
+    article_ids = list(chunks_per_article)
+    rnd = random.Random(0)
+    rng = np.random.default_rng(0)
+
+    samples = []
+    while len(samples) < args.queries and article_ids:
+        target = rnd.choice(article_ids)
+        chunk_ids = [r[0] for r in conn.execute("SELECT id FROM article_chunks WHERE article_id = ?", (target,))]
+        vector = chunk_vector(store, rnd.choice(chunk_ids))
+        if vector is None:
+            continue
+        scale = np.linalg.norm(vector) / np.sqrt(len(vector))
+        vector = vector + args.noise * scale * rng.standard_normal(len(vector)).astype(np.float32)
+        candidates = [target] + rnd.sample(article_ids, min(args.articles - 1, len(article_ids)))
+        samples.append((target, vector, candidates))
+    if not samples:
+        raise SystemExit("Нет проиндексированных чанков: сначала python -m app.rag.indexer")
+
+    # прогрев: страницы индекса, кеш метаданных, таблица строк по статьям
+    search(store, samples[0][1], args.k)
+    search(store, samples[0][1], args.k, samples[0][2])
+
+    total = count_vectors(store)
+    results = {}
+    for mode in ("full", "filtered"):
+        times, hits, scanned = [], 0, []
+        for target, vector, candidates in samples:
+            started = time.perf_counter()
+            found = search(store, vector, args.k, candidates if mode == "filtered" else None)
+            times.append(time.perf_counter() - started)
+            hits += any(doc.metadata.get("article_id") == target for doc, _ in found)
+            scanned.append(sum(chunks_per_article.get(a, 0) for a in set(candidates)) if mode == "filtered" else total)
+        results[mode] = (times, hits / len(samples), np.mean(scanned))
+
+    print(f"{type(store).__name__}: {total} vectors, {len(samples)} queries, k={args.k}, {args.articles} articles per entity")
+    print(f"{'mode':<10} {'p50 ms':>8} {'p95 ms':>8} {'vectors':>10} {'hit':>6}")
+    for mode, (times, hit_rate, scanned) in results.items():
+        print(f"{mode:<10} {np.percentile(times, 50) * 1000:>8.2f} {np.percentile(times, 95) * 1000:>8.2f} "
+              f"{scanned:>10.0f} {hit_rate:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Плоский memory-mapped индекс против Chroma: время загрузки, латентность и recall@k.
+
+    python -m app.rag.flat_index --dtype float16          # сначала выгрузить индекс
+    python -m benchmarks.bench_flat_index --queries 200 --k 10
+    python -m benchmarks.bench_flat_index --questions questions.jsonl
+
+Запросы — вопросы из JSONL ({"question": ...}) или, по умолчанию, случайные векторы индекса с шумом.
+Recall Chroma считается относительно точного поиска плоского индекса (HNSW — приближённый поиск).
+"""
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from app.config import CHROMA_PERSIST_DIR, FLAT_INDEX_DIR
+from app.rag.flat_index import FlatVectorIndex
+
+
+def doc_key(doc):
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+
+def percentiles(values):
+    return np.percentile(values, 50) * 1000, np.percentile(values, 95) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flat-dir", default=str(FLAT_INDEX_DIR))
+    parser.add_argument("--questions", default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    started = time.perf_counter()
+    from langchain_chroma import Chroma
+    chroma = Chroma(persist_directory=str(CHROMA_PERSIST_DIR))
+    chroma._collection.count()
+    chroma_load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    flat = FlatVectorIndex(args.flat_dir)
+    flat_load = time.perf_counter() - started
+
+    if args.questions:
+        from app.rag.embedding_model import get_embedding_model
+        with open(args.questions, encoding="utf-8") as f:
+            texts = [json.loads(line)["question"] for line in f if line.strip()]
+        queries = get_embedding_model().embed_array(texts[:args.queries])
+    else:
+        rng = np.random.default_rng(0)
+        rows = rng.choice(flat.count(), size=min(args.queries, flat.count()), replace=False)
+        base = np.asarray(flat.embeddings[np.sort(rows)], dtype=np.float32)
+        scale = np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+        queries = base + args.noise * scale * rng.standard_normal(base.shape).astype(np.float32)
+
+    # прогрев: страницы mmap, кеши Chroma
+    flat.similarity_search_by_vector_with_relevance_scores(queries[0], k=args.k)
+    chroma.similarity_search_by_vector_with_relevance_scores(queries[0].tolist(), k=args.k)
+
+    chroma_times, flat_times, recalls = [], [], []
+    for q in queries:
+        t = time.perf_counter()
+        chroma_docs = chroma.similarity_search_by_vector_with_relevance_scores(q.tolist(), k=args.k)
+        chroma_times.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        flat_docs = flat.similarity_search_by_vector_with_relevance_scores(q, k=args.k)
+        flat_times.append(time.perf_counter() - t)
+
+        exact = {doc_key(d) for d, _ in flat_docs}
+        recalls.append(len(exact & {doc_key(d) for d, _ in chroma_docs}) / max(len(exact), 1))
+
+    t = time.perf_counter()
+    flat.similarity_search_by_vectors_with_scores(queries, k=args.k)
+    batch_time = time.perf_counter() - t
+
+    print(f"{flat.count()} vectors x {flat.embeddings.shape[1]} ({flat.embeddings.dtype}), {len(queries)} queries, k={args.k}")
+    print(f"{'backend':<18} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9}")
+    print(f"{'chroma (hnsw)':<18} {chroma_load:>8.2f} {percentiles(chroma_times)[0]:>8.2f} "
+          f"{percentiles(chroma_times)[1]:>8.2f} {np.mean(recalls):>9.3f}")
+    print(f"{'flat (exact)':<18} {flat_load:>8.2f} {percentiles(flat_times)[0]:>8.2f} "
+          f"{percentiles(flat_times)[1]:>8.2f} {1.0:>9.3f}")
+    print(f"flat batched: {len(queries)} queries in {batch_time * 1000:.1f} ms "
+          f"({batch_time / len(queries) * 1000:.2f} ms/query)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Сравнение ветвей поиска на размеченном наборе вопросов: латентность и recall@k.
+
+    python -m benchmarks.bench_lexical --questions questions.jsonl --k 5 10
+
+Формат файла — JSONL, по строке на вопрос:
+    {"question": "Кто такой Хорус?", "title": "Хорус Луперкаль"}
+(вместо title можно указать article_id). Попадание — хотя бы один из top-k чанков из нужной статьи.
+
+Режимы (без LLM-декомпозиции, по исходному вопросу):
+    vector  — эмбеддинг + поиск в Chroma
+    lexical — BM25 по article_chunks_fts
+    fusion  — vector + lexical через RRF
+    exact   — точное совпадение с названием статьи, иначе fusion
+"""
+import json
+import time
+import logging
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import RRF_K
+from app.rag.lexical import get_lexical_index, reciprocal_rank_fusion
+from app.rag.retriever import get_vectorstore, build_retriever
+
+MODES = ("vector", "lexical", "fusion", "exact")
+
+
+def load_questions(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_hit(doc: Document, item: dict) -> bool:
+    if "article_id" in item:
+        return doc.metadata.get("article_id") == item["article_id"]
+    return (doc.metadata.get("title") or "").strip().lower() == item["title"].strip().lower()
+
+
+def run_mode(mode: str, question: str, retriever, top_k: int) -> Tuple[List[Document], bool]:
+    """Возвращает top_k документов и признак того, что сработал путь exact."""
+    lexical = get_lexical_index()
+    if mode == "exact":
+        article_id = lexical.match_title(question)
+        if article_id is not None:
+            return [d for d, _ in lexical.article_chunks(article_id, limit=top_k)], True
+        mode = "fusion"
+
+    ranked_lists = []
+    if mode in ("vector", "fusion"):
+        ranked_lists += retriever._search_by_vectors([question])
+    if mode in ("lexical", "fusion"):
+        ranked_lists += lexical.search_many([question], k=top_k)
+
+    if mode == "fusion":
+        ranked = reciprocal_rank_fusion(ranked_lists, k=RRF_K)
+    else:
+        ranked = ranked_lists[0] if ranked_lists else []
+    return [d for d, _ in ranked[:top_k]], False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    items = load_questions(args.questions)
+    top_k = max(args.k)
+    retriever = build_retriever(get_vectorstore())
+    retriever.top_k_vector = top_k
+
+    # прогрев: модель эмбеддингов, морфология, словарь названий
+    get_lexical_index().load_titles()
+    for mode in args.modes:
+        run_mode(mode, items[0]["question"], retriever, top_k)
+
+    header = f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} " + " ".join(f"{'R@' + str(k):>6}" for k in args.k) + f" {'exact':>6}"
+    print(f"{len(items)} questions")
+    print(header)
+    for mode in args.modes:
+        latencies = []
+        hits = {k: 0 for k in args.k}
+        exact_hits = 0
+        for item in items:
+            started = time.perf_counter()
+            docs, exact = run_mode(mode, item["question"], retriever, top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            exact_hits += exact
+            for k in args.k:
+                hits[k] += any(is_hit(d, item) for d in docs[:k])
+
+        recalls = " ".join(f"{hits[k] / len(items):>6.3f}" for k in args.k)
+        print(
+            f"{mode:<8} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+            f"{recalls} {exact_hits / len(items):>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
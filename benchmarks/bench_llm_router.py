@@ -0,0 +1,84 @@
+"""
+Хвост задержек LLM: основной бэкенд напрямую против LLMRouter с хеджированием на запасной.
+Оба бэкенда — заглушки Ollama (benchmarks/stub_ollama.py) в этом же процессе, сеть и модели не нужны.
+
+    python -m benchmarks.bench_llm_router --calls 200 --tail-rate 0.1 --tail-latency 2
+    python -m benchmarks.bench_llm_router --error-rate 0.5     # размыкатель основного бэкенда
+
+Основной: задержка --latency, доля --tail-rate запросов отвечает за --tail-latency, доля --error-rate падает.
+Запасной: стабильная задержка --secondary-latency.
+"""
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+from langchain_ollama import ChatOllama
+
+from benchmarks.stub_ollama import StubBehaviour, start_stub
+from app.rag.llm_router import LLMRouter
+
+
+def run(model, calls: int):
+    times, errors = [], 0
+    for i in range(calls):
+        started = time.perf_counter()
+        try:
+            model.invoke(f"Вопрос {i}: кто такой Хорус?")
+        except Exception:
+            errors += 1
+        times.append(time.perf_counter() - started)
+    return times, errors
+
+
+def row(name, times, errors):
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    print(f"{name:<18} {p50:>7.2f} {p95:>7.2f} {p99:>7.2f} {max(times):>7.2f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tail-rate", type=float, default=0.1)
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--secondary-latency", type=float, default=0.4)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    parser.add_argument("--hedge-min-delay", type=float, default=0.3)
+    parser.add_argument("--hedge-budget", type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    def backend(behaviour, name):
+        server = start_stub(0, behaviour, name=name)
+        return ChatOllama(model="stub", base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                          client_kwargs={"timeout": args.timeout})
+
+    primary_behaviour = lambda: StubBehaviour(args.latency, args.tail_rate, args.tail_latency, args.error_rate, seed=1)
+    direct = backend(primary_behaviour(), "primary")
+    router = LLMRouter(
+        "bench",
+        [("primary", backend(primary_behaviour(), "primary")),
+         ("secondary", backend(StubBehaviour(args.secondary_latency, 0, 0, 0, seed=2), "secondary"))],
+        timeout=args.timeout,
+        hedge_percentile=args.hedge_percentile,
+        hedge_min_delay=args.hedge_min_delay,
+        hedge_budget=args.hedge_budget,
+    )
+
+    print(f"{args.calls} calls; primary {args.latency}s, {args.tail_rate:.0%} tail at {args.tail_latency}s, "
+          f"{args.error_rate:.0%} errors; secondary {args.secondary_latency}s")
+    print(f"{'mode':<18} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'errors':>7}")
+    row("primary direct", *run(direct, args.calls))
+    row("router (hedged)", *run(router, args.calls))
+    # дать брошенным вызовам завершиться, чтобы статистика была полной
+    time.sleep(args.tail_latency)
+    print(json.dumps(router.stats.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
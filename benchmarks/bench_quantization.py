@@ -0,0 +1,82 @@
+"""
+Квантованное хранение эмбеддингов: память на миллион векторов, латентность и recall@k
+относительно точного float32-поиска.
+
+    python -m app.rag.flat_index --dtype float32           # исходный индекс без потерь
+    python -m benchmarks.bench_quantization --src flat_index --queries 200 --k 10
+
+Варианты собираются из исходного плоского индекса во временном каталоге:
+float32, float16, int8 (масштаб на вектор) — без пересчёта и с float32-пересчётом кандидатов.
+"""
+import time
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.rag.flat_index import FlatVectorIndex, convert_index
+
+VARIANTS = [
+    ("float32", "float32", False),
+    ("float16", "float16", False),
+    ("float16+rescore", "float16", True),
+    ("int8", "int8", False),
+    ("int8+rescore", "int8", True),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", required=True, help="каталог исходного плоского индекса (лучше float32)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[4])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        indexes = {}
+        for name, dtype, rescore in VARIANTS:
+            out = Path(tmp) / name
+            convert_index(Path(args.src), out, dtype=dtype, rescore=rescore)
+            indexes[name] = out
+
+        exact = FlatVectorIndex(indexes["float32"])
+        rng = np.random.default_rng(0)
+        rows = rng.choice(exact.count(), size=min(args.queries, exact.count()), replace=False)
+        base = np.asarray(exact.embeddings[np.sort(rows)], dtype=np.float32)
+        scale = np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+        queries = base + args.noise * scale * rng.standard_normal(base.shape).astype(np.float32)
+        truth, _ = exact.search_rows(queries, args.k)
+
+        print(f"{exact.count()} vectors x {exact.embeddings.shape[1]}, {len(queries)} queries, k={args.k}")
+        print(f"{'variant':<22} {'B/vector':>9} {'MB per 1M':>10} {'rescore MB/1M':>14} {'p50 ms':>8} {'recall@k':>9}")
+        for name, dtype, rescore in VARIANTS:
+            factors = args.rescore_factor if rescore else [0]
+            for factor in factors:
+                index = FlatVectorIndex(indexes[name], rescore_factor=factor)
+                index.search_rows(queries[:1], args.k)  # прогрев страниц mmap
+
+                latencies, recalls = [], []
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    found, _ = index.search_rows(q, args.k)
+                    latencies.append(time.perf_counter() - started)
+                    recalls.append(len(set(found[0]) & set(expected)) / len(expected))
+
+                report = index.memory_report()
+                per_million = report["resident"] / index.count() * 1_000_000 / 2 ** 20
+                rescore_per_million = report["rescore_on_disk"] / index.count() * 1_000_000 / 2 ** 20
+                label = f"{name} (x{factor})" if rescore else name
+                print(
+                    f"{label:<22} {report['bytes_per_vector']:>9} {per_million:>10.0f} {rescore_per_million:>14.0f} "
+                    f"{np.percentile(latencies, 50) * 1000:>8.2f} {np.mean(recalls):>9.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
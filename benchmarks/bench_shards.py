@@ -0,0 +1,92 @@
+"""
+Шарды по категориям графа против одной коллекции: латентность каждого шарда, полного обхода
+и маршрутизированного поиска, а также recall@k маршрутизации относительно одной коллекции.
+
+    python -m app.rag.indexer --build-shards      # сначала разложить индекс
+    python -m benchmarks.bench_shards --questions questions.jsonl --k 6
+
+Формат файла — JSONL с полем question (как в bench_lexical); вопросы эмбеддятся моделью.
+"""
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from app.config import CHROMA_PERSIST_DIR
+from app.rag.embedding_model import get_embedding_model
+from app.rag.lexical import get_lexical_index
+from app.rag.sharding import ShardedVectorStore, ShardRouter
+
+
+def timed_search(store, vector, k, **kwargs):
+    started = time.perf_counter()
+    found = store.similarity_search_by_vector_with_relevance_scores(vector, k=k, **kwargs)
+    return time.perf_counter() - started, {doc.id or doc.metadata.get("chunk_id") for doc, _ in found}
+
+
+def ms(values, q=50):
+    return np.percentile(values, q) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--limit", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with open(args.questions, encoding="utf-8") as f:
+        texts = [json.loads(line)["question"] for line in f if line.strip()][:args.limit]
+    vectors = get_embedding_model().embed_array(texts).tolist()
+
+    single = Chroma(persist_directory=str(CHROMA_PERSIST_DIR))
+    sharded = ShardedVectorStore(CHROMA_PERSIST_DIR)
+    router = ShardRouter(sharded)
+    get_lexical_index().load_titles()
+
+    # прогрев: HNSW всех коллекций в памяти
+    single.similarity_search_by_vector_with_relevance_scores(vectors[0], k=args.k)
+    sharded.similarity_search_by_vector_with_relevance_scores(vectors[0], k=args.k)
+
+    print(f"{len(texts)} questions, k={args.k}")
+    print(f"{'shard':<32} {'vectors':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, store in sharded.shards.items():
+        times = [timed_search(store, v, args.k)[0] for v in vectors]
+        print(f"{name[:32]:<32} {store._collection.count():>9} {ms(times):>8.2f} {ms(times, 95):>8.2f}")
+
+    single_times, fanout_times, routed_times, route_times = [], [], [], []
+    fanout_recall, routed_recall, shards_searched, routed_queries = [], [], [], 0
+    for text, vector in zip(texts, vectors):
+        elapsed, expected = timed_search(single, vector, args.k)
+        single_times.append(elapsed)
+
+        elapsed, found = timed_search(sharded, vector, args.k)
+        fanout_times.append(elapsed)
+        fanout_recall.append(len(found & expected) / max(len(expected), 1))
+
+        started = time.perf_counter()
+        shards = router.route(text)
+        route_times.append(time.perf_counter() - started)
+        routed_queries += shards is not None
+        shards_searched.append(len(shards) if shards else len(sharded.shards))
+        elapsed, found = timed_search(sharded, vector, args.k, shards=shards)
+        routed_times.append(elapsed + route_times[-1])
+        routed_recall.append(len(found & expected) / max(len(expected), 1))
+
+    print()
+    print(f"{'mode':<20} {'p50 ms':>8} {'p95 ms':>8} {'shards':>7} {'recall@k':>9}")
+    print(f"{'single collection':<20} {ms(single_times):>8.2f} {ms(single_times, 95):>8.2f} {1:>7} {1.0:>9.3f}")
+    print(f"{'all shards':<20} {ms(fanout_times):>8.2f} {ms(fanout_times, 95):>8.2f} "
+          f"{len(sharded.shards):>7} {np.mean(fanout_recall):>9.3f}")
+    print(f"{'routed':<20} {ms(routed_times):>8.2f} {ms(routed_times, 95):>8.2f} "
+          f"{np.mean(shards_searched):>7.1f} {np.mean(routed_recall):>9.3f}")
+    print(f"routed queries: {routed_queries}/{len(texts)}, router p50 {ms(route_times):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Полные метаданные в Chroma против тонкого индекса (только chunk_id/article_id) с дозагрузкой из SQLite:
+размер индекса на диске и время на запрос (поиск + десериализация, дозагрузка).
+
+    python -m benchmarks.bench_slim_index --db warhammer_articles.db --limit 20000 --queries 200 --k 50
+
+Векторы берутся из существующей коллекции CHROMA_PERSIST_DIR и копируются в две временные коллекции,
+поэтому модель эмбеддингов не нужна. Исходный индекс не меняется.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from app.config import CHROMA_PERSIST_DIR
+from app.rag.hydration import ChunkHydrator, slim_metadata
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def load_source(limit, page_size=5000):
+    source = Chroma(persist_directory=str(CHROMA_PERSIST_DIR))
+    total = min(source._collection.count(), limit)
+    ids, vectors, metadatas, documents = [], [], [], []
+    for offset in range(0, total, page_size):
+        page = source._collection.get(
+            include=["embeddings", "metadatas", "documents"], limit=min(page_size, total - offset), offset=offset
+        )
+        ids += page["ids"]
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        metadatas += page["metadatas"]
+        documents += page["documents"]
+    return ids, np.vstack(vectors), metadatas, documents
+
+
+def build_copy(path, ids, vectors, metadatas, documents, batch_size=5000):
+    store = Chroma(persist_directory=path)
+    for i in range(0, len(ids), batch_size):
+        store._collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size].tolist(),
+            metadatas=metadatas[i:i + batch_size],
+            documents=documents[i:i + batch_size],
+        )
+    return store
+
+
+def payload_bytes(results):
+    return sum(len(doc.page_content.encode("utf-8")) + len(json.dumps(doc.metadata, ensure_ascii=False)) for doc, _ in results)
+
+
+def ms(values, q):
+    return np.percentile(values, q) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="warhammer_articles.db")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    ids, vectors, metadatas, documents = load_source(args.limit)
+    if not ids:
+        raise SystemExit("Коллекция пуста: сначала python -m app.rag.indexer")
+    if any(not doc for doc in documents):
+        raise SystemExit("Исходная коллекция уже тонкая: нужен индекс с полными метаданными")
+    slim = [slim_metadata(Document(page_content=doc, metadata=meta)) for doc, meta in zip(documents, metadatas)]
+
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    base = vectors[rows]
+    scale = np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+    queries = base + args.noise * scale * rng.standard_normal(base.shape).astype(np.float32)
+
+    hydrator = ChunkHydrator(args.db)
+    with tempfile.TemporaryDirectory() as tmp:
+        full_dir, slim_dir = os.path.join(tmp, "full"), os.path.join(tmp, "slim")
+        full = build_copy(full_dir, ids, vectors, metadatas, documents)
+        slim_store = build_copy(slim_dir, ids, vectors, slim, [""] * len(ids))
+
+        # прогрев: HNSW в памяти, соединение SQLite
+        full.similarity_search_by_vector_with_relevance_scores(queries[0].tolist(), k=args.k)
+        hydrator.hydrate([slim_store.similarity_search_by_vector_with_relevance_scores(queries[0].tolist(), k=args.k)])
+
+        full_times, slim_times, hydrate_times = [], [], []
+        full_bytes, slim_bytes = [], []
+        for q in queries:
+            vector = q.tolist()
+            t = time.perf_counter()
+            results = full.similarity_search_by_vector_with_relevance_scores(vector, k=args.k)
+            full_times.append(time.perf_counter() - t)
+            full_bytes.append(payload_bytes(results))
+
+            t = time.perf_counter()
+            results = slim_store.similarity_search_by_vector_with_relevance_scores(vector, k=args.k)
+            slim_times.append(time.perf_counter() - t)
+            slim_bytes.append(payload_bytes(results))
+
+            t = time.perf_counter()
+            hydrator.hydrate([results])
+            hydrate_times.append(time.perf_counter() - t)
+
+        full_size, slim_size = dir_size(full_dir), dir_size(slim_dir)
+
+    total_times = np.add(slim_times, hydrate_times)
+    print(f"{len(ids)} chunks x {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    print(f"{'layout':<14} {'index MB':>9} {'payload KB':>11} {'search p50':>11} {'hydrate p50':>12} {'total p50':>10} {'total p95':>10}")
+    print(f"{'full':<14} {full_size / 2**20:>9.1f} {np.mean(full_bytes) / 1024:>11.1f} {ms(full_times, 50):>11.2f} "
+          f"{0.0:>12.2f} {ms(full_times, 50):>10.2f} {ms(full_times, 95):>10.2f}")
+    print(f"{'slim':<14} {slim_size / 2**20:>9.1f} {np.mean(slim_bytes) / 1024:>11.1f} {ms(slim_times, 50):>11.2f} "
+          f"{ms(hydrate_times, 50):>12.2f} {ms(total_times, 50):>10.2f} {ms(total_times, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
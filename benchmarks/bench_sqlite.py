@@ -0,0 +1,156 @@
+"""
+Бенчмарк доступа к SQLite: старый режим (новое соединение на вызов, настройки по умолчанию,
+rollback-журнал) против общего слоя app/db.py (соединение на поток, WAL, mmap, кеш страниц).
+
+    python -m benchmarks.bench_sqlite --db warhammer_articles.db --lookups 2000 --saves 500
+
+Путь загрузки чанков: полный проход по article_chunks страницами и выборки чанков по статье.
+Путь сохранения краулера: save_article для синтетических статей (по commit на статью).
+Работает на копиях базы, исходная БД не меняется.
+"""
+import os
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+
+from app.chunks_loader import DatabaseTextLoader
+from app.db import connect
+
+CHUNKS_BY_ARTICLE_SQL = '''
+    SELECT id, chunk_text, article_id, chunk_index, title, article_url, sources, entities
+    FROM article_chunks
+    WHERE LENGTH(chunk_text) > 10 AND article_id = ?
+    ORDER BY article_id, chunk_index LIMIT ?
+'''
+CHUNK_PAGE_SQL = '''
+    SELECT id, chunk_text, article_id, chunk_index, title, article_url, sources, entities
+    FROM article_chunks
+    WHERE id > ? AND LENGTH(chunk_text) > 10
+    ORDER BY id
+    LIMIT ?
+'''
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+# ---------- Загрузка чанков ----------
+def legacy_scan(db_path, page_size):
+    rows, last_id = 0, 0
+    while True:
+        conn = sqlite3.connect(db_path)
+        page = conn.execute(CHUNK_PAGE_SQL, (last_id, page_size)).fetchall()
+        conn.close()
+        if not page:
+            return rows
+        rows += len(page)
+        last_id = page[-1][0]
+
+
+def legacy_lookups(db_path, article_ids):
+    rows = 0
+    for article_id in article_ids:
+        conn = sqlite3.connect(db_path)
+        rows += len(conn.execute(CHUNKS_BY_ARTICLE_SQL, (article_id, 10000)).fetchall())
+        conn.close()
+    return rows
+
+
+def pooled_scan(loader, page_size):
+    return sum(len(page) for _, page in loader.iter_chunk_pages(page_size=page_size))
+
+
+def pooled_lookups(loader, article_ids):
+    return sum(len(loader.load_chunks_from_db(article_id=article_id)) for article_id in article_ids)
+
+
+# ---------- Сохранение статей краулером ----------
+def synthetic_articles(n, seed=0):
+    rnd = random.Random(seed)
+    words = "Абаддон Хорус Жиллиман легион примарх Император Терра ересь война крестовый поход".split()
+    for i in range(n):
+        body = "\n\n".join(" ".join(rnd.choice(words) for _ in range(80)) for _ in range(6))
+        yield (
+            f"Бенчмарк {i}", f"Бенчмарк {i}",
+            body + "\nИСТОЧНИКИ\nКодекс: Космодесант\nИндекс Астартес\n",
+            "[[Абаддон]] [[Хорус|х]] [[Жиллиман]]",
+        )
+
+
+def bench_saves(db_path, n, legacy):
+    from parser.warhammer_wiki import WarhammerDatabase
+
+    db = WarhammerDatabase(db_path)
+    if legacy:
+        # тот же код сохранения на соединении со старыми настройками
+        db.conn.close()
+        db.conn = sqlite3.connect(db_path)
+        db.conn.execute("PRAGMA journal_mode=DELETE")
+
+    def run():
+        for original, final, content, wikitext in synthetic_articles(n):
+            db.save_article(original, final, content, wikitext=wikitext)
+        return n
+
+    elapsed, _ = timed(run)
+    db.conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="warhammer_articles.db")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--saves", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        pooled_db = os.path.join(tmp, "pooled.db")
+        shutil.copy(args.db, legacy_db)
+        shutil.copy(args.db, pooled_db)
+
+        conn = sqlite3.connect(legacy_db)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        article_ids = [row[0] for row in conn.execute("SELECT DISTINCT article_id FROM article_chunks")]
+        conn.close()
+        if not article_ids:
+            raise SystemExit("В базе нет чанков: сначала python -m app.rag.indexer")
+        rnd = random.Random(42)
+        sample = [rnd.choice(article_ids) for _ in range(args.lookups)]
+
+        loader = DatabaseTextLoader(db_path=pooled_db)
+        # сам файл переводится в WAL при первом соединении app/db.py
+        connect(pooled_db).close()
+
+        print(f"{'path':<28} {'legacy s':>10} {'pooled s':>10} {'speedup':>8}")
+
+        def report(name, legacy_time, pooled_time):
+            print(f"{name:<28} {legacy_time:>10.3f} {pooled_time:>10.3f} {legacy_time / pooled_time:>7.1f}x")
+
+        legacy_time, legacy_rows = timed(lambda: legacy_scan(legacy_db, args.page_size))
+        pooled_time, pooled_rows = timed(lambda: pooled_scan(loader, args.page_size))
+        assert legacy_rows == pooled_rows, (legacy_rows, pooled_rows)
+        report(f"chunk scan ({pooled_rows} rows)", legacy_time, pooled_time)
+
+        legacy_time, _ = timed(lambda: legacy_lookups(legacy_db, sample))
+        pooled_time, _ = timed(lambda: pooled_lookups(loader, sample))
+        report(f"chunks by article (x{len(sample)})", legacy_time, pooled_time)
+
+        legacy_time = bench_saves(legacy_db, args.saves, legacy=True)
+        pooled_time = bench_saves(pooled_db, args.saves, legacy=False)
+        report(f"crawler save (x{args.saves})", legacy_time, pooled_time)
+
+
+if __name__ == "__main__":
+    main()
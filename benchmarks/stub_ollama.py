@@ -0,0 +1,135 @@
+"""
+Заглушка Ollama API (/api/chat, /api/tags) с управляемой задержкой, хвостом и ошибками —
+для проверки маршрутизатора LLM (app/rag/llm_router.py) без GigaChat и модели.
+
+    python -m benchmarks.stub_ollama --port 11434 --latency 0.3 --tail-rate 0.1 --tail-latency 5
+    OLLAMA_BASE_URL=http://localhost:11434 LLM_PRIMARY=ollama LLM_SECONDARY= python bot.py
+
+Ответ стримится NDJSON-строками, как у Ollama; при "stream": false — одним JSON.
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+class StubBehaviour:
+    def __init__(self, latency: float, tail_rate: float, tail_latency: float, error_rate: float, seed: int = 0):
+        self.latency = latency
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next(self):
+        """(задержка, ошибка ли) для очередного запроса."""
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            jitter = self._random.uniform(0.8, 1.2)
+        if roll < self.error_rate:
+            return self.latency * jitter, True
+        if roll < self.error_rate + self.tail_rate:
+            return self.tail_latency * jitter, False
+        return self.latency * jitter, False
+
+
+def make_handler(behaviour: StubBehaviour, model: str, name: str):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _json(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path in ("/api/tags", "/api/ps"):
+                self._json(200, {"models": [{"name": model, "model": model}]})
+            elif self.path == "/api/version":
+                self._json(200, {"version": "0.0.0-stub"})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path != "/api/chat":
+                self._json(404, {"error": "not found"})
+                return
+            delay, failed = behaviour.next()
+            time.sleep(delay)
+            if failed:
+                self._json(500, {"error": "stub failure"})
+                return
+
+            question = (request.get("messages") or [{}])[-1].get("content", "")
+            words = f"[{name}] ответ на: {question[:60]}".split()
+            created_at = datetime.now(timezone.utc).isoformat()
+            final = {
+                "model": model, "created_at": created_at, "message": {"role": "assistant", "content": ""},
+                "done": True, "done_reason": "stop", "total_duration": int(delay * 1e9),
+                "prompt_eval_count": len(question.split()), "eval_count": len(words),
+            }
+            if request.get("stream") is False:
+                final["message"]["content"] = " ".join(words)
+                self._json(200, final)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            lines = [
+                {"model": model, "created_at": created_at,
+                 "message": {"role": "assistant", "content": word + " "}, "done": False}
+                for word in words
+            ] + [final]
+            for line in lines:
+                data = (json.dumps(line, ensure_ascii=False) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def start_stub(port: int, behaviour: StubBehaviour, model: str = "stub", name: str = "stub") -> ThreadingHTTPServer:
+    """Поднимает заглушку в фоновом потоке (для бенчмарков); port=0 — свободный порт."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(behaviour, model, name))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="owl/t-lite:latest")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    behaviour = StubBehaviour(args.latency, args.tail_rate, args.tail_latency, args.error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(behaviour, args.model, "stub"))
+    logger.info(f"Stub Ollama on http://127.0.0.1:{args.port}, model {args.model}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
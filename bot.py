@@ -8,6 +8,7 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 
 from app.handlers import register_handlers
+from app.bootstrap import wait_until_ready
 
 logging.basicConfig(
     level=logging.INFO,
@@ -32,6 +33,8 @@ def setup() -> Dispatcher:
 
 async def main():
     logger.info("Starting bot...")
+    # Поллинг стартует только после успешной проверки готовности
+    await asyncio.to_thread(wait_until_ready)
     dp = setup()
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
@@ -7,6 +7,8 @@ from bs4 import BeautifulSoup
 from urllib.parse import quote
 from datetime import datetime
 
+from app.db_core import connect, transaction
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -20,12 +22,13 @@ logger = logging.getLogger(__name__)
 
 class WarhammerDatabase:
     def __init__(self, db_name='warhammer_articles.db'):
-        self.conn = sqlite3.connect(db_name)
+        # WAL: краулер пишет, пока загрузчики чанков и бот читают ту же базу
+        self.conn = connect(db_name)
         self.create_tables()
         
     def create_tables(self):
         cursor = self.conn.cursor()
-        
+
         # Main articles table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS articles (
@@ -39,6 +42,7 @@ class WarhammerDatabase:
             wikitext TEXT,
             redirects_count INTEGER DEFAULT 0,
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash TEXT,  -- filled by the indexer; reset to NULL when the article is re-saved
             UNIQUE(final_title)
         )
         ''')
@@ -67,6 +71,11 @@ class WarhammerDatabase:
             run_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
+
+        # Base created before content_hash existed: save_article resets the hash on every save
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(articles)")]
+        if "content_hash" not in columns:
+            cursor.execute("ALTER TABLE articles ADD COLUMN content_hash TEXT")
         
         self.conn.commit()
         logger.info("Database tables created/verified")
@@ -88,29 +97,32 @@ class WarhammerDatabase:
             safe_title = quote(final_title.replace(' ', '_'))
             article_url = f"https://warhammer40k.fandom.com/ru/wiki/{safe_title}"
 
-            # Сохраняем и очищенный текст, и wikitext
-            cursor = self.conn.cursor()
-            cursor.execute('''
-            INSERT OR REPLACE INTO articles 
-            (original_title, final_title, article_url, content, content_length, redirects_count, entities, wikitext)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (original_title, final_title, article_url, content, len(content), redirects, entities_str, wikitext))
-            
-            article_id = cursor.lastrowid
-            if article_id == 0:
-                cursor.execute('SELECT id FROM articles WHERE final_title = ?', (final_title,))
-                article_id = cursor.fetchone()[0]
-
-            # Извлекаем и сохраняем источники
-            self._extract_and_save_sources(cursor, article_id, content)
-
-            # Обновляем FTS
-            cursor.execute('''
-            INSERT OR REPLACE INTO articles_fts (rowid, title, content)
-            VALUES (?, ?, ?)
-            ''', (article_id, final_title, content))
+            # Статья, источники и FTS сохраняются одной транзакцией
+            with transaction(self.conn):
+                # Сохраняем и очищенный текст, и wikitext
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                INSERT OR REPLACE INTO articles 
+                (original_title, final_title, article_url, content, content_length, redirects_count, entities, wikitext)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (original_title, final_title, article_url, content, len(content), redirects, entities_str, wikitext))
+                
+                article_id = cursor.lastrowid
+                if article_id == 0:
+                    cursor.execute('SELECT id FROM articles WHERE final_title = ?', (final_title,))
+                    article_id = cursor.fetchone()[0]
+
+                # Извлекаем и сохраняем источники
+                self._extract_and_save_sources(cursor, article_id, content)
+                # Хеш статьи (текст, URL, сущности, источники) пересчитает индексатор
+                cursor.execute('UPDATE articles SET content_hash = NULL WHERE id = ?', (article_id,))
+
+                # Обновляем FTS
+                cursor.execute('''
+                INSERT OR REPLACE INTO articles_fts (rowid, title, content)
+                VALUES (?, ?, ?)
+                ''', (article_id, final_title, content))
 
-            self.conn.commit()
             logger.debug(f"Saved article: {final_title} with {len(clean_links)} entities")
             return True
         except sqlite3.Error as e:
@@ -153,20 +165,18 @@ class WarhammerDatabase:
                 if source_line.strip() != '':
                     sources.append(source_line.strip())
         
-        # Save each source separately
-        for source in sources:
-            cursor.execute(
-                'INSERT INTO sources (article_id, source_text) VALUES (?, ?)',
-                (article_id, source)
-            )
+        # Save all sources with one prepared statement
+        cursor.executemany(
+            'INSERT INTO sources (article_id, source_text) VALUES (?, ?)',
+            [(article_id, source) for source in sources]
+        )
         logger.debug(f"Extracted {len(sources)} sources for article ID {article_id}")
 
     def log_update(self, count):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        INSERT INTO update_history (articles_count) VALUES (?)
-        ''', (count,))
-        self.conn.commit()
+        with transaction(self.conn):
+            self.conn.execute('''
+            INSERT INTO update_history (articles_count) VALUES (?)
+            ''', (count,))
         logger.info(f"Logged update with {count} articles processed")
 
 class FandomParser:
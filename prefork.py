@@ -0,0 +1,171 @@
+import os
+import gc
+import time
+import signal
+import socket
+import asyncio
+import logging
+
+import uvicorn
+
+import webhook
+from app.config import WEBHOOK_URL, WEB_HOST, WEB_PORT, WEB_WORKERS, MEMORY_REPORT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def preload_resources():
+    """
+    Загружает в родительском процессе все read-only тяжёлые ресурсы:
+    модель эмбеддингов, Natasha/pymorphy, газеттир и векторный индекс.
+    После fork воркеры получают их copy-on-write.
+    """
+    start = time.time()
+
+    from app.bootstrap import wait_until_ready
+    from app.rag import rag_service
+    from app.rag.NER import get_gazetteer, normalize_text_entities
+    from app.graph.node import close_driver
+
+    # CPU-пул и токен GigaChat не поднимаем в родителе: процессы, пайпы, keep-alive сокеты и таймер
+    # обновления токена не переживают fork, воркеры создают свои сами
+    wait_until_ready(skip=("cpu_pool", "llm_token"))
+
+    # Прогреваем ленивые части, чтобы страницы попали в общую память до fork
+    normalize_text_entities("Абаддон")
+    rag_service.retriever.vectorstore.similarity_search_with_score("Абаддон", k=1)
+
+    # Сетевые соединения не должны разделяться между процессами
+    close_driver()
+
+    logger.info(f"Resources preloaded in {time.time() - start:.1f}s (gazetteer: {len(get_gazetteer())} entries)")
+
+
+def read_memory(pid: int) -> dict:
+    """Читает /proc/<pid>/smaps_rollup и возвращает значения в КБ."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    memory[name] = int(value.split()[0])
+    except OSError as e:
+        logger.warning(f"Cannot read memory stats for pid {pid}: {e}")
+    return memory
+
+
+def report_memory(parent_pid: int, worker_pids: list):
+    """Логирует уникальную (private) и разделяемую (shared) память каждого процесса."""
+    total_unique = 0
+    for role, pid in [("parent", parent_pid)] + [("worker", p) for p in worker_pids]:
+        m = read_memory(pid)
+        if not m:
+            continue
+        unique = m.get("Private_Clean", 0) + m.get("Private_Dirty", 0)
+        shared = m.get("Shared_Clean", 0) + m.get("Shared_Dirty", 0)
+        total_unique += unique
+        logger.info(
+            f"[memory] {role} pid={pid}: rss={m.get('Rss', 0) / 1024:.1f}MB "
+            f"pss={m.get('Pss', 0) / 1024:.1f}MB unique={unique / 1024:.1f}MB shared={shared / 1024:.1f}MB"
+        )
+    logger.info(f"[memory] total unique across {len(worker_pids) + 1} processes: {total_unique / 1024:.1f}MB")
+
+
+def create_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((WEB_HOST, WEB_PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket):
+    """Тело дочернего процесса: uvicorn на общем сокете."""
+    # Замороженные объекты родителя GC больше не трогает, новые — собираем как обычно
+    gc.enable()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    config = uvicorn.Config(webhook.app, log_level="info")
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def spawn_worker(sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        run_worker(sock)
+    logger.info(f"Spawned worker pid={pid}")
+    return pid
+
+
+def main():
+    if WEBHOOK_URL:
+        asyncio.run(webhook.register_webhook())
+    else:
+        logger.warning("WEBHOOK_URL is not set, webhook is not registered in Telegram")
+
+    sock = create_socket()
+
+    # Во время загрузки GC не нужен: меньше пауз и меньше «грязных» страниц
+    gc.disable()
+    preload_resources()
+    gc.collect()
+    # Переносим все объекты в permanent generation — сборщик мусора в воркерах
+    # не будет писать в их заголовки и ломать copy-on-write
+    gc.freeze()
+    logger.info(f"GC heap frozen: {gc.get_freeze_count()} objects")
+
+    workers = [spawn_worker(sock) for _ in range(WEB_WORKERS)]
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    logger.info(f"Prefork server on {WEB_HOST}:{WEB_PORT} with {len(workers)} workers")
+    last_report = 0.0
+
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid:
+            workers.remove(pid)
+            if not stopping:
+                logger.warning(f"Worker pid={pid} exited with status {status}, respawning")
+                workers.append(spawn_worker(sock))
+            continue
+
+        if MEMORY_REPORT_INTERVAL and time.time() - last_report >= MEMORY_REPORT_INTERVAL:
+            report_memory(os.getpid(), workers)
+            last_report = time.time()
+
+        time.sleep(1)
+
+    sock.close()
+    logger.info("Prefork server stopped")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.critical("Fatal error: %s", str(e), exc_info=True)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app/config.py читает обязательные переменные при импорте; в тестах — безопасные значения
+os.environ.setdefault("CHROMA_PERSIST_DIR", tempfile.mkdtemp(prefix="chroma_test_"))
+os.environ.setdefault("MAX_RESPONSE_LENGTH", "4000")
+os.environ.setdefault("MAX_MESSAGE_LENGTH", "500")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
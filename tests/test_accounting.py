@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.rag import accounting
+from app.rag.accounting import LLMAccounting, RequestLedger, budget_exceeded, current_ledger_var, record_call, token_usage
+
+
+@pytest.fixture
+def ledger():
+    tokens = []
+
+    def start(**budgets):
+        ledger = RequestLedger(**budgets)
+        tokens.append(current_ledger_var.set(ledger))
+        return ledger
+
+    yield start
+    for token in reversed(tokens):
+        current_ledger_var.reset(token)
+
+
+def test_token_usage_from_usage_metadata():
+    message = AIMessage(content="", usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150})
+    assert token_usage(message) == (120, 30)
+
+
+def test_token_usage_from_provider_metadata():
+    message = SimpleNamespace(response_metadata={"token_usage": {"prompt_tokens": 50, "completion_tokens": 7}})
+    assert token_usage(message) == (50, 7)
+    assert token_usage(AIMessage(content="")) == (0, 0)
+
+
+def test_over_budget_by_tokens_and_calls():
+    by_tokens = RequestLedger(token_budget=100, call_budget=0)
+    by_tokens.record("agent", 0.5, 60, 30)
+    assert by_tokens.over_budget() is None
+    by_tokens.record("agent", 0.5, 5, 5)
+    assert by_tokens.over_budget() == "100 of 100 tokens"
+
+    by_calls = RequestLedger(token_budget=0, call_budget=2)
+    by_calls.record("decomposer", 0.1, failed=True)
+    assert by_calls.over_budget() is None
+    by_calls.record("agent", 0.1)
+    assert by_calls.over_budget() == "2 of 2 calls"
+
+
+def test_zero_budgets_are_unlimited():
+    unlimited = RequestLedger(token_budget=0, call_budget=0)
+    for _ in range(100):
+        unlimited.record("agent", 0.1, 1000, 1000)
+    assert unlimited.over_budget() is None
+
+
+def test_budget_exceeded_records_downgrade_once(ledger):
+    assert not budget_exceeded("agent")
+    current = ledger(token_budget=0, call_budget=1)
+    assert not budget_exceeded("agent")
+    current.record("decomposer", 0.1)
+    assert budget_exceeded("agent")
+    assert budget_exceeded("agent")
+    assert current.downgraded == ["agent"]
+
+
+def test_record_call_updates_ledger_and_worker_totals(ledger, monkeypatch):
+    totals = LLMAccounting(report_every=0)
+    monkeypatch.setattr(accounting, "_accounting", totals)
+    current = ledger(token_budget=0, call_budget=0)
+    message = AIMessage(content="", usage_metadata={"input_tokens": 10, "output_tokens": 5, "total_tokens": 15})
+
+    record_call(current, "answer", 0.2, message)
+    record_call(None, "answer", 0.4, failed=True)
+    assert current.calls == 1 and current.tokens == 15
+
+    current.downgraded.append("agent")
+    totals.close(current)
+    stats = totals.stats()
+    assert stats["requests"] == 1 and stats["over_budget"] == 1
+    assert stats["downgrades"] == {"agent": 1}
+    assert stats["roles"]["answer"]["calls"] == 2 and stats["roles"]["answer"]["errors"] == 1
+    assert stats["tokens_per_request_p50"] == 15
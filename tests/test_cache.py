@@ -0,0 +1,71 @@
+import pytest
+
+from app.rag import cache
+from app.rag.cache import RetrievalCache
+
+
+@pytest.fixture
+def index_version(monkeypatch):
+    version = {"value": "v1"}
+    monkeypatch.setattr(cache, "current_index_version", lambda: version["value"])
+    return version
+
+
+def test_hit_and_miss(index_version):
+    c = RetrievalCache("test", maxsize=10, ttl=60)
+    assert c.get("q") is None
+    c.put("q", [1, 2])
+    assert c.get("q") == [1, 2]
+    stats = c.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction_keeps_recently_used(index_version):
+    c = RetrievalCache("test", maxsize=2, ttl=60)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1  # "a" становится самым свежим
+    c.put("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(index_version, monkeypatch):
+    now = {"value": 100.0}
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now["value"])
+    c = RetrievalCache("test", maxsize=10, ttl=30)
+    c.put("q", "value")
+    now["value"] += 29
+    assert c.get("q") == "value"
+    now["value"] += 2
+    assert c.get("q") is None
+    assert c.stats()["expired"] == 1
+    assert c.stats()["size"] == 0
+
+
+def test_index_version_change_drops_entries(index_version):
+    c = RetrievalCache("test", maxsize=10, ttl=60)
+    c.put("q", "old")
+    index_version["value"] = "v2"
+    assert c.get("q") is None
+    assert c.stats()["invalidations"] == 1
+    c.put("q", "new")
+    assert c.get("q") == "new"
+
+
+def test_maxsize_zero_disables_cache(index_version):
+    c = RetrievalCache("test", maxsize=0, ttl=60)
+    c.put("q", "value")
+    assert c.get("q") is None
+    assert c.stats()["size"] == 0
+
+
+def test_current_index_version_reads_stamp(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "active_index_dir", lambda: tmp_path)
+    monkeypatch.setattr(cache, "_version", {"value": None, "checked_at": 0.0})
+    assert cache.current_index_version() == "unversioned"
+
+    monkeypatch.setattr(cache, "_version", {"value": None, "checked_at": 0.0})
+    version = cache.stamp_index_version(tmp_path)
+    assert cache.current_index_version() == version
@@ -0,0 +1,87 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from app.rag.context_packer import ContextPacker, NodeContext, DOCUMENT_SEPARATOR
+
+
+class WordCounter:
+    """Токен = слово: бюджеты в тестах считаются без tiktoken."""
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def _embed_by_text(vectors):
+    def embed(docs):
+        return np.array([vectors[doc.page_content] for doc in docs], dtype=np.float32)
+    return embed
+
+
+def _node(title, description, chunks, score=0.0):
+    return NodeContext(
+        title=title,
+        description=description,
+        chunks=[(Document(page_content=text), s) for text, s in chunks],
+        metadata={"title": title},
+        score=score,
+    )
+
+
+def _tokens(docs):
+    return WordCounter().count(DOCUMENT_SEPARATOR.join(doc.page_content for doc in docs))
+
+
+def test_packed_context_fits_budget():
+    text = lambda i: " ".join(f"слово{i}_{j}" for j in range(30))
+    nodes = [
+        _node("Хорус", "Магистр войны", [(text(i), 1.0 - i / 10) for i in range(5)], score=2.0),
+        _node("Абаддон", "Разоритель", [(text(10 + i), 0.5) for i in range(5)], score=1.0),
+    ]
+    vectors = {text(i): np.eye(20)[i] for i in list(range(5)) + list(range(10, 15))}
+    packer = ContextPacker(max_tokens=150, dedup_threshold=0.95, counter=WordCounter())
+
+    packed = packer.pack(nodes, _embed_by_text(vectors))
+    assert _tokens(packed) <= 150
+    # оба описания входят первыми, на чанки остаётся часть бюджета
+    assert [doc.metadata["title"] for doc in packed] == ["Хорус", "Абаддон"]
+    assert all("[ОПИСАНИЕ]" in doc.page_content for doc in packed)
+    assert 0 < sum(sum(node.kept) for node in nodes) < 10
+
+
+def test_near_duplicates_keep_more_relevant_chunk():
+    nodes = [
+        _node("Хорус", "", [("дубль слабый", 0.2)], score=1.0),
+        _node("Абаддон", "", [("дубль сильный", 0.9), ("другое", 0.5)], score=1.0),
+    ]
+    vectors = {"дубль слабый": [1.0, 0.01], "дубль сильный": [1.0, 0.0], "другое": [0.0, 1.0]}
+    packer = ContextPacker(max_tokens=1000, dedup_threshold=0.95, counter=WordCounter())
+
+    packed = packer.pack(nodes, _embed_by_text(vectors))
+    assert nodes[0].kept == [False]
+    assert nodes[1].kept == [True, True]
+    # узел без описания и без чанков не попадает в контекст
+    assert [doc.metadata["title"] for doc in packed] == ["Абаддон"]
+
+
+def test_chunks_allocated_by_node_weight():
+    chunk = lambda prefix, i: " ".join(f"{prefix}{i}_{j}" for j in range(10))
+    nodes = [
+        _node("Слабый", "", [(chunk("a", i), 0.1) for i in range(6)], score=0.0),
+        _node("Сильный", "", [(chunk("b", i), 1.0) for i in range(6)], score=3.0),
+    ]
+    for node in nodes:
+        node.kept = [True] * len(node.chunks)
+    packer = ContextPacker(max_tokens=80, counter=WordCounter())
+
+    descriptions, kept_nodes = packer._allocate(nodes)
+    assert descriptions == ["", ""] and kept_nodes == 2
+    assert sum(nodes[1].kept) > sum(nodes[0].kept)
+
+
+def test_zero_budget_disables_packing():
+    nodes = [_node("Хорус", "Магистр войны", [("a b c", 0.5), ("a b c", 0.4)])]
+    packer = ContextPacker(max_tokens=0, counter=WordCounter())
+
+    packed = packer.pack(nodes, embed=lambda docs: None)
+    assert len(packed) == 1
+    assert packed[0].page_content.count("a b c") == 2
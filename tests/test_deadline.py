@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+from app.rag import deadline as deadline_module
+from app.rag.deadline import Deadline, NO_DEADLINE, current_deadline, current_deadline_var, deadline_stats, llm_timeout
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"value": 1000.0}
+    monkeypatch.setattr(deadline_module.time, "monotonic", lambda: now["value"])
+    return now
+
+
+@pytest.fixture
+def request_deadline():
+    tokens = []
+
+    def start(budget, reserve):
+        deadline = Deadline(budget, reserve)
+        tokens.append(current_deadline_var.set(deadline))
+        return deadline
+
+    yield start
+    for token in reversed(tokens):
+        current_deadline_var.reset(token)
+
+
+def test_remaining_keeps_answer_reserve(clock):
+    deadline = Deadline(budget=60, reserve=20)
+    clock["value"] += 30
+    assert deadline.remaining() == pytest.approx(10)
+    assert deadline.remaining(reserve=False) == pytest.approx(30)
+    assert not deadline.expired()
+    clock["value"] += 15
+    assert deadline.expired()
+    assert deadline.elapsed() == pytest.approx(45)
+
+
+def test_no_budget_means_no_limit():
+    deadline = Deadline(budget=0, reserve=20)
+    assert deadline.remaining() == math.inf
+    assert deadline.reserve == 0.0
+    assert current_deadline() is NO_DEADLINE
+    assert llm_timeout("agent", 30) == 30
+
+
+def test_stage_timeouts_capped_by_request_deadline(clock, request_deadline):
+    request_deadline(60, 20)
+    clock["value"] += 35
+    assert llm_timeout("agent", 30) == pytest.approx(5)
+    assert llm_timeout("decomposer", 3) == pytest.approx(3)
+    assert llm_timeout("agent", 30) == pytest.approx(5)
+
+
+def test_answer_gets_rest_of_request_but_at_least_reserve(clock, request_deadline):
+    request_deadline(60, 20)
+    clock["value"] += 10
+    assert llm_timeout("answer", 120) == pytest.approx(50)
+    clock["value"] += 45
+    # дедлайн почти вышел, но ответ всё равно получает резерв
+    assert llm_timeout("answer", 120) == pytest.approx(20)
+    assert llm_timeout("answer", 10) == pytest.approx(10)
+    assert llm_timeout("agent", 30) < 0
+
+
+def test_stage_shrink_is_recorded(clock):
+    deadline = Deadline(budget=10, reserve=2)
+    with deadline.stage("test_graph") as stage:
+        clock["value"] += 7
+        assert not stage.exhausted()
+        assert stage.exhausted(need=2)
+        stage.shrink("pairs 3/10")
+        stage.shrink("pairs 4/10")
+    with deadline.stage("test_graph"):
+        pass
+
+    assert deadline.shrunk == ["test_graph"]
+    stats = deadline_stats()["test_graph"]
+    assert stats["calls"] == 2 and stats["shrunk"] == 1 and stats["hit_rate"] == 0.5
+    assert stats["p50_ms"] == 3500
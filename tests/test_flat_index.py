@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from app.rag.flat_index import FlatIndexWriter, FlatVectorIndex, quantize_int8
+
+
+def _build(tmp_path, vectors, dtype, rescore=False):
+    out_dir = tmp_path / f"flat_{dtype}_{rescore}"
+    writer = FlatIndexWriter(out_dir, len(vectors), dtype=dtype, rescore=rescore)
+    writer.add(
+        [f"id{i}" for i in range(len(vectors))],
+        vectors,
+        [f"doc {i}" for i in range(len(vectors))],
+        [{"article_id": i // 2, "chunk_id": i} for i in range(len(vectors))],
+    )
+    writer.finish("test")
+    return FlatVectorIndex(out_dir, rescore_factor=4 if rescore else 0)
+
+
+def _exact_top_k(vectors, queries, k):
+    distances = ((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def test_top_k_sorted_by_distance():
+    distances = np.array([[5.0, 1.0, 3.0, 0.5, 4.0]], dtype=np.float32)
+    idx, dist = FlatVectorIndex._top_k(distances, 3)
+    assert idx.tolist() == [[3, 1, 2]]
+    assert dist.tolist() == [[0.5, 1.0, 3.0]]
+
+
+def test_top_k_clamped_to_index_size():
+    idx, dist = FlatVectorIndex._top_k(np.zeros((2, 3), dtype=np.float32), 10)
+    assert idx.shape == (2, 3)
+    idx, dist = FlatVectorIndex._top_k(np.zeros((2, 3), dtype=np.float32), 0)
+    assert idx.shape == (2, 0) and dist.shape == (2, 0)
+
+
+def test_quantize_int8_roundtrip():
+    vectors = np.random.default_rng(0).normal(size=(8, 16)).astype(np.float32)
+    vectors[3] = 0.0
+    quantized, scales = quantize_int8(vectors)
+    assert quantized.dtype == np.int8
+    np.testing.assert_allclose(quantized * scales[:, None], vectors, atol=scales.max() / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_search_matches_exact_neighbours(tmp_path, dtype):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 32)).astype(np.float32)
+    queries = rng.normal(size=(5, 32)).astype(np.float32)
+    index = _build(tmp_path, vectors, dtype)
+
+    rows, distances = index.search_rows(queries, 10)
+    assert rows.tolist() == _exact_top_k(vectors, queries, 10).tolist()
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_int8_rescoring_restores_exact_order(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(300, 32)).astype(np.float32)
+    queries = rng.normal(size=(5, 32)).astype(np.float32)
+    index = _build(tmp_path, vectors, "int8", rescore=True)
+    assert index.rescoring
+
+    rows, distances = index.search_rows(queries, 5)
+    exact = ((queries[:, None, :] - vectors[rows]) ** 2).sum(axis=2)
+    np.testing.assert_allclose(distances, exact, rtol=1e-4)
+    assert rows.tolist() == _exact_top_k(vectors, queries, 5).tolist()
+
+
+def test_writer_rejects_incomplete_export(tmp_path):
+    writer = FlatIndexWriter(tmp_path / "flat", 3, dtype="float32")
+    writer.add(["a"], np.ones((1, 4)), ["doc"], [{}])
+    with pytest.raises(RuntimeError):
+        writer.finish("test")
@@ -0,0 +1,40 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.rag.lexical import reciprocal_rank_fusion
+
+
+def _doc(title, text):
+    return Document(page_content=text, metadata={"title": title})
+
+
+def test_rrf_prefers_documents_found_by_both_legs():
+    a, b, c = _doc("A", "a"), _doc("B", "b"), _doc("C", "c")
+    vector = [(a, 0.1), (b, 0.2)]
+    lexical = [(b, 12.0), (c, 8.0)]
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+    assert [doc.metadata["title"] for doc, _ in fused] == ["B", "A", "C"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_rrf_merges_same_chunk_from_different_objects():
+    fused = reciprocal_rank_fusion([[(_doc("A", "text "), 0.0)], [(_doc("A", "text"), 0.0)]], k=1)
+    assert len(fused) == 1
+    assert fused[0][1] == pytest.approx(1.0)
+
+
+def test_rrf_ignores_original_score_scale():
+    a, b = _doc("A", "a"), _doc("B", "b")
+    fused = reciprocal_rank_fusion([[(a, 1000.0), (b, 0.001)]])
+    assert [doc.metadata["title"] for doc, _ in fused] == ["A", "B"]
+
+
+def test_match_query_uses_lemmas_and_drops_stop_words():
+    pytest.importorskip("natasha")
+    pytest.importorskip("pymorphy2")
+    from app.rag.lexical import LexicalIndex
+
+    query = LexicalIndex(":memory:").build_match_query("Кто убил Хоруса?")
+    assert '"хоруса"' in query and '"хорус"*' in query
+    assert '"кто"' not in query
+    assert LexicalIndex(":memory:").build_match_query("и в 40000") is None
@@ -0,0 +1,155 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.rag import llm_router
+from app.rag.deadline import Deadline, current_deadline_var
+from app.rag.llm_router import CircuitBreaker, LLMRouter, LLMTimeoutError, LLMUnavailableError
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(llm_router, "_breakers", {})
+
+
+def backend(answer=None, delay=0.0, error=None):
+    def call(_):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return AIMessage(content=answer)
+    return RunnableLambda(call)
+
+
+def router(backends, timeout=2.0, hedge_min_delay=0.05, hedge_budget=1.0):
+    return LLMRouter("test", backends, timeout=timeout, hedge_min_delay=hedge_min_delay, hedge_budget=hedge_budget)
+
+
+def test_primary_answers():
+    r = router([("primary", backend("a")), ("secondary", backend("b"))])
+    assert r.invoke("q").content == "a"
+    assert r.stats.snapshot()["hedges"] == 0
+
+
+def test_error_fails_over_without_waiting_for_hedge():
+    r = router([("primary", backend(error=RuntimeError("down"))), ("secondary", backend("b"))], hedge_min_delay=5.0)
+    started = time.monotonic()
+    assert r.invoke("q").content == "b"
+    assert time.monotonic() - started < 1.0
+
+
+def test_slow_primary_is_hedged():
+    r = router([("primary", backend("a", delay=1.0)), ("secondary", backend("b"))])
+    assert r.invoke("q").content == "b"
+    snapshot = r.stats.snapshot()
+    assert snapshot["hedges"] == 1
+    assert snapshot["backends"]["secondary"]["hedge_wins"] == 1
+
+
+def test_hedge_budget_limits_hedging():
+    r = router([("primary", backend("a", delay=0.2)), ("secondary", backend("b"))], hedge_budget=0.0)
+    assert r.invoke("q").content == "a"
+    assert r.stats.snapshot()["hedges"] == 0
+
+
+def test_timeout_raises_and_counts_as_failure():
+    r = router([("primary", backend("a", delay=0.5))], timeout=0.1)
+    with pytest.raises(LLMTimeoutError):
+        r.invoke("q")
+    assert r.stats.snapshot()["backends"]["primary"]["timeouts"] == 1
+
+
+def test_timed_out_call_counted_once_by_breaker():
+    r = router([("primary", backend("a", delay=0.2))], timeout=0.05)
+    with pytest.raises(LLMTimeoutError):
+        r.invoke("q")
+    time.sleep(0.3)
+    # поздний успешный ответ брошенного вызова не замыкает цепь и не считается второй раз
+    breaker = llm_router.get_breaker("primary")
+    assert breaker._failures == 1
+    assert r.stats.snapshot()["backends"]["primary"]["calls"] == 1
+
+
+def test_call_finishing_after_wait_not_counted_as_timeout(monkeypatch):
+    real_wait = llm_router.wait
+
+    def late_wait(futures, timeout, return_when):
+        # вызов завершается между wait() и проверкой дедлайна
+        real_wait(futures)
+        time.sleep(max(timeout, 0) + 0.05)
+        return set(), set(futures)
+
+    monkeypatch.setattr(llm_router, "wait", late_wait)
+    r = router([("primary", backend("a", delay=0.01))], timeout=0.05)
+    with pytest.raises(LLMTimeoutError):
+        r.invoke("q")
+    assert llm_router.get_breaker("primary")._failures == 0
+    assert r.stats.snapshot()["backends"]["primary"]["timeouts"] == 0
+
+
+def test_request_deadline_caps_call_timeout():
+    r = router([("primary", backend("a", delay=0.5))], timeout=10.0)
+    token = current_deadline_var.set(Deadline(budget=0.2, reserve=0.0))
+    try:
+        started = time.monotonic()
+        with pytest.raises(LLMTimeoutError):
+            r.invoke("q")
+        assert time.monotonic() - started < 0.45
+    finally:
+        current_deadline_var.reset(token)
+
+
+def test_exhausted_deadline_skips_call():
+    calls = []
+    r = router([("primary", RunnableLambda(lambda _: calls.append(1)))])
+    token = current_deadline_var.set(Deadline(budget=5.0, reserve=10.0))
+    try:
+        with pytest.raises(LLMTimeoutError):
+            r.invoke("q")
+    finally:
+        current_deadline_var.reset(token)
+    assert calls == []
+
+
+def test_all_backends_failing_raise_unavailable():
+    r = router([("primary", backend(error=RuntimeError("a"))), ("secondary", backend(error=RuntimeError("b")))])
+    with pytest.raises(LLMUnavailableError):
+        r.invoke("q")
+
+
+def test_open_breakers_skip_backends():
+    for name in ("primary", "secondary"):
+        breaker = llm_router.get_breaker(name)
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+    r = router([("primary", backend("a")), ("secondary", backend("b"))])
+    with pytest.raises(LLMUnavailableError, match="circuit open"):
+        r.invoke("q")
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # в half_open пропускается только один пробный вызов
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=3, cooldown=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
@@ -0,0 +1,57 @@
+import pytest
+
+from app.rag import local_decomposer
+from app.rag.accounting import RequestLedger, current_ledger_var
+from app.rag.local_decomposer import LocalDecomposer, classify
+
+
+@pytest.fixture
+def entities(monkeypatch):
+    found = {"value": ["Хорус"]}
+    monkeypatch.setattr(local_decomposer, "ner_entities", lambda question: list(found["value"]))
+    return found
+
+
+def test_single_entity_question_is_simple(entities):
+    assert classify("Кто такой Хорус?") == (True, "single entity", ["Хорус"])
+
+
+@pytest.mark.parametrize("question, reason", [
+    ("", "empty"),
+    ("Кто такой Хорус? Кто такой Абаддон?", "several sentences"),
+    ("Чем Хорус отличается от Абаддона", "markers"),
+    ("Хорус, Абаддон", "markers"),
+    ("Где и когда сражался Хорус с Императором на борту Мстительного Духа", "words"),
+])
+def test_complex_questions_go_to_llm(entities, question, reason):
+    simple, why, _ = classify(question, max_words=8)
+    assert not simple
+    assert reason in why
+
+
+def test_several_entities_go_to_llm(entities):
+    entities["value"] = ["Хорус", "Абаддон"]
+    assert classify("Кто победил Хоруса Абаддона?") == (False, "2 entities", ["Хорус", "Абаддон"])
+
+
+def test_simple_question_decomposed_without_llm(entities, monkeypatch):
+    monkeypatch.setattr("app.rag.query_normalizer.split_and_extract_entities", pytest.fail)
+    decomposer = LocalDecomposer(mode="local")
+
+    parsed = decomposer.decompose(" Кто такой Хорус? ")
+    assert parsed == {"entities": ["Хорус"], "questions": [{"text": "Кто такой Хорус?"}]}
+    assert decomposer.stats()["local"] == 1
+
+
+def test_complex_question_over_budget_skips_llm(entities, monkeypatch):
+    monkeypatch.setattr("app.rag.query_normalizer.split_and_extract_entities", pytest.fail)
+    entities["value"] = ["Хорус", "Абаддон"]
+    ledger = RequestLedger(token_budget=0, call_budget=1)
+    ledger.record("answer", 1.0)
+    token = current_ledger_var.set(ledger)
+    try:
+        parsed = LocalDecomposer(mode="local").decompose("Кто победил Хоруса Абаддона?")
+    finally:
+        current_ledger_var.reset(token)
+    assert parsed == {"entities": ["Хорус", "Абаддон"], "questions": [{"text": "Кто победил Хоруса Абаддона?"}]}
+    assert ledger.downgraded == ["decomposer"]
@@ -0,0 +1,178 @@
+import os
+import asyncio
+import logging
+import secrets
+import importlib
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
+
+from aiogram import Bot, Dispatcher
+from aiogram.enums import ParseMode
+from aiogram.types import Update
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.default import DefaultBotProperties
+
+from app.config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEB_HOST, WEB_PORT, WEB_WORKERS,
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(process)d - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+
+
+def create_bot() -> Bot:
+    return Bot(
+        token=TELEGRAM_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN_V2)
+    )
+
+
+async def _init_pipeline(app: FastAPI):
+    """
+    Инициализация тяжёлой части (RAG-пайплайн, хендлеры) в фоне,
+    чтобы /health отвечал сразу, а /ready — только после загрузки.
+    """
+    try:
+        from app.bootstrap import wait_until_ready
+        await asyncio.to_thread(wait_until_ready)
+        handlers = importlib.import_module("app.handlers")
+        handlers.register_handlers(app.state.dp)
+        app.state.ready = True
+        logger.info("Worker pipeline is ready")
+    except Exception as e:
+        app.state.init_error = str(e)
+        logger.critical("Worker pipeline init failed: %s", str(e), exc_info=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Каждый воркер — отдельный процесс со своим Bot, Dispatcher и пайплайном (shared-nothing)
+    app.state.bot = create_bot()
+    app.state.dp = Dispatcher(storage=MemoryStorage())
+    app.state.ready = False
+    app.state.init_error = None
+    app.state.tasks = set()
+    init_task = asyncio.create_task(_init_pipeline(app))
+
+    yield
+
+    init_task.cancel()
+    for task in list(app.state.tasks):
+        task.cancel()
+    await app.state.bot.session.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    """Liveness: процесс жив и принимает соединения."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready(request: Request):
+    """Readiness: пайплайн загружен и воркер готов обрабатывать апдейты."""
+    state = request.app.state
+    if state.ready:
+        return {"status": "ready", "in_flight": len(state.tasks)}
+    status = "failed" if state.init_error else "starting"
+    return JSONResponse(status_code=503, content={"status": status, "error": state.init_error})
+
+
+@app.get("/stats")
+async def stats():
+    """
+    Счётчики воркера: CPU-пул, кеши результатов поиска, доля вопросов без LLM, маршрутизация LLM
+    срабатывания дедлайна запроса по стадиям и учёт вызовов и токенов LLM.
+    """
+    from app.rag.cpu_pool import cpu_pool
+    from app.rag.cache import cache_stats
+    from app.rag.local_decomposer import get_decomposer
+    from app.rag.llm_router import router_stats
+    from app.rag.llm_clients import get_client_registry
+    from app.rag.deadline import deadline_stats
+    from app.rag.accounting import get_accounting
+    return {
+        "pid": os.getpid(),
+        "cpu_pool": cpu_pool.stats(),
+        "retrieval_cache": cache_stats(),
+        "decomposer": get_decomposer().stats(),
+        "llm": router_stats(),
+        "llm_clients": get_client_registry().stats(),
+        "deadline": deadline_stats(),
+        "accounting": get_accounting().stats(),
+    }
+
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    state = request.app.state
+
+    if WEBHOOK_SECRET:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, WEBHOOK_SECRET):
+            raise HTTPException(status_code=401, detail="Invalid secret token")
+
+    if not state.ready:
+        # Telegram повторит доставку позже
+        raise HTTPException(status_code=503, detail="Worker is not ready")
+
+    update = Update.model_validate(await request.json(), context={"bot": state.bot})
+
+    # Локальная проверка: ?wait=1 дожидается обработки апдейта
+    if request.query_params.get("wait"):
+        await state.dp.feed_update(state.bot, update)
+        return {"ok": True, "update_id": update.update_id}
+
+    # Ответ RAG может занимать десятки секунд — отвечаем Telegram сразу,
+    # а апдейт обрабатываем в фоне
+    task = asyncio.create_task(state.dp.feed_update(state.bot, update))
+    state.tasks.add(task)
+    task.add_done_callback(state.tasks.discard)
+    return {"ok": True}
+
+
+async def register_webhook():
+    bot = create_bot()
+    try:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True,
+        )
+        logger.info("Webhook registered: %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+    finally:
+        await bot.session.close()
+
+
+def main():
+    # Регистрируем вебхук один раз в родительском процессе, а не в каждом воркере.
+    # Без WEBHOOK_URL сервер поднимается только для локальной отладки.
+    if WEBHOOK_URL:
+        asyncio.run(register_webhook())
+    else:
+        logger.warning("WEBHOOK_URL is not set, webhook is not registered in Telegram")
+
+    logger.info("Starting webhook server on %s:%d with %d workers", WEB_HOST, WEB_PORT, WEB_WORKERS)
+    uvicorn.run("webhook:app", host=WEB_HOST, port=WEB_PORT, workers=WEB_WORKERS)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Webhook server stopped by user")
+    except Exception as e:
+        logger.critical("Fatal error: %s", str(e), exc_info=True)